@@ -1,49 +1,100 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-import bcrypt
 import jwt
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import requests
 import json
+import logging
+import threading
+from flora_common.supabase_client import SupabaseClient
+from user_cache import UserCache
+from password_pool import PasswordHasher, PoolSaturated, persisted_rounds
+from flora_common import metrics
+from flora_common.rate_limit import RateLimiter
+from flora_common import health_check
+from flora_common.health_check import HealthChecker
+from flora_common import structured_logging
+from flora_common.structured_logging import redact, truncate
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# JSON logs written off-thread, tagged with a per-request id and sampled per path
+structured_logging.setup_logging('auth')
+structured_logging.init_app(app)
+
+# Prometheus-format GET /metrics
+metrics.init_app(app, 'auth')
+logger = logging.getLogger(__name__)
+
 # Configure CORS
 CORS(app, origins=[
     'http://localhost:3000',
     'https://*.vercel.app'
 ], supports_credentials=True)
 
-# Rate limiting
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    storage_uri="memory://"
-)
+# Token-bucket rate limiting shared by every worker (RATELIMIT_STORAGE_URI), keyed by client address
+limiter = RateLimiter.from_env('auth')
 
 # Supabase Configuration - مع تنظيف المسافات
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '').strip()  # تنظيف المسافات
 SUPABASE_KEY = os.environ.get('SUPABASE_ANON_KEY', '').strip()  # تنظيف المسافات
 JWT_SECRET = os.environ.get('JWT_SECRET', 'fallback-secret-key').strip()
 
-print("🌿 Flora Auth API Starting...")
-print(f"SUPABASE_URL: '{SUPABASE_URL}'")
-print(f"SUPABASE_URL length: {len(SUPABASE_URL)}")
-print(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+# Pooled keep-alive client shared by every Supabase call in this worker
+supabase = SupabaseClient.from_env(SUPABASE_URL, SUPABASE_KEY)
+
+# Supabase reachability, checked by one background thread per worker instead of on every probe
+def supabase_reachable(timeout):
+    response = supabase.get("rest/v1/", timeout=timeout)
+    return response.ok
+
+supabase_health = HealthChecker.from_env('supabase', supabase_reachable)
+
+# /health/live and /health/ready, answered from the cached check
+health_check.init_app(app, supabase_health)
+
+# In-process cache of user lookups keyed by normalized email. Windows are per worker: a password
+# changed elsewhere may keep working for USER_CACHE_CREDENTIAL_TTL seconds, and an account
+# registered through another worker may be reported unknown for USER_CACHE_NEGATIVE_TTL seconds
+USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true'
+user_cache = UserCache(
+    max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 60)),
+    credential_ttl=float(os.environ.get('USER_CACHE_CREDENTIAL_TTL', 10)),
+    negative_ttl=float(os.environ.get('USER_CACHE_NEGATIVE_TTL', 5))
+)
+
+logger.info("🌿 Flora Auth API Starting...")
+logger.info(f"SUPABASE_URL: '{SUPABASE_URL}' (length {len(SUPABASE_URL)})")
+logger.info(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+
+# bcrypt runs in a bounded process pool. The cost is pinned (12, bcrypt's default) so every
+# worker and restart agrees; BCRYPT_ROUNDS=auto calibrates once per host to BCRYPT_TARGET_MS
+# and stores the result in BCRYPT_ROUNDS_FILE for the other workers
+BCRYPT_ROUNDS = os.environ.get('BCRYPT_ROUNDS', '12')
+if BCRYPT_ROUNDS.lower() == 'auto':
+    BCRYPT_ROUNDS = persisted_rounds(os.environ.get('BCRYPT_ROUNDS_FILE', '/tmp/flora_auth_bcrypt_rounds'),
+                                     float(os.environ.get('BCRYPT_TARGET_MS', 250)))
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get('BCRYPT_WORKERS', 2)),
+    max_pending=int(os.environ.get('BCRYPT_MAX_PENDING', 8)),
+    rounds=int(BCRYPT_ROUNDS),
+    timeout=float(os.environ.get('BCRYPT_TIMEOUT', 10))
+)
 
 def hash_password(password):
     """Hash password"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    with metrics.stage('password_hash'):
+        return password_hasher.hash(password)
 
 def verify_password(password, hashed):
     """Verify password"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    with metrics.stage('password_verify'):
+        return password_hasher.verify(password, hashed)
 
 def create_token(user_id, email):
     """Create JWT token"""
@@ -61,7 +112,7 @@ def supabase_request(endpoint, method='GET', data=None):
     # تنظيف الـ URL من أي مسافات
     base_url = SUPABASE_URL.strip()
     if not base_url:
-        print("❌ SUPABASE_URL is empty!")
+        logger.error("❌ SUPABASE_URL is empty!")
         return None
         
     url = f"{base_url}/rest/v1/{endpoint}"
@@ -72,20 +123,20 @@ def supabase_request(endpoint, method='GET', data=None):
         'Prefer': 'return=representation'
     }
     
-    print(f"🔧 Making {method} request to: {url}")
+    logger.debug(f"{method} {url}")
     
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, timeout=10)
+            response = supabase.get(url, headers=headers)
         elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = supabase.post(url, headers=headers, json=data)
         elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
+            response = supabase.patch(url, headers=headers, json=data)
         
-        print(f"🔧 Response status: {response.status_code}")
+        logger.debug(f"Response status: {response.status_code}")
         
         if response.status_code >= 400:
-            print(f"❌ API Error {response.status_code}: {response.text}")
+            logger.error(f"❌ API Error {response.status_code}: {truncate(response.text, 500)}")
             return None
         
         # Handle empty response
@@ -95,13 +146,25 @@ def supabase_request(endpoint, method='GET', data=None):
         return response.json()
         
     except requests.exceptions.RequestException as e:
-        print(f"❌ Request error: {e}")
+        logger.error(f"❌ Request error: {e}")
         return None
 
-def get_user_by_email(email):
-    """Get user by email"""
-    endpoint = f"users?email=eq.{email}"
-    return supabase_request(endpoint)
+def get_user_by_email(email, with_credentials=False, refresh=False):
+    """Get user by email, from this worker's cache when possible.
+
+    with_credentials includes password_hash (cached for at most USER_CACHE_CREDENTIAL_TTL);
+    refresh skips the cache and reads Supabase.
+    """
+    if USER_CACHE_ENABLED and not refresh:
+        found, users = user_cache.get(email, with_credentials=with_credentials)
+        if found:
+            return users
+
+    endpoint = f"users?email=eq.{UserCache.normalize(email)}"
+    users = supabase_request(endpoint)
+    if USER_CACHE_ENABLED:
+        user_cache.set(email, users)
+    return users
 
 def create_user(email, password_hash, full_name):
     """Create new user"""
@@ -111,13 +174,62 @@ def create_user(email, password_hash, full_name):
         'password_hash': password_hash,
         'full_name': full_name
     }
-    return supabase_request(endpoint, 'POST', data)
+    result = supabase_request(endpoint, 'POST', data)
 
-def update_last_login(user_id):
+    # Replace the negative entry left by the registration existence check
+    user_cache.invalidate(email)
+    if result and USER_CACHE_ENABLED:
+        user_cache.set(email, result)
+    return result
+
+def update_last_login(user_id, email=None):
     """Update user's last login"""
     endpoint = f"users?id=eq.{user_id}"
     data = {'last_login': datetime.utcnow().isoformat()}
-    return supabase_request(endpoint, 'PATCH', data)
+    result = supabase_request(endpoint, 'PATCH', data)
+
+    # Write the returned row (hash included) through so the next login skips the lookup
+    if email:
+        user_cache.invalidate(email)
+        if result and USER_CACHE_ENABLED:
+            user_cache.set(email, result)
+    return result
+
+def update_password_hash(user_id, email, password_hash):
+    """Store a rehashed password"""
+    endpoint = f"users?id=eq.{user_id}"
+    result = supabase_request(endpoint, 'PATCH', {'password_hash': password_hash})
+
+    user_cache.invalidate(email)
+    if result and USER_CACHE_ENABLED:
+        user_cache.set(email, result)
+    return result
+
+def rehash_password_async(user, password):
+    """Upgrade a stored hash to the current cost without delaying the login response"""
+    try:
+        future = password_hasher.submit_hash(password, rehash=True)
+    except PoolSaturated:
+        return  # try again on a later login
+
+    def _store(done):
+        if done.exception() is None:
+            threading.Thread(
+                target=update_password_hash, args=(user['id'], user['email'], done.result()), daemon=True
+            ).start()
+
+    future.add_done_callback(_store)
+
+def busy_response():
+    response = jsonify({'error': 'Server busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def supabase_unavailable():
+    """503 with Retry-After while the Supabase circuit is open"""
+    response = jsonify({'error': 'Database temporarily unavailable, retry shortly'})
+    response.headers['Retry-After'] = os.environ.get('SUPABASE_BREAKER_OPEN_SECONDS', '15')
+    return response, 503
 
 # Root endpoint
 @app.route('/', methods=['GET'])
@@ -135,24 +247,20 @@ def home():
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
-    try:
-        # Test basic Supabase connection
-        test_url = f"{SUPABASE_URL.strip()}/rest/v1/"
-        headers = {'apikey': SUPABASE_KEY}
-        response = requests.get(test_url, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            db_status = 'connected'
-        else:
-            db_status = f'error: {response.status_code}'
-            
-    except Exception as e:
-        db_status = f'error: {str(e)}'
-    
+    # Served from the background check; probes should prefer /health/live and /health/ready
+    supabase_status = supabase_health.snapshot()
+    if supabase_status['status'] == 'ok':
+        db_status = 'connected'
+    elif supabase_status['status'] == 'unknown':
+        db_status = 'checking'
+    else:
+        db_status = f"error: {supabase_status['last_error']}"
+
     return jsonify({
         'status': 'healthy',
         'service': 'Flora Auth',
         'database': db_status,
+        'supabase': supabase_status,
         'supabase_url_clean': SUPABASE_URL.strip() == 'https://onnbpuqxtmdddbksfgrt.supabase.co'
     })
 
@@ -162,7 +270,7 @@ def health():
 def register():
     try:
         data = request.json
-        print(f"📥 Register request: {data}")
+        logger.debug(f"📥 Register request: {redact(data)}")
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -179,7 +287,9 @@ def register():
         
         # Check if user exists
         existing_users = get_user_by_email(email)
-        print(f"🔍 Existing users check: {existing_users}")
+        logger.debug(f"🔍 Existing users check: {redact(existing_users)}")
+        if existing_users is None and not supabase.available('rest'):
+            return supabase_unavailable()
         
         if existing_users and len(existing_users) > 0:
             return jsonify({'error': 'Email already registered'}), 400
@@ -187,7 +297,7 @@ def register():
         # Create user
         password_hash = hash_password(password)
         new_user = create_user(email, password_hash, full_name)
-        print(f"🔧 Create user result: {new_user}")
+        logger.debug(f"🔧 Create user result: {redact(new_user)}")
         
         if not new_user or len(new_user) == 0:
             return jsonify({'error': 'Failed to create user. Please check RLS policies.'}), 500
@@ -207,8 +317,10 @@ def register():
             }
         }), 201
     
+    except PoolSaturated:
+        return busy_response()
     except Exception as e:
-        print(f"❌ Registration error: {e}")
+        logger.error(f"❌ Registration error: {e}")
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
 
 # Login endpoint
@@ -226,18 +338,31 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
         
-        # Get user
-        users = get_user_by_email(email)
+        # Get user (the hash may come from this worker's cache)
+        users = get_user_by_email(email, with_credentials=True)
+        if users is None and not supabase.available('rest'):
+            # Cached users can still log in; everyone else is told to retry rather than rejected
+            return supabase_unavailable()
         if not users or len(users) == 0:
             return jsonify({'error': 'Invalid email or password'}), 401
         
         user = users[0]
         
         if not verify_password(password, user['password_hash']):
-            return jsonify({'error': 'Invalid email or password'}), 401
+            # The cached hash may predate a password change made through another worker
+            current = get_user_by_email(email, with_credentials=True, refresh=True)
+            if not current or current[0]['password_hash'] == user['password_hash']:
+                return jsonify({'error': 'Invalid email or password'}), 401
+            user = current[0]
+            if not verify_password(password, user['password_hash']):
+                return jsonify({'error': 'Invalid email or password'}), 401
+
+        # Transparently raise a weaker stored hash to the configured cost
+        if password_hasher.needs_rehash(user['password_hash']):
+            rehash_password_async(user, password)
         
         # Update last login
-        update_last_login(user['id'])
+        update_last_login(user['id'], user['email'])
         
         # Create token
         token = create_token(user['id'], user['email'])
@@ -252,10 +377,39 @@ def login():
             }
         })
     
+    except PoolSaturated:
+        return busy_response()
     except Exception as e:
-        print(f"❌ Login error: {e}")
+        logger.error(f"❌ Login error: {e}")
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
+# User lookup cache counters
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = user_cache.stats()
+    stats['enabled'] = USER_CACHE_ENABLED
+    return jsonify(stats)
+
+# bcrypt pool counters
+@app.route('/metrics/bcrypt', methods=['GET'])
+def bcrypt_metrics():
+    return jsonify(password_hasher.stats())
+
+# Supabase connection reuse metrics
+@app.route('/metrics/supabase', methods=['GET'])
+def supabase_metrics():
+    return jsonify(supabase.connection_stats())
+
+# Rate limit decisions and buckets held by the shared store
+@app.route('/metrics/ratelimit', methods=['GET'])
+def ratelimit_metrics():
+    return jsonify(limiter.stats())
+
+# Log queue depth and dropped records
+@app.route('/metrics/logging', methods=['GET'])
+def logging_metrics():
+    return jsonify(structured_logging.stats())
+
 # Test endpoint جديد
 @app.route('/test-config', methods=['GET'])
 def test_config():
@@ -270,5 +424,6 @@ def test_config():
     })
 
 if __name__ == '__main__':
+    metrics.clear_directory('auth')
     port = int(os.environ.get('PORT', 7860))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import fcntl
+import logging
+import math
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 15
+_COST_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class PoolSaturated(Exception):
+    """Raised when every bcrypt slot is busy or a job outlives the timeout; routes turn this into a 503"""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def calibrate_rounds(target_ms=250.0, probe_rounds=MIN_ROUNDS):
+    """Pick the gensalt cost whose hash time on this host is closest to ``target_ms``.
+
+    Each extra round doubles the work, so one timing at ``probe_rounds`` is
+    enough to extrapolate.
+    """
+    password = b'calibration-password'
+    bcrypt.hashpw(password, bcrypt.gensalt(4))      # warm up
+    started = time.perf_counter()
+    bcrypt.hashpw(password, bcrypt.gensalt(probe_rounds))
+    probe_ms = max((time.perf_counter() - started) * 1000, 0.001)
+
+    rounds = probe_rounds + round(math.log2(target_ms / probe_ms))
+    rounds = max(MIN_ROUNDS, min(MAX_ROUNDS, rounds))
+    logger.info(f"bcrypt calibration: {probe_ms:.1f} ms at cost {probe_rounds}, "
+                f"using cost {rounds} (~{probe_ms * 2 ** (rounds - probe_rounds):.0f} ms)")
+    return rounds
+
+
+def persisted_rounds(path, target_ms=250.0):
+    """Calibrate once per host and reuse the cost in every worker and restart.
+
+    Timing is noisy, so calibrating in each process would give workers
+    different costs. The first process to take the file lock calibrates and
+    writes the cost to ``path``; every later one reads it back.
+    """
+    with open(path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            saved = f.read().strip()
+            if saved.isdigit() and MIN_ROUNDS <= int(saved) <= MAX_ROUNDS:
+                return int(saved)
+            rounds = calibrate_rounds(target_ms)
+            f.seek(0)
+            f.truncate()
+            f.write(f"{rounds}\n")
+            return rounds
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def hash_cost(hashed):
+    """Return the cost factor encoded in a bcrypt hash, or None"""
+    match = _COST_PATTERN.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """Run bcrypt in a dedicated process pool with a bounded number of in-flight jobs.
+
+    At most ``max_pending`` hash/verify calls may be queued or running; beyond
+    that ``PoolSaturated`` is raised immediately instead of tying up request
+    threads. A call still waiting after ``timeout`` seconds raises it too.
+    ``workers=0`` runs bcrypt inline (still bounded).
+    """
+
+    def __init__(self, workers=2, max_pending=8, rounds=12, timeout=10.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.counters = {'hashes': 0, 'verifications': 0, 'rejected': 0, 'timeouts': 0, 'rehashes': 0}
+
+    @property
+    def executor(self):
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _submit(self, fn, *args):
+        """Submit to the pool, holding a slot until the job finishes"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.counters['rejected'] += 1
+            raise PoolSaturated("Password hashing is saturated, retry shortly")
+
+        try:
+            if self.executor is None:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = self.executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_hash(self, password, rehash=False):
+        with self._lock:
+            self.counters['rehashes' if rehash else 'hashes'] += 1
+        return self._submit(_hashpw, password.encode('utf-8'), self.rounds)
+
+    def _result(self, future):
+        """Wait for a job; an overloaded pool is reported as PoolSaturated, not a generic failure"""
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.counters['timeouts'] += 1
+            raise PoolSaturated(f"Password hashing took longer than {self.timeout}s, retry shortly")
+
+    def hash(self, password):
+        return self._result(self.submit_hash(password))
+
+    def verify(self, password, hashed):
+        with self._lock:
+            self.counters['verifications'] += 1
+        return self._result(self._submit(_checkpw, password.encode('utf-8'), hashed.encode('utf-8')))
+
+    def needs_rehash(self, hashed):
+        """True for hashes weaker than the configured cost; stronger ones are never lowered"""
+        cost = hash_cost(hashed)
+        return cost is not None and cost < self.rounds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats.update({'workers': self.workers, 'max_pending': self.max_pending, 'rounds': self.rounds})
+        return stats
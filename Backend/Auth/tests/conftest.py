@@ -0,0 +1,42 @@
+import pytest
+
+import stub_postgrest
+
+
+@pytest.fixture(scope='session')
+def supabase_stub():
+    server = stub_postgrest.serve(port=0)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def auth_app(supabase_stub, tmp_path_factory):
+    """The Auth app against the PostgREST stub, hashing inline at a low cost"""
+    pytest.importorskip('bcrypt')
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in {
+            'SUPABASE_URL': f"http://127.0.0.1:{supabase_stub.server_address[1]}",
+            'SUPABASE_ANON_KEY': 'test-key',
+            'JWT_SECRET': 'test-secret-with-enough-bytes-for-hs256',
+            'RATELIMIT_ENABLED': 'false',
+            'BCRYPT_ROUNDS': '4',
+            'BCRYPT_WORKERS': '0',
+            'METRICS_DIR': str(tmp_path_factory.mktemp('metrics')),
+        }.items():
+            patch.setenv(name, value)
+
+        import app
+
+        yield app
+
+
+@pytest.fixture
+def client(auth_app):
+    auth_app.user_cache.clear()
+    return auth_app.app.test_client()
+
+
+def stub_requests(server):
+    """Requests the PostgREST stub has answered so far"""
+    return server.RequestHandlerClass.state.requests
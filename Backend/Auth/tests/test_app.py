@@ -0,0 +1,55 @@
+from conftest import stub_requests
+
+
+def register(client, email, password='correct-horse'):
+    return client.post('/register', json={'email': email, 'password': password, 'full_name': 'Test'})
+
+
+def login(client, email, password='correct-horse'):
+    return client.post('/login', json={'email': email, 'password': password})
+
+
+def test_repeat_logins_skip_the_user_lookup(client, supabase_stub):
+    assert register(client, 'cached@example.com').status_code == 201
+    assert login(client, 'cached@example.com').status_code == 200
+
+    before = stub_requests(supabase_stub)
+    assert login(client, 'Cached@Example.com ').status_code == 200
+    assert stub_requests(supabase_stub) - before == 1          # only the last_login PATCH
+
+
+def test_unknown_email_is_cached_until_this_worker_registers_it(client, supabase_stub):
+    assert login(client, 'later@example.com').status_code == 401
+    before = stub_requests(supabase_stub)
+    assert login(client, 'later@example.com').status_code == 401
+    assert stub_requests(supabase_stub) == before
+
+    assert register(client, 'later@example.com').status_code == 201
+    assert login(client, 'later@example.com').status_code == 200
+
+
+def test_password_changed_elsewhere_is_picked_up_on_a_failed_verify(client, auth_app):
+    assert register(client, 'moved@example.com').status_code == 201
+    assert login(client, 'moved@example.com').status_code == 200
+
+    # Another worker changes the password; this worker still caches the old hash
+    user = auth_app.get_user_by_email('moved@example.com', with_credentials=True)[0]
+    auth_app.supabase_request(f"users?id=eq.{user['id']}", 'PATCH',
+                              {'password_hash': auth_app.hash_password('battery-staple')})
+
+    assert login(client, 'moved@example.com', 'battery-staple').status_code == 200
+    assert login(client, 'moved@example.com').status_code == 401
+
+
+def test_saturated_password_pool_returns_a_retryable_503(client, auth_app, monkeypatch):
+    from password_pool import PasswordHasher
+
+    hasher = PasswordHasher(workers=1, max_pending=4, rounds=12, timeout=0.01)
+    monkeypatch.setattr(auth_app, 'password_hasher', hasher)
+    try:
+        hasher.submit_hash('queued')
+        response = register(client, 'busy@example.com')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        hasher.executor.shutdown(cancel_futures=True)
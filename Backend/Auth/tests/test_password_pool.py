@@ -0,0 +1,50 @@
+import multiprocessing
+
+import pytest
+
+pytest.importorskip('bcrypt')
+
+import password_pool  # noqa: E402
+from password_pool import PasswordHasher, PoolSaturated, persisted_rounds  # noqa: E402
+
+
+def test_rehash_only_raises_the_cost():
+    hasher = PasswordHasher(workers=0, rounds=11)
+    assert hasher.needs_rehash('$2b$10$' + 'a' * 53)
+    assert not hasher.needs_rehash('$2b$11$' + 'a' * 53)
+    assert not hasher.needs_rehash('$2b$12$' + 'a' * 53)
+
+
+def _rounds(path, results):
+    results.put(persisted_rounds(path))
+
+
+def test_calibration_runs_once_per_host(tmp_path, monkeypatch):
+    path = str(tmp_path / 'rounds')
+    calls = []
+    monkeypatch.setattr(password_pool, 'calibrate_rounds', lambda target_ms: calls.append(target_ms) or 13)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_rounds, args=(path, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+
+    assert [results.get(timeout=5) for _ in processes] == [13] * 4
+    assert persisted_rounds(path) == 13
+    assert calls == []                  # the calibrating child wrote the file; this process only read it
+
+
+def test_full_pool_raises_pool_saturated():
+    hasher = PasswordHasher(workers=1, max_pending=2, rounds=12, timeout=0.01)
+    try:
+        hasher.submit_hash('queued')                # occupies the only worker
+        with pytest.raises(PoolSaturated):          # waits behind it past the timeout
+            hasher.verify('password', '$2b$12$' + 'a' * 53)
+        with pytest.raises(PoolSaturated):          # no slot left at all
+            hasher.hash('password')
+        assert hasher.stats()['timeouts'] == 1 and hasher.stats()['rejected'] == 1
+    finally:
+        hasher.executor.shutdown(cancel_futures=True)
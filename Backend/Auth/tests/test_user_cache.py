@@ -0,0 +1,27 @@
+import time
+
+from user_cache import UserCache
+
+
+def test_unknown_emails_are_cached_briefly():
+    cache = UserCache(negative_ttl=0.05)
+    cache.set('New@Example.com', [])
+    assert cache.get('new@example.com') == (True, [])
+    time.sleep(0.06)
+    assert cache.get('new@example.com') == (False, None)
+
+    cache.set('err@example.com', None)
+    assert cache.get('err@example.com') == (False, None)
+
+
+def test_credentials_are_served_only_within_their_ttl():
+    cache = UserCache(ttl=60, credential_ttl=0.05)
+    cache.set('a@example.com', [{'id': 1, 'email': 'a@example.com', 'password_hash': '$2b$12$x'}])
+
+    assert cache.get(' A@example.com ') == (True, [{'id': 1, 'email': 'a@example.com'}])
+    found, users = cache.get('a@example.com', with_credentials=True)
+    assert found and users[0]['password_hash'] == '$2b$12$x'
+
+    time.sleep(0.06)
+    assert cache.get('a@example.com', with_credentials=True) == (False, None)
+    assert cache.get('a@example.com') == (True, [{'id': 1, 'email': 'a@example.com'}])
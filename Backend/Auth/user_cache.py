@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Served to login only within credential_ttl of being read from Supabase
+CREDENTIAL_FIELDS = ('password_hash',)
+
+
+class UserCache:
+    """Bounded LRU cache with TTL for user lookups, keyed by normalized email.
+
+    The cache is per process and only invalidated by writes in the same
+    process, so every window below is per worker:
+
+    - profile fields may be up to ``ttl`` seconds stale;
+    - a cached password hash is handed to login for ``credential_ttl``
+      seconds, so a password changed through another worker may keep the old
+      one working for that long (the caller re-reads Supabase when a cached
+      hash fails to verify, so the new password is never rejected);
+    - unknown emails are cached as negative entries (an empty result) for
+      ``negative_ttl`` seconds, so an account registered through another
+      worker may be reported unknown here for that long.
+
+    Lookup errors (``None``) are never cached.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60.0, credential_ttl=10.0, negative_ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.credential_ttl = min(credential_ttl, ttl)
+        self.negative_ttl = min(negative_ttl, ttl)
+        self._entries = OrderedDict()       # email -> (expires_at, credentials_expire_at, users)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(email):
+        return (email or '').strip().lower()
+
+    def get(self, email, with_credentials=False):
+        """Return (found, users); users is [] for a cached unknown email.
+
+        Without ``with_credentials`` the users lack CREDENTIAL_FIELDS; with it,
+        an entry whose credentials are older than ``credential_ttl`` is a miss.
+        """
+        key = self.normalize(email)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            expires_at, credentials_expire_at, users = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            if with_credentials and credentials_expire_at <= now:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            if users:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            if with_credentials:
+                return True, [dict(user) for user in users]
+            return True, [{field: value for field, value in user.items() if field not in CREDENTIAL_FIELDS}
+                          for user in users]
+
+    def set(self, email, users):
+        """Cache a lookup result; an empty list is stored as a negative entry"""
+        if users is None or (not users and self.negative_ttl <= 0):
+            return
+        key = self.normalize(email)
+        now = time.monotonic()
+        if users:
+            entry = (now + self.ttl, now + self.credential_ttl, [dict(user) for user in users])
+        else:
+            entry = (now + self.negative_ttl, now + self.negative_ttl, [])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email):
+        with self._lock:
+            if self._entries.pop(self.normalize(email), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'credential_ttl_seconds': self.credential_ttl,
+                'negative_ttl_seconds': self.negative_ttl,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
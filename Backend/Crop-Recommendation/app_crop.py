@@ -2,11 +2,9 @@ from flask import Flask, request, jsonify
 import logging
 import sys
 import os
+import time
 from flask_cors import CORS
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import requests
-import jwt
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -16,114 +14,241 @@ load_dotenv()
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from score_crop import CropRecommendationModel
+import numpy as np
+# score_crop (pandas, joblib, xgboost, sklearn) is imported by the model loader,
+# so the app can bind and answer /health while the model loads
+from flora_common.write_behind import MemoryStatusStore, SQLiteStatusStore, WriteBehindQueue
+from flora_common.bulk_writer import BulkInsertBuffer
+from flora_common.supabase_client import SupabaseClient
+from flora_common.auth_middleware import TokenVerifier
+from flora_common.history_pages import HistoryCache, SQLiteGenerations, keyset_query, split_page
+from flora_common.model_loader import ModelLoader
+from flora_common.asgi_bridge import AsyncSupabaseClient, BackgroundLoop
+from flora_common import health_check
+from flora_common.health_check import HealthChecker
+from flora_common import process_stats
+from flora_common import metrics
+from flora_common.rate_limit import RateLimiter
+from flora_common import structured_logging
+from flora_common.structured_logging import carry_request_id, current_request_id, log_context, redact, truncate
 
 # Initialize Flask app
 app = Flask(__name__)
+
+# JSON logs written off-thread, tagged with a per-request id and sampled per path
+structured_logging.setup_logging('crop-recommendation')
+structured_logging.init_app(app)
+
+# Prometheus-format GET /metrics, merged across gunicorn workers
+metrics.init_app(app, 'crop-recommendation')
+logger = logging.getLogger(__name__)
 CORS(app)
 
-# Rate limiting
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    storage_uri="memory://"
-)
+# Token-bucket rate limiting shared by every worker (RATELIMIT_STORAGE_URI), keyed by user on
+# authenticated routes; RATELIMIT_ENABLED=false for load tests
+limiter = RateLimiter.from_env('crop-recommendation')
 
 # Supabase Configuration
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '').strip()
 SUPABASE_KEY = os.environ.get('SUPABASE_ANON_KEY', '').strip()
 JWT_SECRET = os.environ.get('JWT_SECRET', 'fallback-secret-key').strip()
 
-print("🌾 Crop Recommendation API Starting...")
-print(f"SUPABASE_URL: {SUPABASE_URL}")
-print(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+# Verified tokens are cached until their exp, so each signature is checked once per worker
+token_verifier = TokenVerifier(
+    JWT_SECRET,
+    max_entries=int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10000)),
+    max_ttl=float(os.environ.get('TOKEN_CACHE_MAX_TTL', 300)),
+    enabled=os.environ.get('TOKEN_CACHE_ENABLED', 'true').lower() == 'true'
+)
+require_auth = token_verifier.require_auth
 
-# Initialize crop model
-crop_model = CropRecommendationModel()
-init_success = crop_model.init()
+# Pooled keep-alive client shared by every Supabase call in this worker
+supabase = SupabaseClient.from_env(SUPABASE_URL, SUPABASE_KEY)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Supabase reachability, checked by one background thread per worker instead of on every probe
+def supabase_reachable(timeout):
+    response = supabase.get("rest/v1/crop_recommendations?select=id&limit=1", timeout=timeout)
+    return response.ok
+
+supabase_health = HealthChecker.from_env('supabase', supabase_reachable)
+
+# SERVE_MODE=asgi (asgi.py) also moves Supabase inserts and reads onto an event loop: unbuffered
+# write-behind inserts run there outright, and request handlers wait on it for their own calls
+SERVE_MODE = os.environ.get('SERVE_MODE', 'wsgi').lower()
+io_loop = None
+async_supabase = None
+if os.environ.get('SUPABASE_ASYNC_IO', 'true' if SERVE_MODE == 'asgi' else 'false').lower() == 'true':
+    import httpx
+
+    io_loop = BackgroundLoop('crop-supabase-io')
+    async_supabase = AsyncSupabaseClient(supabase)
+
+logger.info("🌾 Crop Recommendation API Starting...")
+logger.info(f"SUPABASE_URL: {SUPABASE_URL}")
+logger.info(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+
+# /recommend/batch limits
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 5000))
+
+# /history pages: keyset pagination plus a short per-user cache, dropped when the user saves a recommendation.
+# The user's generation lives in HISTORY_GENERATIONS_DB so a save through any worker on the host
+# invalidates every worker's pages; set it empty only when running a single worker
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 100))
+HISTORY_COLUMNS = ['id', 'created_at', 'nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity',
+                   'ph_level', 'rainfall', 'recommended_crop', 'suitability_level', 'match_percentage']
+HISTORY_GENERATIONS_DB = os.environ.get('HISTORY_GENERATIONS_DB', '/tmp/crop_recommendations_history.db')
+history_cache = None
+if os.environ.get('HISTORY_CACHE_ENABLED', 'true').lower() == 'true':
+    history_cache = HistoryCache(
+        max_entries=int(os.environ.get('HISTORY_CACHE_MAX_ENTRIES', 5000)),
+        ttl=float(os.environ.get('HISTORY_CACHE_TTL', 30)),
+        generations=SQLiteGenerations(HISTORY_GENERATIONS_DB) if HISTORY_GENERATIONS_DB else None
+    )
+
+def history_saved(user_id, outcome):
+    """Pass a save outcome (bool or insert Future) through, invalidating the user's history on success"""
+    if history_cache is not None:
+        history_cache.invalidate_when_saved(user_id, outcome)
+    return outcome
+
+# Set once the model is loaded; routes check model_loader.ready first
+crop_model = None
+
+def load_model():
+    """Import the scoring stack and initialize the crop model"""
+    started = time.time()
+    from score_crop import CropRecommendationModel
+
+    process_stats.record_phase('model_import', started)
+    loaded = CropRecommendationModel()
+    if not loaded.init():
+        return None
+    process_stats.record_phase('model_load', started)
+    return loaded
+
+def setup_inference(loaded):
+    global crop_model
+    crop_model = loaded
+
+# MODEL_LOAD_MODE=background (default) binds first and loads on a thread;
+# gunicorn.conf.py switches to sync when preloading in the master
+model_loader = ModelLoader(load_model, name='crop-model')
+
+# /health/live and /health/ready; readiness waits for the model, never for a live Supabase call
+health_check.init_app(app, supabase_health, is_ready=lambda: model_loader.ready,
+                      details=lambda: {"model": model_loader.status()})
+model_loader.when_ready(setup_inference)
+model_loader.start(background=os.environ.get('MODEL_LOAD_MODE', 'background').lower() == 'background')
+process_stats.record_phase('app_import', process_stats.process_start_time())
+
+def model_unavailable():
+    """503 with Retry-After while the model loads, 500 if loading failed"""
+    if model_loader.state == 'failed':
+        return jsonify({"error": "Crop model not initialized"}), 500
+    response = jsonify({"error": "Crop model is loading, retry shortly", "model": model_loader.status()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def supabase_unavailable():
+    """503 with Retry-After while the Supabase circuit is open"""
+    response = jsonify({"error": "Database temporarily unavailable, retry shortly"})
+    response.headers['Retry-After'] = os.environ.get('SUPABASE_BREAKER_OPEN_SECONDS', '15')
+    return response, 503
+
+# Reported instead of a save while the Supabase circuit is open: the response is inference-only
+PERSISTENCE_SKIPPED = {'status': 'skipped', 'reason': 'Database temporarily unavailable'}
 
 # Supabase Helper Functions
+REST_HEADERS = {
+    'apikey': SUPABASE_KEY,
+    'Authorization': f'Bearer {SUPABASE_KEY}',
+    'Content-Type': 'application/json',
+    'Prefer': 'return=representation'
+}
+
 def supabase_request(endpoint, method='GET', data=None):
     """Make request to Supabase REST API"""
+    if io_loop is not None:
+        return io_loop.run(supabase_request_async(endpoint, method, data))
+
     url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
     
-    logger.info(f"Making {method} request to: {url}")
+    logger.debug(f"{method} {url}")
     if data:
-        logger.info(f" Request data: {data}")
+        logger.debug(f"Request data: {redact(data)}")
     
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, timeout=10)
+            response = supabase.get(url, headers=REST_HEADERS)
         elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = supabase.post(url, headers=REST_HEADERS, json=data)
         elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
+            response = supabase.patch(url, headers=REST_HEADERS, json=data)
         
-        logger.info(f"Response status: {response.status_code}")
-        logger.info(f"Response headers: {dict(response.headers)}")
-        
-        if response.status_code >= 400:
-            logger.error(f"❌ API Error {response.status_code}: {response.text}")
-            return None
-        
-        # Handle empty response
-        if response.status_code == 204 or not response.text.strip():
-            logger.info("Empty response (204 No Content)")
-            return []
-            
-        result = response.json()
-        logger.info(f"Response data: {result}")
-        return result
+        return rest_result(response)
         
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Request error: {e}")
         return None
 
-
-def verify_token(token):
-    """Verify JWT token"""
+async def supabase_request_async(endpoint, method='GET', data=None):
+    """supabase_request over the async client"""
+    logger.debug(f"{method} rest/v1/{endpoint}")
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload
-    except:
+        response = await async_supabase.request(method, f"rest/v1/{endpoint}", headers=REST_HEADERS,
+                                                json=data)
+        return rest_result(response)
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+        logger.error(f"❌ Request error: {e}")
+        return None
+
+def rest_result(response):
+    """Decoded body of a PostgREST response, [] when empty, None on an error status"""
+    logger.debug(f"Response status: {response.status_code}")
+
+    if response.status_code >= 400:
+        logger.error(f"❌ API Error {response.status_code}: {truncate(response.text, 500)}")
         return None
 
+    # Handle empty response
+    if response.status_code == 204 or not response.text.strip():
+        return []
+
+    result = response.json()
+    logger.debug(f"Response data: {redact(result)}")
+    return result
+
+
+def build_crop_recommendation_row(user_id, input_data, result):
+    """Build a crop_recommendations row"""
+    return {
+        'user_id': user_id,
+        'nitrogen': input_data['nitrogen'],
+        'phosphorus': input_data['phosphorus'],
+        'potassium': input_data['potassium'],
+        'temperature': input_data['temperature'],
+        'humidity': input_data['humidity'],
+        'ph_level': input_data['ph'],
+        'rainfall': input_data['rainfall'],
+        'recommended_crop': result['crop'],
+        'suitability_level': result['suitability'],
+        'match_percentage': result['confidence'] * 100,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
 def save_crop_recommendation(user_id, input_data, result):
     """Save crop recommendation to Supabase"""
     try:
         endpoint = "crop_recommendations"
-        data = {
-            'user_id': user_id,
-            'nitrogen': input_data['nitrogen'],
-            'phosphorus': input_data['phosphorus'],
-            'potassium': input_data['potassium'],
-            'temperature': input_data['temperature'],
-            'humidity': input_data['humidity'],
-            'ph_level': input_data['ph'],
-            'rainfall': input_data['rainfall'],
-            'recommended_crop': result['crop'],
-            'suitability_level': result['suitability'],
-            'match_percentage': result['confidence'] * 100,
-            'created_at': datetime.utcnow().isoformat()
-        }
+        data = build_crop_recommendation_row(user_id, input_data, result)
         
-        logger.info(f" Attempting to save crop recommendation for user {user_id}")
-        logger.info(f" Data to save: {data}")
+        logger.debug(f"Saving crop recommendation for user {user_id}: {redact(data)}")
         
         response = supabase_request(endpoint, 'POST', data)
         
         if response:
-            logger.info(f"Successfully saved crop recommendation: {response}")
+            logger.info(f"Saved crop recommendation for user {user_id}")
             return True
         else:
             logger.error("❌ Failed to save crop recommendation - API returned None")
@@ -133,57 +258,96 @@ def save_crop_recommendation(user_id, input_data, result):
         logger.error(f"❌ Error saving crop recommendation: {e}")
         return False
 
-def require_auth(f):
-    """Decorator to protect routes with JWT authentication"""
-    from functools import wraps
-    
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header:
-            return jsonify({'error': 'No authorization token provided'}), 401
-        
-        try:
-            token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
-            payload = verify_token(token)
-            
-            if not payload:
-                return jsonify({'error': 'Invalid or expired token'}), 401
-            
-            request.user_id = payload['user_id']
-            request.user_email = payload['email']
-            
-        except Exception as e:
-            return jsonify({'error': 'Invalid authorization header'}), 401
-        
-        return f(*args, **kwargs)
-    
-    return decorated_function
+def save_crop_recommendations_bulk(rows):
+    """Save many crop recommendations with a single PostgREST insert"""
+    if not rows:
+        return True
+
+    try:
+        logger.info(f"Attempting bulk save of {len(rows)} crop recommendations")
+        response = supabase_request("crop_recommendations", 'POST', rows)
+
+        if response:
+            logger.info(f"Successfully saved {len(response)} crop recommendations")
+            return True
+        else:
+            logger.error("❌ Failed to bulk save crop recommendations - API returned None")
+            return False
+
+    except Exception as e:
+        logger.error(f"❌ Error bulk saving crop recommendations: {e}")
+        return False
+
+def persist_crop_recommendation(payload):
+    """Write-behind job: insert one crop recommendation row"""
+    if bulk_buffer is None and io_loop is not None:
+        return io_loop.submit(insert_crop_recommendation_async(payload))
+    if bulk_buffer is None:
+        return history_saved(payload['user_id'], save_crop_recommendation(
+            payload['user_id'], payload['input_data'], payload['result']
+        ))
+
+    # Build the row once so retries insert identical data
+    if 'row' not in payload:
+        payload['row'] = build_crop_recommendation_row(payload['user_id'], payload['input_data'], payload['result'])
+    return history_saved(payload['user_id'], bulk_buffer.add('crop_recommendations', payload['row']))
+
+async def insert_crop_recommendation_async(payload):
+    """Unbuffered write-behind insert over the async client, so it holds no thread"""
+    with log_context(payload.get('request_id')):
+        if 'row' not in payload:
+            payload['row'] = build_crop_recommendation_row(payload['user_id'], payload['input_data'], payload['result'])
+        response = await async_supabase.post("rest/v1/crop_recommendations", json=payload['row'])
+        if response.status_code >= 400:
+            raise RuntimeError(f"Insert failed: {response.status_code} - {truncate(response.text, 500)}")
+        return history_saved(payload['user_id'], True)
+
+# Coalesce background inserts into JSON-array POSTs on size or time thresholds
+BULK_INSERT_ENABLED = os.environ.get('BULK_INSERT_ENABLED', 'true').lower() == 'true'
+bulk_buffer = None
+if BULK_INSERT_ENABLED:
+    bulk_buffer = BulkInsertBuffer(
+        supabase,
+        max_rows=int(os.environ.get('BULK_INSERT_MAX_ROWS', 100)),
+        max_delay=float(os.environ.get('BULK_INSERT_MAX_DELAY', 1.0)),
+        name='crop-bulk-writer'
+    )
+
+# Write-behind persistence: respond after inference, write to Supabase in the background
+ASYNC_PERSISTENCE = os.environ.get('ASYNC_PERSISTENCE', 'true').lower() == 'true'
+# Job statuses for /persistence/<job_id>, in a file every worker on the host shares;
+# set it empty to keep them in the worker that queued the job
+WRITE_BEHIND_STATUS_DB = os.environ.get('WRITE_BEHIND_STATUS_DB', '/tmp/crop_recommendations_status.db')
+persistence_queue = None
+if ASYNC_PERSISTENCE:
+    persistence_queue = WriteBehindQueue(
+        {'crop_recommendation': carry_request_id(persist_crop_recommendation)},
+        name='crop-write-behind',
+        max_size=int(os.environ.get('WRITE_BEHIND_MAX_SIZE', 1000)),
+        max_attempts=int(os.environ.get('WRITE_BEHIND_MAX_ATTEMPTS', 5)),
+        spill_path=os.environ.get('WRITE_BEHIND_SPILL_PATH', '/tmp/crop_recommendations_spill.jsonl'),
+        status_store=SQLiteStatusStore(WRITE_BEHIND_STATUS_DB) if WRITE_BEHIND_STATUS_DB else MemoryStatusStore()
+    )
 
 @app.route('/')
 def home():
     return jsonify({
         "message": "Crop Recommendation API 🌾",
         "status": "running",
-        "model_loaded": init_success,
+        "model_loaded": model_loader.ready,
         "supabase_connected": bool(SUPABASE_URL and SUPABASE_KEY)
     })
 
 @app.route('/health', methods=['GET'])
-def health_check():
-    # Test Supabase connection
-    supabase_status = False
-    try:
-        test_response = supabase_request("crop_recommendations?select=count&limit=1")
-        supabase_status = test_response is not None
-    except:
-        pass
-    
+def health():
+    # Served from the background check; probes should prefer /health/live and /health/ready
+    supabase_status = supabase_health.snapshot()
     return jsonify({
         "status": "healthy",
-        "model_initialized": init_success,
-        "supabase_connected": supabase_status
+        "model_initialized": model_loader.ready,
+        "model": model_loader.status(),
+        "supabase_connected": supabase_status['status'] == 'ok',
+        "supabase": supabase_status
     })
 
 @app.route('/recommend', methods=['POST'])
@@ -191,8 +355,8 @@ def health_check():
 @limiter.limit("30 per hour")
 def recommend_crop():
     try:
-        if not init_success:
-            return jsonify({"error": "Crop model not initialized"}), 500
+        if not model_loader.ready:
+            return model_unavailable()
         
         # Get JSON data from request
         data = request.get_json()
@@ -232,10 +396,33 @@ def recommend_crop():
         logger.info(f"Received input from user {request.user_id}: {input_data}")
         
         # Get prediction
-        result = crop_model.run(input_data)
+        result = crop_model.run(input_data, top_k=requested_top_k())
         
+        if persistence_queue is not None:
+            # Hand the insert to the background queue and respond now
+            job_id = persistence_queue.submit('crop_recommendation', {
+                'request_id': current_request_id(),
+                'user_id': request.user_id,
+                'input_data': input_data,
+                'result': {key: result[key] for key in ('crop', 'confidence', 'suitability')}
+            }, owner=request.user_id)
+            result['saved_to_database'] = False
+            result['persistence'] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/persistence/{job_id}"
+            }
+            logger.info(f"Prediction for user {request.user_id}: {result['crop']} ({result['suitability']})")
+            return jsonify(result)
+
+        if not supabase.available('rest'):
+            result['saved_to_database'] = False
+            result['persistence'] = dict(PERSISTENCE_SKIPPED)
+            logger.info(f"Prediction for user {request.user_id}: {result['crop']} ({result['suitability']})")
+            return jsonify(result)
+
         # Save to Supabase
-        save_result = save_crop_recommendation(request.user_id, input_data, result)
+        save_result = history_saved(request.user_id, save_crop_recommendation(request.user_id, input_data, result))
         
         if save_result:
             logger.info(f" Crop recommendation saved to Supabase for user {request.user_id}")
@@ -255,27 +442,225 @@ def recommend_crop():
         logger.error(f"Prediction error: {str(e)}")
         return jsonify({"error": f"Prediction failed: {str(e)}"}), 500
 
+def requested_top_k():
+    """Optional ?top_k= ranking depth; the model clamps it to the number of crops"""
+    top_k = request.args.get('top_k')
+    return int(top_k) if top_k else None
+
+class BatchInputError(ValueError):
+    """A /recommend/batch body that is not a list of input objects"""
+
+def parse_batch_inputs():
+    """Read batch rows from a CSV upload or a JSON array into an (N, 7) matrix"""
+    # Already imported by the model loader
+    from score_crop import CropRecommendationModel, INPUT_FIELDS
+
+    if 'file' in request.files:
+        import pandas as pd
+
+        frame = pd.read_csv(request.files['file'])
+        frame.columns = [str(column).strip().lower() for column in frame.columns]
+        missing = [field for field in INPUT_FIELDS if field not in frame.columns]
+        if missing:
+            raise KeyError(', '.join(missing))
+        return frame[INPUT_FIELDS].to_numpy(dtype=np.float64)
+
+    data = request.get_json(silent=True)
+    rows = data.get('rows') if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise BatchInputError("Expected a JSON array of rows or {\"rows\": [...]}")
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise BatchInputError(f"row {index}: expected an object with {', '.join(INPUT_FIELDS)}")
+        missing = [field for field in INPUT_FIELDS if field not in row]
+        if missing:
+            raise KeyError(f"row {index}: {', '.join(missing)}")
+    try:
+        return CropRecommendationModel.rows_to_matrix(rows)
+    except (TypeError, ValueError):
+        raise BatchInputError("All parameters must be numeric")
+
+@app.route('/recommend/batch', methods=['POST'])
+@require_auth
+@limiter.limit("10 per hour")
+def recommend_crop_batch():
+    """Recommend crops for many sample points (JSON array or CSV upload)"""
+    try:
+        if not model_loader.ready:
+            return model_unavailable()
+
+        # Already imported by the model loader
+        from score_crop import INPUT_FIELDS
+
+        try:
+            inputs = parse_batch_inputs()
+        except KeyError as e:
+            return jsonify({"error": f"Missing parameter: {e.args[0]}"}), 400
+        except BatchInputError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if len(inputs) == 0:
+            return jsonify({"error": "No rows provided"}), 400
+
+        if len(inputs) > BATCH_MAX_ROWS:
+            return jsonify({"error": f"Too many rows. Maximum is {BATCH_MAX_ROWS} per batch"}), 400
+
+        # Validate ranges for every row at once
+        humidity = inputs[:, INPUT_FIELDS.index('humidity')]
+        ph = inputs[:, INPUT_FIELDS.index('ph')]
+        checks = [
+            (np.isfinite(inputs).all(axis=1), "All parameters must be numeric"),
+            ((humidity >= 0) & (humidity <= 100), "Humidity must be between 0 and 100"),
+            ((ph >= 0) & (ph <= 14), "pH must be between 0 and 14")
+        ]
+        errors = {}
+        for passed, message in checks:
+            for index in np.flatnonzero(~passed).tolist():
+                errors.setdefault(index, message)
+        valid = np.flatnonzero(np.logical_and.reduce([passed for passed, _ in checks]))
+
+        logger.info(f"Received batch of {len(inputs)} rows from user {request.user_id} ({len(valid)} valid)")
+
+        predictions = crop_model.run_batch(inputs[valid], top_k=requested_top_k())
+
+        save = request.args.get('save', 'true').lower() == 'true'
+        persist = supabase.available('rest')
+        results = [None] * len(inputs)
+        rows = []
+        for index, message in errors.items():
+            results[index] = {"index": index, "error": message}
+        for index, result in zip(valid.tolist(), predictions):
+            input_data = dict(zip(INPUT_FIELDS, inputs[index].tolist()))
+            result['index'] = index
+            result['input_summary'] = input_data
+            results[index] = result
+            if save:
+                rows.append(build_crop_recommendation_row(request.user_id, input_data, result))
+
+        # One insert for the whole batch
+        saved = history_saved(request.user_id, save_crop_recommendations_bulk(rows)) if save and persist else False
+
+        response = {
+            "success": True,
+            "count": len(results),
+            "valid_count": len(valid),
+            "saved_to_database": saved,
+            "results": results
+        }
+        if save and not persist:
+            response["persistence"] = dict(PERSISTENCE_SKIPPED)
+        return jsonify(response)
+
+    except ValueError as e:
+        logger.error(f"Value error: {str(e)}")
+        return jsonify({"error": f"Invalid parameter type: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}")
+        return jsonify({"error": f"Batch prediction failed: {str(e)}"}), 500
+
+@app.route('/persistence/<job_id>', methods=['GET'])
+@require_auth
+def get_persistence_status(job_id):
+    """Follow-up status of a background write queued by /recommend.
+
+    Statuses are shared by the workers of one host (WRITE_BEHIND_STATUS_DB) and
+    kept for a day; behind a load balancer spanning hosts, poll with the same
+    session affinity as the original request.
+    """
+    status = persistence_queue.status(job_id) if persistence_queue is not None else None
+
+    if status is None or status.get('owner') != request.user_id:
+        return jsonify({"error": "Unknown persistence job", "status": "unknown"}), 404
+
+    status.pop('owner', None)
+    status['saved_to_database'] = status['status'] == 'done'
+    return jsonify(status)
+
 @app.route('/history', methods=['GET'])
 @require_auth
 def get_recommendation_history():
-    """Get user's crop recommendation history"""
+    """Get user's crop recommendation history, newest first, one cursor page at a time"""
     try:
-        endpoint = f"crop_recommendations?user_id=eq.{request.user_id}&order=created_at.desc&limit=20"
+        cursor = request.args.get('cursor') or None
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+            endpoint = keyset_query('crop_recommendations', request.user_id, HISTORY_COLUMNS, limit, cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Read the generation before fetching, so a save that lands meanwhile is not hidden by this page
+        generation = history_cache.generation(request.user_id) if history_cache is not None else None
+        page = history_cache.get(request.user_id, generation, cursor, limit) if generation is not None else None
+        if page is not None:
+            return jsonify(dict(page, cached=True))
+
         history = supabase_request(endpoint)
         
         if history is None:
+            if not supabase.available('rest'):
+                return supabase_unavailable()
             return jsonify({"error": "Failed to fetch history"}), 500
+
+        history, next_cursor = split_page(history, limit)
         
-        return jsonify({
+        page = {
             "success": True,
             "history": history,
-            "count": len(history)
-        })
+            "count": len(history),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }
+        if generation is not None:
+            history_cache.set(request.user_id, generation, cursor, limit, page)
+        return jsonify(dict(page, cached=False))
         
     except Exception as e:
         logger.error(f"Error fetching history: {e}")
         return jsonify({"error": "Failed to fetch recommendation history"}), 500
 
+@app.route('/metrics/persistence', methods=['GET'])
+def persistence_metrics():
+    """Write-behind queue and bulk insert buffer counters for this worker"""
+    return jsonify({
+        "write_behind": persistence_queue.stats() if persistence_queue is not None else None,
+        "bulk_insert": bulk_buffer.stats() if bulk_buffer is not None else None
+    })
+
+@app.route('/metrics/history', methods=['GET'])
+def history_metrics():
+    """History page cache counters for this worker"""
+    if history_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(history_cache.stats(), enabled=True))
+
+@app.route('/metrics/ratelimit', methods=['GET'])
+def ratelimit_metrics():
+    """Rate limit decisions in this worker and buckets held by the shared store"""
+    return jsonify(limiter.stats())
+
+@app.route('/metrics/logging', methods=['GET'])
+def logging_metrics():
+    """Log records waiting for the writer thread and records dropped because the queue was full"""
+    return jsonify(structured_logging.stats())
+
+@app.route('/metrics/auth', methods=['GET'])
+def auth_metrics():
+    """Verified-token cache hit ratio and signature verification time"""
+    return jsonify(token_verifier.stats())
+
+@app.route('/metrics/supabase', methods=['GET'])
+def supabase_metrics():
+    """Supabase connection reuse metrics for this worker"""
+    return jsonify(supabase.connection_stats())
+
+@app.route('/metrics/process', methods=['GET'])
+def process_metrics():
+    """Start-up time and RSS/PSS of this worker and its siblings"""
+    stats = process_stats.snapshot()
+    stats["model"] = model_loader.status()
+    return jsonify(stats)
+
 @app.route('/test-supabase', methods=['GET'])
 def test_supabase():
     """Test Supabase connection"""
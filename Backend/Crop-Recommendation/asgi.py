@@ -0,0 +1,20 @@
+"""ASGI entry point for the Crop Recommendation API.
+
+    SERVE_MODE=asgi gunicorn --config gunicorn.conf.py
+
+runs this module under uvicorn workers; see flora_common.asgi_bridge. Routes and
+responses are those of app_crop.py.
+"""
+import os
+
+os.environ.setdefault('SERVE_MODE', 'asgi')
+
+from app_crop import app  # noqa: E402
+from flora_common.asgi_bridge import asgi_app  # noqa: E402
+
+# Handler threads per worker; each runs one Flask request (XGBoost inference)
+application = asgi_app(
+    app,
+    threads=int(os.environ.get('ASGI_THREADS', 16)),
+    max_body=app.config.get('MAX_CONTENT_LENGTH')
+)
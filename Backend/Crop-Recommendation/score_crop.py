@@ -1,33 +1,57 @@
-import warnings
-warnings.filterwarnings('ignore')
-
 import json
 import logging
+import os
 import pandas as pd
 import numpy as np
 import joblib
 
+from flora_common import metrics
+
 logger = logging.getLogger(__name__)
 
+# Raw soil/climate inputs, in the column order used by batch matrices
+INPUT_FIELDS = ['nitrogen', 'phosphorus', 'potassium', 'temperature', 'humidity', 'ph', 'rainfall']
+
 class CropRecommendationModel:
     def __init__(self):
         self.model = None
         self.scaler = None
         self.label_encoder = None
         self.feature_columns = None
+
+        # Plain label array built from label_encoder.classes_ at init(), and the default ranking depth
+        self.labels = None
+        self.warm = False
+        self.top_k = int(os.environ.get('CROP_TOP_K', 3))
+
+        # Pandas-free fast path state, precomputed at init()
+        self.booster = None
+        self.scaler_mean = None
+        self.scaler_scale = None
+        self.iteration_range = None
+        self.fast_path_enabled = False
+        # Parity with the DataFrame path is checked by tests/test_score_crop.py
+        self.fast_path_requested = os.environ.get('CROP_FAST_PATH', 'true').lower() == 'true'
         
     def init(self):
         try:
             # Load model and preprocessing objects
-            self.model = joblib.load('best_model_XGBoost.pkl')
-            self.scaler = joblib.load('scaler.pkl')
-            self.label_encoder = joblib.load('label_encoder.pkl')
+            # mmap_mode maps the pickled numpy arrays instead of copying them
+            self.model = joblib.load('best_model_XGBoost.pkl', mmap_mode='r')
+            self.scaler = joblib.load('scaler.pkl', mmap_mode='r')
+            self.label_encoder = joblib.load('label_encoder.pkl', mmap_mode='r')
             self.feature_columns = joblib.load('feature_names.pkl')
             
             logger.info("✅ Crop model initialized successfully")
             logger.info(f"✅ Model type: {type(self.model).__name__}")
             logger.info(f"✅ Feature columns: {len(self.feature_columns)}")
             logger.info(f"✅ Classes: {len(self.label_encoder.classes_)}")
+
+            # Index -> crop name without a per-request inverse_transform
+            self.labels = np.array(self.label_encoder.classes_).tolist()
+            self.top_k = max(1, min(self.top_k, len(self.labels)))
+
+            self._prepare_fast_path()
             
             return True
             
@@ -35,53 +59,149 @@ class CropRecommendationModel:
             logger.error(f"❌ Error in crop model initialization: {str(e)}")
             return False
     
+    def _prepare_fast_path(self):
+        """Precompute scaler vectors and the booster handle for single-row predictions"""
+        try:
+            n_features = len(self.feature_columns)
+            self.scaler_mean = np.zeros(n_features, dtype=np.float32)
+            self.scaler_scale = np.ones(n_features, dtype=np.float32)
+            if getattr(self.scaler, 'mean_', None) is not None:
+                self.scaler_mean[:] = self.scaler.mean_
+            if getattr(self.scaler, 'scale_', None) is not None:
+                self.scaler_scale[:] = self.scaler.scale_
+
+            self.booster = self.model.get_booster()
+            try:
+                self.iteration_range = (0, self.model.best_iteration + 1)
+            except AttributeError:
+                self.iteration_range = (0, 0)
+
+            self.fast_path_enabled = self.fast_path_requested
+            logger.info(f"✅ Fast prediction path enabled: {self.fast_path_enabled}")
+
+        except Exception as e:
+            logger.warning(f"⚠️ Fast prediction path unavailable, using DataFrame path: {str(e)}")
+            self.fast_path_enabled = False
+
+    def set_num_threads(self, threads):
+        """XGBoost threads for this process; call after fork when the model was preloaded"""
+        self.model.set_params(n_jobs=threads)
+        if self.booster is not None:
+            self.booster.set_param({'nthread': threads})
+
+    def _engineer_single(self, input_data):
+        """Create engineered features for one input dict"""
+        return {
+            'temp_rain': input_data['temperature'] * input_data['rainfall'],
+            'ph_rain': input_data['ph'] * input_data['rainfall'],
+            'K': input_data['potassium'],
+            'rainfall': input_data['rainfall'],
+            'N': input_data['nitrogen'],
+            'P': input_data['phosphorus'],
+            'NPK_Avg_Soil_Fertility': (input_data['nitrogen'] + input_data['phosphorus'] + input_data['potassium']) / 3,
+            'humidity': input_data['humidity'],
+            'NP_Ratio': input_data['nitrogen'] / input_data['phosphorus'] if input_data['phosphorus'] != 0 else 0,
+            'THI': (input_data['temperature'] * input_data['humidity']) / 100
+        }
+
     def preprocess_input(self, input_data):
         """Preprocess input data to match training format"""
         try:
             # Create engineered features 
-            processed_data = {
-                'temp_rain': input_data['temperature'] * input_data['rainfall'],
-                'ph_rain': input_data['ph'] * input_data['rainfall'],
-                'K': input_data['potassium'],
-                'rainfall': input_data['rainfall'],
-                'N': input_data['nitrogen'],
-                'P': input_data['phosphorus'],
-                'NPK_Avg_Soil_Fertility': (input_data['nitrogen'] + input_data['phosphorus'] + input_data['potassium']) / 3,
-                'humidity': input_data['humidity'],
-                'NP_Ratio': input_data['nitrogen'] / input_data['phosphorus'] if input_data['phosphorus'] != 0 else 0,
-                'THI': (input_data['temperature'] * input_data['humidity']) / 100
-            }
-            
-            # Create DataFrame with correct column order
-            input_df = pd.DataFrame([processed_data], columns=self.feature_columns)
+            with metrics.stage('feature_engineering'):
+                processed_data = self._engineer_single(input_data)
             
-            # Scale the features
-            scaled_features = self.scaler.transform(input_df)
+            with metrics.stage('scaling'):
+                # Create DataFrame with correct column order
+                input_df = pd.DataFrame([processed_data], columns=self.feature_columns)
+                
+                # Scale the features
+                scaled_features = self.scaler.transform(input_df)
             
             return scaled_features, processed_data
             
         except Exception as e:
             logger.error(f"Error in input preprocessing: {str(e)}")
             raise
-    
-    def run(self, input_data):
+
+    def predict_proba_fast(self, processed_data):
+        """Standardize one engineered row in place and score it on the booster, no DataFrame"""
+        with metrics.stage('scaling'):
+            row = np.array([[processed_data[name] for name in self.feature_columns]], dtype=np.float32)
+            row -= self.scaler_mean
+            row /= self.scaler_scale
+
+        with metrics.stage('predict_proba'):
+            margins = self.booster.inplace_predict(
+                row, iteration_range=self.iteration_range, predict_type="margin"
+            )
+            margins = np.asarray(margins, dtype=np.float64).reshape(-1)
+
+            # Softmax over the class margins, as XGBClassifier.predict_proba does
+            exp = np.exp(margins - margins.max())
+            return exp / exp.sum()
+
+    def _mark_warm(self):
+        if not self.warm:
+            self.warm = True
+            metrics.MODEL_WARM.set(1, model='crop-model')
+
+    @staticmethod
+    def top_k_indices(prediction_proba, k):
+        """Column indices of the k largest probabilities per row, best first"""
+        prediction_proba = np.atleast_2d(prediction_proba)
+        k = max(1, min(int(k), prediction_proba.shape[1]))
+        if k < prediction_proba.shape[1]:
+            # O(classes) partition, then sort only the k survivors
+            candidates = np.argpartition(-prediction_proba, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), prediction_proba.shape)
+        order = np.argsort(-np.take_along_axis(prediction_proba, candidates, axis=1), axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def rank(self, prediction_proba, k=None):
+        """Top-k [(crop, confidence), ...] per row of a probability matrix"""
+        prediction_proba = np.atleast_2d(prediction_proba)
+        indices = self.top_k_indices(prediction_proba, k or self.top_k)
+        confidences = np.take_along_axis(prediction_proba, indices, axis=1).tolist()
+        labels = self.labels
+        return [
+            [(labels[index], float(confidence)) for index, confidence in zip(row_indices, row_confidences)]
+            for row_indices, row_confidences in zip(indices.tolist(), confidences)
+        ]
+
+    @staticmethod
+    def format_ranking(ranking):
+        return [
+            {"crop": crop, "confidence": confidence, "suitability": f"{confidence:.1%}"}
+            for crop, confidence in ranking
+        ]
+
+    def run(self, input_data, top_k=None):
         try:
-            # Preprocess input
-            scaled_data, processed_features = self.preprocess_input(input_data)
-            
-            # Make prediction
-            prediction_proba = self.model.predict_proba(scaled_data)[0]
+            if self.fast_path_enabled:
+                with metrics.stage('feature_engineering'):
+                    processed_features = self._engineer_single(input_data)
+                prediction_proba = self.predict_proba_fast(processed_features)
+            else:
+                # Preprocess input
+                scaled_data, processed_features = self.preprocess_input(input_data)
+
+                # Make prediction
+                with metrics.stage('predict_proba'):
+                    prediction_proba = self.model.predict_proba(scaled_data)[0]
+            self._mark_warm()
             
-            # Get ONLY the top recommendation
-            top_index = np.argmax(prediction_proba)
-            crop = self.label_encoder.inverse_transform([top_index])[0]
-            confidence = float(prediction_proba[top_index])
+            # Best crop first, then the alternatives
+            ranking = self.rank(prediction_proba, top_k)[0]
+            crop, confidence = ranking[0]
             
             # Simple result 
             result = {
                 "crop": crop,
                 "confidence": confidence,
                 "suitability": f"{confidence:.1%}",
+                "top_k": self.format_ranking(ranking),
                 "processed_features": processed_features,
                 "input_summary": {
                     "nitrogen": input_data['nitrogen'],
@@ -100,6 +220,69 @@ class CropRecommendationModel:
             logger.error(f"Error during crop prediction: {str(e)}")
             raise
 
+    @staticmethod
+    def rows_to_matrix(rows):
+        """Convert a list of input dicts into an (N, 7) float matrix in INPUT_FIELDS order"""
+        return np.array([[float(row[field]) for field in INPUT_FIELDS] for row in rows], dtype=np.float64)
+
+    def engineer_features(self, inputs):
+        """Compute engineered features for an (N, 7) input matrix as column operations"""
+        nitrogen, phosphorus, potassium, temperature, humidity, ph, rainfall = inputs.T
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np_ratio = np.where(phosphorus != 0, nitrogen / phosphorus, 0.0)
+
+        features = {
+            'temp_rain': temperature * rainfall,
+            'ph_rain': ph * rainfall,
+            'K': potassium,
+            'rainfall': rainfall,
+            'N': nitrogen,
+            'P': phosphorus,
+            'NPK_Avg_Soil_Fertility': (nitrogen + phosphorus + potassium) / 3,
+            'humidity': humidity,
+            'NP_Ratio': np_ratio,
+            'THI': (temperature * humidity) / 100
+        }
+
+        return np.column_stack([features[name] for name in self.feature_columns])
+
+    def run_batch(self, inputs, top_k=None):
+        """Recommend crops for every row of an (N, 7) input matrix in one predict call"""
+        try:
+            inputs = np.asarray(inputs, dtype=np.float64)
+            if inputs.ndim != 2 or inputs.shape[1] != len(INPUT_FIELDS):
+                raise ValueError(f"Expected an (N, {len(INPUT_FIELDS)}) matrix, got shape {inputs.shape}")
+
+            if len(inputs) == 0:
+                return []
+
+            # Scale once and predict the whole matrix
+            with metrics.stage('feature_engineering'):
+                features = self.engineer_features(inputs)
+            with metrics.stage('scaling'):
+                # Named columns, as the scaler was fitted on a DataFrame
+                scaled = self.scaler.transform(pd.DataFrame(features, columns=self.feature_columns))
+            with metrics.stage('predict_proba'):
+                prediction_proba = self.model.predict_proba(scaled)
+            self._mark_warm()
+
+            results = []
+            for ranking in self.rank(prediction_proba, top_k):
+                crop, confidence = ranking[0]
+                results.append({
+                    "crop": crop,
+                    "confidence": confidence,
+                    "suitability": f"{confidence:.1%}",
+                    "top_k": self.format_ranking(ranking)
+                })
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error during batch crop prediction: {str(e)}")
+            raise
+
 # Initialize model instance
 crop_model = CropRecommendationModel()
 
@@ -112,3 +295,9 @@ def run(input_data):
         return result
     except Exception as e:
         return {"error": str(e), "status": "error"}
+
+def run_batch(inputs):
+    try:
+        return crop_model.run_batch(inputs)
+    except Exception as e:
+        return {"error": str(e), "status": "error"}
@@ -0,0 +1,67 @@
+import os
+import time
+
+import jwt
+import pytest
+
+import stub_postgrest
+import stub_redis
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = 'test-secret-with-enough-bytes-for-hs256'
+
+
+@pytest.fixture(scope='session')
+def crop_model():
+    """The shipped model, loaded once (its pickles are read relative to the service directory)"""
+    from score_crop import CropRecommendationModel
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(SERVICE_DIR)
+        model = CropRecommendationModel()
+        assert model.init()
+    return model
+
+
+@pytest.fixture(scope='session')
+def supabase_stub():
+    server = stub_postgrest.serve(port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def redis_stub():
+    server = stub_redis.serve(port=0)
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def client(supabase_stub, redis_stub, tmp_path_factory):
+    """app_crop against the PostgREST and Redis stubs, persisting synchronously"""
+    with pytest.MonkeyPatch.context() as patch:
+        for name, value in {
+            'SUPABASE_URL': supabase_stub,
+            'SUPABASE_ANON_KEY': 'test-key',
+            'JWT_SECRET': JWT_SECRET,
+            'RATELIMIT_STORAGE_URI': redis_stub,
+            'ASYNC_PERSISTENCE': 'false',
+            'BULK_INSERT_ENABLED': 'false',
+            'HISTORY_CACHE_ENABLED': 'false',
+            'MODEL_LOAD_MODE': 'foreground',
+            'METRICS_DIR': str(tmp_path_factory.mktemp('metrics')),
+        }.items():
+            patch.setenv(name, value)
+        patch.chdir(SERVICE_DIR)
+
+        import app_crop
+
+        assert app_crop.model_loader.ready
+        yield app_crop.app.test_client()
+
+
+def auth_header(user_id='11111111-1111-1111-1111-111111111111'):
+    token = jwt.encode({'user_id': user_id, 'email': f"{user_id}@example.com", 'exp': int(time.time()) + 600},
+                       JWT_SECRET, algorithm='HS256')
+    return {'Authorization': f"Bearer {token}"}
@@ -0,0 +1,41 @@
+from conftest import auth_header
+
+SAMPLE = {"nitrogen": 90, "phosphorus": 42, "potassium": 43, "temperature": 20.8,
+          "humidity": 82, "ph": 6.5, "rainfall": 202.9}
+
+
+def test_recommendation_is_saved_and_listed_in_history(client):
+    headers = auth_header('22222222-2222-2222-2222-222222222222')
+    response = client.post('/recommend', json=SAMPLE, headers=headers)
+    assert response.status_code == 200
+    assert response.json['saved_to_database'] is True
+
+    history = client.get('/history', headers=headers)
+    assert history.status_code == 200
+    assert history.json['count'] == 1
+    assert history.json['history'][0]['recommended_crop'] == response.json['crop']
+
+
+def test_rate_limit_is_enforced_through_redis(client):
+    headers = auth_header('33333333-3333-3333-3333-333333333333')
+    statuses = [client.post('/recommend', json=SAMPLE, headers=headers).status_code for _ in range(31)]
+    assert statuses[:30] == [200] * 30
+    assert statuses[30] == 429
+    assert client.get('/metrics/ratelimit').json['errors'] == 0
+
+
+def test_missing_parameter_is_rejected(client):
+    response = client.post('/recommend', json={"nitrogen": 90}, headers=auth_header())
+    assert response.status_code == 400
+
+
+def test_batch_rows_must_be_objects(client):
+    response = client.post('/recommend/batch', json=[SAMPLE, 42], headers=auth_header())
+    assert response.status_code == 400
+    assert response.json['error'].startswith('row 1: expected an object')
+
+
+def test_batch_values_must_be_numeric(client):
+    response = client.post('/recommend/batch', json=[dict(SAMPLE, ph=None)], headers=auth_header())
+    assert response.status_code == 400
+    assert response.json['error'] == 'All parameters must be numeric'
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from score_crop import INPUT_FIELDS
+
+# Roughly the ranges of the training data, per INPUT_FIELDS
+LOW = [0, 5, 5, 8, 14, 3.5, 20]
+HIGH = [140, 145, 205, 44, 100, 10, 300]
+
+
+@pytest.fixture(scope='module')
+def samples():
+    rows = np.random.default_rng(1).uniform(LOW, HIGH, size=(1000, len(INPUT_FIELDS)))
+    return [dict(zip(INPUT_FIELDS, row)) for row in rows.tolist()]
+
+
+def test_fast_path_matches_predict_proba_for_every_label(crop_model, samples):
+    expected = np.vstack([crop_model.model.predict_proba(crop_model.preprocess_input(sample)[0])[0]
+                          for sample in samples])
+    actual = np.vstack([crop_model.predict_proba_fast(crop_model._engineer_single(sample))
+                        for sample in samples])
+
+    assert actual.shape == (len(samples), len(crop_model.labels))
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+    assert (actual.argmax(axis=1) == expected.argmax(axis=1)).all()
+    def ranked_labels(proba):
+        return [[crop for crop, _ in ranking] for ranking in crop_model.rank(proba)]
+
+    assert ranked_labels(actual) == ranked_labels(expected)
+
+
+# The scaler was fitted on a DataFrame; bare arrays would lose the column names
+@pytest.mark.filterwarnings('error:X does not have valid feature names')
+def test_batch_path_matches_single_rows(crop_model, samples):
+    batch = crop_model.run_batch(crop_model.rows_to_matrix(samples[:50]))
+    single = [crop_model.run(sample) for sample in samples[:50]]
+
+    assert [result['crop'] for result in batch] == [result['crop'] for result in single]
+    np.testing.assert_allclose([result['confidence'] for result in batch],
+                               [result['confidence'] for result in single], atol=1e-4)
@@ -1,15 +1,17 @@
 from flask import Flask, request, jsonify
+import asyncio
 import io
 import base64
-from PIL import Image
 import logging
 import sys
 import os
+import time
 from flask_cors import CORS
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import requests
-import jwt
+import zipfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -19,126 +21,296 @@ load_dotenv()
 # Add current directory to path to import score
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import your model scoring
-from score import PlantDiseaseModel
+# score (torch, torchvision, PIL) is imported by the model loader, not here,
+# so the app can bind and answer /health while the model loads
+from batching import BatchScheduler
+from flora_common.write_behind import MemoryStatusStore, SQLiteStatusStore, WriteBehindQueue
+from flora_common.bulk_writer import BulkInsertBuffer
+from result_cache import ResultCache
+from flora_common.supabase_client import SupabaseClient
+from flora_common.auth_middleware import TokenVerifier
+from flora_common.history_pages import HistoryCache, SQLiteGenerations, keyset_query, split_page
+from flora_common.model_loader import ModelLoader
+from flora_common.asgi_bridge import AsyncSupabaseClient, BackgroundLoop
+from flora_common import health_check
+from flora_common.health_check import HealthChecker
+from flora_common import process_stats
+from flora_common import metrics
+from flora_common.rate_limit import RateLimiter
+from flora_common import structured_logging
+from flora_common.structured_logging import carry_request_id, current_request_id, log_context, redact, truncate
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# JSON logs written off-thread, tagged with a per-request id and sampled per path
+structured_logging.setup_logging('plant-disease')
+structured_logging.init_app(app)
+
+# Prometheus-format GET /metrics, merged across gunicorn workers
+metrics.init_app(app, 'plant-disease')
+logger = logging.getLogger(__name__)
+
 # Enable CORS for all routes 
 CORS(app)
 
-# Rate limiting
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    storage_uri="memory://"
-)
+# Token-bucket rate limiting shared by every worker (RATELIMIT_STORAGE_URI), keyed by user on
+# authenticated routes; RATELIMIT_ENABLED=false for load tests
+limiter = RateLimiter.from_env('plant-disease')
 
 # Supabase Configuration
 SUPABASE_URL = os.environ.get('SUPABASE_URL', '').strip()
 SUPABASE_KEY = os.environ.get('SUPABASE_ANON_KEY', '').strip()
 JWT_SECRET = os.environ.get('JWT_SECRET', 'fallback-secret-key').strip()
 
-print("🌿 Plant Disease Detection API Starting...")
-print(f"SUPABASE_URL: {SUPABASE_URL}")
-print(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+# Verified tokens are cached until their exp, so each signature is checked once per worker
+token_verifier = TokenVerifier(
+    JWT_SECRET,
+    max_entries=int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10000)),
+    max_ttl=float(os.environ.get('TOKEN_CACHE_MAX_TTL', 300)),
+    enabled=os.environ.get('TOKEN_CACHE_ENABLED', 'true').lower() == 'true'
+)
+require_auth = token_verifier.require_auth
 
-# Initialize model
-model = PlantDiseaseModel()
-init_success = model.init()
+# Pooled keep-alive client shared by every Supabase call in this worker
+supabase = SupabaseClient.from_env(SUPABASE_URL, SUPABASE_KEY)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Supabase reachability, checked by one background thread per worker instead of on every probe
+def supabase_reachable(timeout):
+    response = supabase.get("rest/v1/disease_predictions?select=id&limit=1", timeout=timeout)
+    return response.ok
+
+supabase_health = HealthChecker.from_env('supabase', supabase_reachable)
+
+# SERVE_MODE=asgi (asgi.py) also moves Supabase uploads, inserts and reads onto an event loop:
+# write-behind jobs run there outright, and request handlers wait on it for their own calls
+SERVE_MODE = os.environ.get('SERVE_MODE', 'wsgi').lower()
+io_loop = None
+async_supabase = None
+if os.environ.get('SUPABASE_ASYNC_IO', 'true' if SERVE_MODE == 'asgi' else 'false').lower() == 'true':
+    import httpx
+
+    io_loop = BackgroundLoop('disease-supabase-io')
+    async_supabase = AsyncSupabaseClient(supabase)
+
+logger.info("🌿 Plant Disease Detection API Starting...")
+logger.info(f"SUPABASE_URL: {SUPABASE_URL}")
+logger.info(f"SUPABASE_KEY loaded: {bool(SUPABASE_KEY)}")
+
+# Micro-batching in front of the model (needs a threaded worker to see concurrent requests)
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+
+# /predict/batch limits
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 200))
+# Decompressed bytes of all images in one batch; caps what a small zip can expand to in memory
+BATCH_MAX_TOTAL_BYTES = int(os.environ.get('BATCH_MAX_TOTAL_BYTES', 128 * 1024 * 1024))
+BATCH_PREPROCESS_WORKERS = int(os.environ.get('BATCH_PREPROCESS_WORKERS', 4))
+BATCH_UPLOAD_WORKERS = int(os.environ.get('BATCH_UPLOAD_WORKERS', 8))
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+# Not in every platform's mime.types; zip entries are typed from their names
+mimetypes.add_type('image/webp', '.webp')
+
+# Upload size bounds; werkzeug spools bodies over 500 KB to disk until they are read
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_REQUEST_BYTES', 256 * 1024 * 1024))
+
+# Content-addressed prediction cache; RESULT_CACHE_DB adds a SQLite tier shared by workers
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+
+# /history pages: keyset pagination plus a short per-user cache, dropped when the user saves a prediction.
+# The user's generation lives in HISTORY_GENERATIONS_DB so a save through any worker on the host
+# invalidates every worker's pages; set it empty only when running a single worker
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 100))
+HISTORY_COLUMNS = ['id', 'created_at', 'image_url', 'disease_detected', 'is_healthy', 'confidence',
+                   'treatment_recommendation', 'prevention_tips']
+HISTORY_GENERATIONS_DB = os.environ.get('HISTORY_GENERATIONS_DB', '/tmp/disease_predictions_history.db')
+history_cache = None
+if os.environ.get('HISTORY_CACHE_ENABLED', 'true').lower() == 'true':
+    history_cache = HistoryCache(
+        max_entries=int(os.environ.get('HISTORY_CACHE_MAX_ENTRIES', 5000)),
+        ttl=float(os.environ.get('HISTORY_CACHE_TTL', 30)),
+        generations=SQLiteGenerations(HISTORY_GENERATIONS_DB) if HISTORY_GENERATIONS_DB else None
+    )
+
+def history_saved(user_id, outcome):
+    """Pass a save outcome (bool or insert Future) through, invalidating the user's history on success"""
+    if history_cache is not None:
+        history_cache.invalidate_when_saved(user_id, outcome)
+    return outcome
+
+# Set once the model is loaded; routes check model_loader.ready first
+model = None
+result_cache = None
+batch_scheduler = None
+
+def load_model():
+    """Import the scoring stack and initialize the model"""
+    started = time.time()
+    from score import PlantDiseaseModel
+
+    process_stats.record_phase('model_import', started)
+    loaded = PlantDiseaseModel()
+    if not loaded.init():
+        return None
+    process_stats.record_phase('model_load', started)
+    return loaded
+
+def setup_inference(loaded):
+    """Build the caches and scheduler that depend on the loaded model"""
+    global model, result_cache, batch_scheduler
+
+    if RESULT_CACHE_ENABLED:
+        # The output mode changes the result shape, so it is part of the namespace
+        result_cache = ResultCache(
+            f"{loaded.model_version}-{loaded.output_mode}{loaded.top_k}",
+            max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 2048)),
+            db_path=os.environ.get('RESULT_CACHE_DB') or None,
+            max_disk_entries=int(os.environ.get('RESULT_CACHE_DB_MAX_ENTRIES', 100000)),
+            ttl=float(os.environ['RESULT_CACHE_TTL']) if os.environ.get('RESULT_CACHE_TTL') else None
+        )
+
+    if BATCHING_ENABLED:
+        batch_scheduler = BatchScheduler(
+            loaded.predict_batch,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS
+        )
+
+    model = loaded
+
+# MODEL_LOAD_MODE=background (default) binds first and loads on a thread;
+# gunicorn.conf.py switches to sync when preloading in the master
+model_loader = ModelLoader(load_model, name='plant-disease-model')
+
+# /health/live and /health/ready; readiness waits for the model, never for a live Supabase call
+health_check.init_app(app, supabase_health, is_ready=lambda: model_loader.ready,
+                      details=lambda: {"model": model_loader.status()})
+model_loader.when_ready(setup_inference)
+model_loader.start(background=os.environ.get('MODEL_LOAD_MODE', 'background').lower() == 'background')
+process_stats.record_phase('app_import', process_stats.process_start_time())
+
+def model_unavailable():
+    """503 with Retry-After while the model loads, 500 if loading failed"""
+    if model_loader.state == 'failed':
+        return jsonify({"error": "Model not initialized"}), 500
+    response = jsonify({"error": "Model is loading, retry shortly", "model": model_loader.status()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def supabase_unavailable():
+    """503 with Retry-After while the Supabase circuit is open"""
+    response = jsonify({"error": "Database temporarily unavailable, retry shortly"})
+    response.headers['Retry-After'] = os.environ.get('SUPABASE_BREAKER_OPEN_SECONDS', '15')
+    return response, 503
+
+def persistence_available():
+    """False while the Storage or REST circuit is open; predictions are then not saved"""
+    return supabase.available('storage') and supabase.available('rest')
+
+# Reported instead of a save while the Supabase circuit is open: the response is inference-only
+PERSISTENCE_SKIPPED = {'status': 'skipped', 'reason': 'Database temporarily unavailable'}
 
 # Supabase Helper Functions
+REST_HEADERS = {
+    'apikey': SUPABASE_KEY,
+    'Authorization': f'Bearer {SUPABASE_KEY}',
+    'Content-Type': 'application/json',
+    'Prefer': 'return=representation'
+}
+
 def supabase_request(endpoint, method='GET', data=None):
     """Make request to Supabase REST API"""
+    if io_loop is not None:
+        return io_loop.run(supabase_request_async(endpoint, method, data))
+
     url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
     
-    logger.info(f"Making {method} request to: {url}")
+    logger.debug(f"{method} {url}")
     if data:
-        logger.info(f"Request data: {data}")
+        logger.debug(f"Request data: {redact(data)}")
     
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, timeout=10)
+            response = supabase.get(url, headers=REST_HEADERS)
         elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            response = supabase.post(url, headers=REST_HEADERS, json=data)
         elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
+            response = supabase.patch(url, headers=REST_HEADERS, json=data)
         
-        logger.info(f"Response status: {response.status_code}")
-        logger.info(f"Response headers: {dict(response.headers)}")
-        logger.info(f"Response text: {response.text}")
-        
-        if response.status_code >= 400:
-            logger.error(f"❌ API Error {response.status_code}: {response.text}")
-            return None
-        
-        # Handle empty response
-        if response.status_code == 204 or not response.text.strip():
-            logger.info("Empty response (204 No Content)")
-            return []
-            
-        result = response.json()
-        logger.info(f"Response data: {result}")
-        return result
+        return rest_result(response)
         
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Request error: {e}")
         return None
 
-def verify_token(token):
-    """Verify JWT token"""
+async def supabase_request_async(endpoint, method='GET', data=None):
+    """supabase_request over the async client"""
+    logger.debug(f"{method} rest/v1/{endpoint}")
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload
-    except:
+        response = await async_supabase.request(method, f"rest/v1/{endpoint}", headers=REST_HEADERS,
+                                                json=data)
+        return rest_result(response)
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+        logger.error(f"❌ Request error: {e}")
         return None
 
-def save_disease_prediction(user_id, image_url, result):
+def rest_result(response):
+    """Decoded body of a PostgREST response, [] when empty, None on an error status"""
+    logger.debug(f"Response status: {response.status_code}")
+
+    if response.status_code >= 400:
+        logger.error(f"❌ API Error {response.status_code}: {truncate(response.text, 500)}")
+        return None
+
+    # Handle empty response
+    if response.status_code == 204 or not response.text.strip():
+        return []
+
+    result = response.json()
+    logger.debug(f"Response data: {redact(result)}")
+    return result
+
+def build_disease_prediction_row(user_id, image_url, result, image_path=None):
+    """Build a disease_predictions row from an enhanced prediction result"""
+    # Determine if plant is healthy based on your model's output
+    is_healthy = result.get('status', '').lower() == 'healthy'
+    confidence = result.get('confidence', 0.0)
+    # The class-level disease name is only known outside PREDICTION_OUTPUT=legacy
+    disease_detected = "Healthy" if is_healthy else (result['disease'] if 'class' in result else "Disease Detected")
+
+    data = {
+        'user_id': user_id,
+        'image_url': image_url,
+        'image_path': image_path or f"disease_images/{user_id}/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg",
+        'is_healthy': is_healthy,
+        'confidence': confidence,
+        'disease_detected': disease_detected,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+    # Add detailed diagnosis if available
+    if 'treatment' in result:
+        data['treatment_recommendation'] = result['treatment']
+    if 'prevention' in result:
+        data['prevention_tips'] = result['prevention']
+
+    return data
+
+def save_disease_prediction(user_id, image_url, result, image_path=None):
     """Save disease prediction to Supabase"""
     try:
         endpoint = "disease_predictions"
+        data = build_disease_prediction_row(user_id, image_url, result, image_path=image_path)
         
-        # Determine if plant is healthy based on your model's output
-        is_healthy = result.get('status', '').lower() == 'healthy'
-        confidence = result.get('overall_confidence', 0.0)
-        disease_detected = "Healthy" if is_healthy else "Disease Detected"
-        
-        data = {
-            'user_id': user_id,
-            'image_url': image_url,
-            'image_path': f"disease_images/{user_id}/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg",
-            'is_healthy': is_healthy,
-            'confidence': confidence,
-            'disease_detected': disease_detected,
-            'created_at': datetime.utcnow().isoformat()
-        }
-        
-        # Add detailed diagnosis if available
-        if 'treatment' in result:
-            data['treatment_recommendation'] = result['treatment']
-        if 'prevention' in result:
-            data['prevention_tips'] = result['prevention']
-        
-        logger.info(f"Attempting to save disease prediction for user {user_id}")
-        logger.info(f"Data being sent: {data}")
+        logger.debug(f"Saving disease prediction for user {user_id}: {redact(data)}")
         
         response = supabase_request(endpoint, 'POST', data)
         
-        logger.info(f"Supabase API response: {response}")
-        
         if response:
-            logger.info(f"Successfully saved disease prediction: {response}")
+            logger.info(f"Saved disease prediction for user {user_id}")
             return True
         else:
             logger.error("❌ Failed to save disease prediction - API returned None")
@@ -150,50 +322,62 @@ def save_disease_prediction(user_id, image_url, result):
         logger.error(f"❌ Traceback: {traceback.format_exc()}")
         return False
 
-def upload_plant_image(image_file, user_id):
-    """Upload plant image to Supabase Storage"""
+def save_disease_predictions_bulk(rows):
+    """Save many disease predictions with a single PostgREST insert"""
+    if not rows:
+        return True
+
+    try:
+        logger.info(f"Attempting bulk save of {len(rows)} disease predictions")
+        response = supabase_request("disease_predictions", 'POST', rows)
+
+        if response:
+            logger.info(f"Successfully saved {len(response)} disease predictions")
+            return True
+        else:
+            logger.error("❌ Failed to bulk save disease predictions - API returned None")
+            return False
+
+    except Exception as e:
+        logger.error(f"❌ Error bulk saving disease predictions: {e}")
+        return False
+
+def build_image_path(filename, user_id, suffix=''):
+    """Generate the unique storage path for an uploaded image"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    file_extension = filename.split('.')[-1].lower()
+    return f"{user_id}/{timestamp}{suffix}.{file_extension}"
+
+def public_image_url(path):
+    return f"{SUPABASE_URL}/storage/v1/object/public/plant-images/{path}"
+
+def storage_object_path(path):
+    return f"storage/v1/object/plant-images/{path}"
+
+def storage_upload_headers(content_type):
+    return {
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': content_type,
+        'x-upsert': 'true'      # retried uploads of the same path stay idempotent
+    }
+
+def upload_image_bytes(file_data, filename, content_type, user_id, suffix='', path=None):
+    """Upload raw image bytes to Supabase Storage"""
+    if io_loop is not None:
+        return io_loop.run(upload_image_bytes_async(file_data, filename, content_type, user_id, suffix, path))
+
     try:
         # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_extension = image_file.filename.split('.')[-1].lower()
-        unique_filename = f"{user_id}/{timestamp}.{file_extension}"
+        unique_filename = path or build_image_path(filename, user_id, suffix)
         
         # Upload to Supabase Storage using the correct endpoint
-        endpoint = f"storage/v1/object/plant-images/{unique_filename}"
-        url = f"{SUPABASE_URL}/{endpoint}"
-        
-        headers = {
-            'Authorization': f'Bearer {SUPABASE_KEY}',
-            'Content-Type': image_file.content_type
-        }
-        
-        # Reset file pointer and read data
-        image_file.seek(0)
-        file_data = image_file.read()
-        
-        response = requests.post(
-            url,
-            headers=headers,
+        response = supabase.post(
+            storage_object_path(unique_filename),
+            headers=storage_upload_headers(content_type),
             data=file_data,
             timeout=30
         )
-        
-        if response.status_code == 200:
-            # Get public URL
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/plant-images/{unique_filename}"
-            logger.info(f"Image uploaded successfully: {public_url}")
-            return {
-                'success': True,
-                'path': unique_filename,
-                'url': public_url
-            }
-        else:
-            logger.error(f"❌ Image upload failed: {response.status_code} - {response.text}")
-            return {
-                'success': False,
-                'error': f"Upload failed: {response.status_code}",
-                'details': response.text
-            }
+        return upload_outcome(unique_filename, response)
     
     except Exception as e:
         logger.error(f"❌ Upload error: {e}")
@@ -202,57 +386,177 @@ def upload_plant_image(image_file, user_id):
             'error': str(e)
         }
 
-def require_auth(f):
-    """Decorator to protect routes with JWT authentication"""
-    from functools import wraps
-    
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header:
-            return jsonify({'error': 'No authorization token provided'}), 401
-        
-        try:
-            token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
-            payload = verify_token(token)
-            
-            if not payload:
-                return jsonify({'error': 'Invalid or expired token'}), 401
-            
-            request.user_id = payload['user_id']
-            request.user_email = payload['email']
-            
-        except Exception as e:
-            return jsonify({'error': 'Invalid authorization header'}), 401
-        
-        return f(*args, **kwargs)
-    
-    return decorated_function
+async def upload_image_bytes_async(file_data, filename, content_type, user_id, suffix='', path=None):
+    """upload_image_bytes over the async client"""
+    try:
+        unique_filename = path or build_image_path(filename, user_id, suffix)
+        response = await async_supabase.post(
+            storage_object_path(unique_filename),
+            headers=storage_upload_headers(content_type),
+            content=file_data,
+            timeout=30
+        )
+        return upload_outcome(unique_filename, response)
+
+    except Exception as e:
+        logger.error(f"❌ Upload error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def upload_outcome(path, response):
+    """Result dict of a Storage upload response"""
+    if response.status_code == 200:
+        # Get public URL
+        public_url = public_image_url(path)
+        logger.info(f"Image uploaded successfully: {public_url}")
+        return {
+            'success': True,
+            'path': path,
+            'url': public_url
+        }
+
+    logger.error(f"❌ Image upload failed: {response.status_code} - {truncate(response.text, 500)}")
+    return {
+        'success': False,
+        'error': f"Upload failed: {response.status_code}",
+        'details': response.text
+    }
+
+def read_upload(image_file):
+    """Read an uploaded file exactly once into a single bounded buffer"""
+    image_file.stream.seek(0)
+    file_data = image_file.stream.read(MAX_IMAGE_BYTES + 1)
+    if len(file_data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image exceeds {MAX_IMAGE_BYTES // (1024 * 1024)} MB limit")
+    return file_data
+
+def upload_plant_image(image_file, user_id, file_data=None):
+    """Upload plant image to Supabase Storage"""
+    if file_data is None:
+        file_data = read_upload(image_file)
+    return upload_image_bytes(file_data, image_file.filename, image_file.content_type, user_id)
+
+def upload_plant_images_bulk(items, user_id):
+    """Upload many (filename, content_type, bytes) items concurrently over a shared pool"""
+    if not items:
+        return []
+    if io_loop is not None:
+        return io_loop.run(upload_plant_images_bulk_async(items, user_id))
+
+    def _upload(indexed_item):
+        index, (filename, content_type, file_data) = indexed_item
+        return upload_image_bytes(file_data, filename, content_type, user_id, suffix=f"_{index:03d}")
+
+    with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_WORKERS) as executor:
+        return list(executor.map(_upload, enumerate(items)))
+
+async def upload_plant_images_bulk_async(items, user_id):
+    """upload_plant_images_bulk as coroutines, BATCH_UPLOAD_WORKERS at a time"""
+    limit = asyncio.Semaphore(BATCH_UPLOAD_WORKERS)
+
+    async def _upload(index, item):
+        filename, content_type, file_data = item
+        async with limit:
+            return await upload_image_bytes_async(file_data, filename, content_type, user_id, suffix=f"_{index:03d}")
+
+    return await asyncio.gather(*(_upload(index, item) for index, item in enumerate(items)))
+
+def mark_uploaded(payload):
+    """Retries after a successful upload only need the insert, so drop the bytes"""
+    payload['uploaded'] = True
+    payload['image'] = None
+    if result_cache is not None and payload.get('digest'):
+        result_cache.put_upload(payload['user_id'], payload['digest'], payload['image_path'], payload['image_url'])
+
+def persist_disease_prediction(payload):
+    """Write-behind job: upload the image once, then insert the prediction row"""
+    if io_loop is not None:
+        return io_loop.submit(persist_disease_prediction_async(payload))
+
+    if not payload.get('uploaded'):
+        upload_result = upload_image_bytes(
+            payload['image'], payload['filename'], payload['content_type'],
+            payload['user_id'], path=payload['image_path']
+        )
+        if not upload_result.get('success'):
+            raise RuntimeError(upload_result.get('error', 'Unknown upload error'))
+        mark_uploaded(payload)
+
+    if bulk_buffer is None:
+        return history_saved(payload['user_id'], save_disease_prediction(
+            payload['user_id'], payload['image_url'], payload['result'], image_path=payload['image_path']
+        ))
+
+    # Build the row once so retries insert identical data
+    if 'row' not in payload:
+        payload['row'] = build_disease_prediction_row(
+            payload['user_id'], payload['image_url'], payload['result'], image_path=payload['image_path']
+        )
+    return history_saved(payload['user_id'], bulk_buffer.add('disease_predictions', payload['row']))
+
+async def persist_disease_prediction_async(payload):
+    """persist_disease_prediction over the async client, so a slow upload holds no thread"""
+    with log_context(payload.get('request_id')):
+        if not payload.get('uploaded'):
+            upload_result = await upload_image_bytes_async(
+                payload['image'], payload['filename'], payload['content_type'],
+                payload['user_id'], path=payload['image_path']
+            )
+            if not upload_result.get('success'):
+                raise RuntimeError(upload_result.get('error', 'Unknown upload error'))
+            mark_uploaded(payload)
+
+        if 'row' not in payload:
+            payload['row'] = build_disease_prediction_row(
+                payload['user_id'], payload['image_url'], payload['result'], image_path=payload['image_path']
+            )
+        if bulk_buffer is not None:
+            return await asyncio.wrap_future(
+                history_saved(payload['user_id'], bulk_buffer.add('disease_predictions', payload['row']))
+            )
+
+        response = await async_supabase.post("rest/v1/disease_predictions", json=payload['row'])
+        if response.status_code >= 400:
+            raise RuntimeError(f"Insert failed: {response.status_code} - {truncate(response.text, 500)}")
+        return history_saved(payload['user_id'], True)
+
+# Coalesce background inserts into JSON-array POSTs on size or time thresholds
+BULK_INSERT_ENABLED = os.environ.get('BULK_INSERT_ENABLED', 'true').lower() == 'true'
+bulk_buffer = None
+if BULK_INSERT_ENABLED:
+    bulk_buffer = BulkInsertBuffer(
+        supabase,
+        max_rows=int(os.environ.get('BULK_INSERT_MAX_ROWS', 100)),
+        max_delay=float(os.environ.get('BULK_INSERT_MAX_DELAY', 1.0)),
+        name='disease-bulk-writer'
+    )
+
+# Write-behind persistence: respond after inference, write to Supabase in the background
+ASYNC_PERSISTENCE = os.environ.get('ASYNC_PERSISTENCE', 'true').lower() == 'true'
+# Job statuses for /persistence/<job_id>, in a file every worker on the host shares;
+# set it empty to keep them in the worker that queued the job
+WRITE_BEHIND_STATUS_DB = os.environ.get('WRITE_BEHIND_STATUS_DB', '/tmp/disease_predictions_status.db')
+persistence_queue = None
+if ASYNC_PERSISTENCE:
+    persistence_queue = WriteBehindQueue(
+        {'disease_prediction': carry_request_id(persist_disease_prediction)},
+        name='disease-write-behind',
+        max_size=int(os.environ.get('WRITE_BEHIND_MAX_SIZE', 1000)),
+        max_attempts=int(os.environ.get('WRITE_BEHIND_MAX_ATTEMPTS', 5)),
+        spill_path=os.environ.get('WRITE_BEHIND_SPILL_PATH', '/tmp/disease_predictions_spill.jsonl'),
+        status_store=SQLiteStatusStore(WRITE_BEHIND_STATUS_DB) if WRITE_BEHIND_STATUS_DB else MemoryStatusStore()
+    )
 
 def enhance_prediction_result(base_result):
     """Add treatment and prevention advice based on prediction"""
-    status = base_result.get('status', '')
-    confidence = base_result.get('overall_confidence', 0)
+    confidence = base_result.get('confidence', 0)
     
     enhanced_result = base_result.copy()
-    
-    if status.lower() == 'healthy':
-        enhanced_result.update({
-            'disease': 'No Disease',
-            'is_healthy': True,
-            'treatment': 'No treatment needed. Your plant is healthy!',
-            'prevention': 'Continue with current care routine. Monitor regularly.',
-            'advice': 'Maintain proper watering, sunlight, and nutrient levels.'
-        })
-    else:
-        enhanced_result.update({
-            'disease': 'Plant Disease Detected',
-            'is_healthy': False,
-            'treatment': 'Apply appropriate fungicide or pesticide. Isolate plant if contagious. Remove affected leaves.',
-            'prevention': 'Improve air circulation. Avoid overwatering. Ensure proper spacing between plants.',
-            'advice': 'Consult with agricultural expert for specific treatment.'
-        })
+    enhanced_result['is_healthy'] = base_result.get('status', '').lower() == 'healthy'
+    enhanced_result.setdefault('disease', 'No Disease' if enhanced_result['is_healthy'] else 'Plant Disease Detected')
+    enhanced_result.update(model.advice_for(base_result))
     
     # Add confidence level description
     if confidence > 0.8:
@@ -267,45 +571,69 @@ def enhance_prediction_result(base_result):
     
     return enhanced_result
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": "Upload too large"}), 413
+
 @app.route('/')
 def home():
     return jsonify({
         "message": "Plant Disease Detection API 🌿",
         "status": "running",
-        "model_loaded": init_success,
+        "model_loaded": model_loader.ready,
         "supabase_connected": bool(SUPABASE_URL and SUPABASE_KEY),
         "endpoints": {
             "health": "/health (GET)",
+            "liveness": "/health/live (GET)",
+            "readiness": "/health/ready (GET)",
             "predict": "/predict (POST) - requires auth",
+            "predict_batch": "/predict/batch (POST) - requires auth",
+            "persistence": "/persistence/<job_id> (GET) - requires auth",
             "history": "/history (GET) - requires auth",
+            "metrics": "/metrics (GET)",
+            "batching_metrics": "/metrics/batching (GET)",
             "test": "/test-supabase (GET)"
         }
     })
 
 @app.route('/health', methods=['GET'])
-def health_check():
-    # Test Supabase connection
-    supabase_status = False
-    try:
-        test_response = supabase_request("disease_predictions?select=count&limit=1")
-        supabase_status = test_response is not None
-    except:
-        pass
-    
+def health():
+    # Served from the background check; probes should prefer /health/live and /health/ready
+    supabase_status = supabase_health.snapshot()
     return jsonify({
         "status": "healthy",
-        "model_initialized": init_success,
-        "supabase_connected": supabase_status,
-        "device": str(model.device) if init_success else "unknown"
+        "model_initialized": model_loader.ready,
+        "model": model_loader.status(),
+        "supabase_connected": supabase_status['status'] == 'ok',
+        "supabase": supabase_status,
+        "device": str(model.device) if model_loader.ready else "unknown"
     })
 
+@app.route('/metrics/batching', methods=['GET'])
+def batching_metrics():
+    """Per-batch latency and occupancy of the inference scheduler"""
+    if batch_scheduler is None:
+        return jsonify({"enabled": False})
+
+    stats = batch_scheduler.stats()
+    stats["enabled"] = True
+    return jsonify(stats)
+
+@app.route('/metrics/process', methods=['GET'])
+def process_metrics():
+    """Start-up time and RSS/PSS of this worker and its siblings"""
+    stats = process_stats.snapshot()
+    stats["weights_storage"] = model.weights_storage if model_loader.ready else None
+    stats["model"] = model_loader.status()
+    return jsonify(stats)
+
 @app.route('/predict', methods=['POST'])
 @require_auth
 @limiter.limit("20 per hour")
 def predict():
     try:
-        if not init_success:
-            return jsonify({"error": "Model not initialized"}), 500
+        if not model_loader.ready:
+            return model_unavailable()
         
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -316,10 +644,9 @@ def predict():
             return jsonify({"error": "No file selected"}), 400
         
         # Validate file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'webp'}
         file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
         
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_EXTENSIONS:
             return jsonify({"error": "Invalid file type. Use PNG, JPG, or WEBP"}), 400
         
         if not file.content_type.startswith('image/'):
@@ -327,36 +654,92 @@ def predict():
         
         logger.info(f"📸 Processing image from user {request.user_id} - {file.filename}")
         
-        # Upload image to Supabase Storage
-        upload_result = upload_plant_image(file, request.user_id)
-        
-        image_url = None
-        if upload_result.get('success'):
-            image_url = upload_result['url']
-            logger.info(f"✅ Image uploaded to: {image_url}")
-        else:
-            logger.warning(f"⚠️ Image upload failed: {upload_result.get('error')}")
-            # Continue without saving image URL for now
-        
-        # Read file again for prediction (reset file pointer)
-        file.seek(0)
-        image_data = file.read()
-        
-        # Get prediction from model
-        base_result = model.run(image_data)
+        # Read the upload once; the same immutable buffer feeds storage and the model
+        try:
+            image_data = read_upload(file)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 413
         
+        # Identical uploads skip decode and inference entirely
+        digest = ResultCache.digest(image_data) if result_cache is not None else None
+        base_result = result_cache.get_result(digest) if digest else None
+        cache_hit = base_result is not None
+        if not cache_hit:
+            # Get prediction from model
+            base_result = model.run(image_data, scheduler=batch_scheduler)
+            if digest and 'error' not in base_result:
+                result_cache.put_result(digest, base_result)
+
+        # ...and this user's earlier upload of the same bytes is reused
+        prior_upload = result_cache.get_upload(request.user_id, digest) if digest else None
+
         # Enhance result with additional information
         enhanced_result = enhance_prediction_result(base_result)
-        
-        # Save prediction to Supabase
-        if image_url:  # Only save if image upload was successful
-            save_result = save_disease_prediction(request.user_id, image_url, enhanced_result)
-            enhanced_result['saved_to_database'] = save_result
+        enhanced_result['cached'] = cache_hit
+
+        if persistence_queue is not None:
+            # Hand the writes to the background queue
+            if 'error' in base_result:
+                return jsonify({"error": f"Prediction failed: {base_result['error']}"}), 500
+
+            if prior_upload:
+                image_path, image_url = prior_upload['path'], prior_upload['url']
+            else:
+                image_path = build_image_path(file.filename, request.user_id)
+                image_url = public_image_url(image_path)
+
+            job_id = persistence_queue.submit('disease_prediction', {
+                'request_id': current_request_id(),
+                'user_id': request.user_id,
+                'filename': file.filename,
+                'content_type': file.content_type,
+                'image': None if prior_upload else image_data,
+                'uploaded': bool(prior_upload),
+                'digest': digest,
+                'image_path': image_path,
+                'image_url': image_url,
+                'result': dict(enhanced_result)
+            }, owner=request.user_id)
+
             enhanced_result['image_url'] = image_url
-        else:
+            enhanced_result['saved_to_database'] = False
+            enhanced_result['persistence'] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/persistence/{job_id}"
+            }
+        elif not persistence_available():
             enhanced_result['saved_to_database'] = False
             enhanced_result['image_url'] = None
-            enhanced_result['upload_error'] = upload_result.get('error', 'Unknown upload error')
+            enhanced_result['persistence'] = dict(PERSISTENCE_SKIPPED)
+        else:
+            # Upload image to Supabase Storage
+            if prior_upload:
+                upload_result = dict(prior_upload, success=True)
+            else:
+                upload_result = upload_plant_image(file, request.user_id, file_data=image_data)
+                if digest and upload_result.get('success'):
+                    result_cache.put_upload(request.user_id, digest, upload_result['path'], upload_result['url'])
+
+            image_url = None
+            if upload_result.get('success'):
+                image_url = upload_result['url']
+                logger.info(f"✅ Image uploaded to: {image_url}")
+            else:
+                logger.warning(f"⚠️ Image upload failed: {upload_result.get('error')}")
+                # Continue without saving image URL for now
+
+            # Save prediction to Supabase
+            if image_url:  # Only save if image upload was successful
+                save_result = history_saved(request.user_id, save_disease_prediction(
+                    request.user_id, image_url, enhanced_result, image_path=upload_result['path']
+                ))
+                enhanced_result['saved_to_database'] = save_result
+                enhanced_result['image_url'] = image_url
+            else:
+                enhanced_result['saved_to_database'] = False
+                enhanced_result['image_url'] = None
+                enhanced_result['upload_error'] = upload_result.get('error', 'Unknown upload error')
         
         logger.info(f"🔍 Prediction completed for user {request.user_id}: {enhanced_result.get('status', 'Unknown')}")
         
@@ -366,16 +749,206 @@ def predict():
         logger.error(f"❌ Prediction error: {str(e)}")
         return jsonify({"error": f"Prediction failed: {str(e)}"}), 500
 
+class BatchLimitError(ValueError):
+    """A /predict/batch request over its image count (400) or total size (413) limit"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+def is_allowed_image(filename, content_type):
+    file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return file_extension in ALLOWED_EXTENSIONS and content_type.startswith('image/')
+
+def collect_batch_images():
+    """Gather (filename, content_type, bytes) from a multipart file list or a zip archive.
+
+    Names, types, the image count and the declared sizes are all checked
+    before anything is read or decompressed; reads are then bounded by
+    MAX_IMAGE_BYTES per image and BATCH_MAX_TOTAL_BYTES per request, since a
+    zip entry's declared size cannot be trusted.
+    """
+    candidates = []                     # (filename, content_type, read(limit), declared size or None)
+    rejected = []
+
+    def read_file(file, limit):
+        file.stream.seek(0)
+        return file.stream.read(limit)
+
+    def read_entry(info, limit):
+        with zf.open(info) as stream:
+            return stream.read(limit)
+
+    for file in request.files.getlist('files'):
+        if not file.filename:
+            continue
+        if is_allowed_image(file.filename, file.content_type or ''):
+            candidates.append((file.filename, file.content_type, partial(read_file, file), None))
+        else:
+            rejected.append(file.filename)
+
+    archive = request.files.get('archive')
+    zf = zipfile.ZipFile(archive.stream) if archive and archive.filename else None
+    if zf is not None:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.'):
+                continue
+            content_type = mimetypes.guess_type(name)[0] or ''
+            if not is_allowed_image(name, content_type) or info.file_size > MAX_IMAGE_BYTES:
+                rejected.append(name)
+            else:
+                candidates.append((name, content_type, partial(read_entry, info), info.file_size))
+
+    if len(candidates) > BATCH_MAX_FILES:
+        raise BatchLimitError(f"Too many images. Maximum is {BATCH_MAX_FILES} per batch", 400)
+    too_large = BatchLimitError(f"Images exceed {BATCH_MAX_TOTAL_BYTES // (1024 * 1024)} MB per batch", 413)
+    if sum(size for _, _, _, size in candidates if size) > BATCH_MAX_TOTAL_BYTES:
+        raise too_large
+
+    accepted = []
+    budget = BATCH_MAX_TOTAL_BYTES
+    try:
+        for filename, content_type, read, _ in candidates:
+            file_data = read(min(MAX_IMAGE_BYTES, budget) + 1)
+            if len(file_data) > MAX_IMAGE_BYTES:
+                rejected.append(filename)
+                continue
+            if len(file_data) > budget:
+                raise too_large
+            budget -= len(file_data)
+            accepted.append((filename, content_type, file_data))
+    finally:
+        if zf is not None:
+            zf.close()
+
+    return accepted, rejected
+
+@app.route('/predict/batch', methods=['POST'])
+@require_auth
+@limiter.limit("10 per hour")
+def predict_batch():
+    """Predict a whole scouting session of leaf images in one request"""
+    try:
+        if not model_loader.ready:
+            return model_unavailable()
+
+        if 'files' not in request.files and 'archive' not in request.files:
+            return jsonify({"error": "Provide images as 'files' or a zip 'archive'"}), 400
+
+        try:
+            items, rejected = collect_batch_images()
+        except zipfile.BadZipFile:
+            return jsonify({"error": "Archive is not a valid zip file"}), 400
+        except BatchLimitError as e:
+            return jsonify({"error": str(e)}), e.status_code
+
+        if not items:
+            return jsonify({"error": "No valid images provided. Use PNG, JPG, or WEBP", "rejected": rejected}), 400
+
+        logger.info(f"📸 Processing batch of {len(items)} images from user {request.user_id}")
+
+        # Decode in parallel and run stacked tensors through the model
+        base_results = model.run_batch(
+            [file_data for _, _, file_data in items],
+            chunk_size=BATCH_MAX_SIZE,
+            max_workers=BATCH_PREPROCESS_WORKERS
+        )
+
+        # Upload only images that produced a prediction, and none while Supabase is unavailable
+        persist = persistence_available()
+        predicted = [i for i, result in enumerate(base_results) if 'error' not in result] if persist else []
+        upload_results = upload_plant_images_bulk([items[i] for i in predicted], request.user_id)
+        uploads = dict(zip(predicted, upload_results))
+
+        results = []
+        rows = []
+        for index, (filename, _, _) in enumerate(items):
+            base_result = base_results[index]
+            if 'error' in base_result:
+                results.append({"filename": filename, "error": base_result['error']})
+                continue
+
+            enhanced_result = enhance_prediction_result(base_result)
+            enhanced_result['filename'] = filename
+
+            upload_result = uploads.get(index, {'success': False, 'error': PERSISTENCE_SKIPPED['reason']})
+            if upload_result.get('success'):
+                enhanced_result['image_url'] = upload_result['url']
+                rows.append(build_disease_prediction_row(
+                    request.user_id, upload_result['url'], enhanced_result, image_path=upload_result['path']
+                ))
+            else:
+                enhanced_result['image_url'] = None
+                enhanced_result['upload_error'] = upload_result.get('error', 'Unknown upload error')
+
+            results.append(enhanced_result)
+
+        # One insert for the whole batch
+        saved = history_saved(request.user_id, save_disease_predictions_bulk(rows))
+        for result in results:
+            result['saved_to_database'] = bool(saved and result.get('image_url'))
+
+        logger.info(f"🔍 Batch prediction completed for user {request.user_id}: {len(results)} images")
+
+        response = {
+            "success": True,
+            "count": len(results),
+            "results": results,
+            "rejected": rejected
+        }
+        if not persist:
+            response["persistence"] = dict(PERSISTENCE_SKIPPED)
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error(f"❌ Batch prediction error: {str(e)}")
+        return jsonify({"error": f"Batch prediction failed: {str(e)}"}), 500
+
+@app.route('/persistence/<job_id>', methods=['GET'])
+@require_auth
+def get_persistence_status(job_id):
+    """Follow-up status of a background write queued by /predict.
+
+    Statuses are shared by the workers of one host (WRITE_BEHIND_STATUS_DB) and
+    kept for a day; behind a load balancer spanning hosts, poll with the same
+    session affinity as the original request.
+    """
+    status = persistence_queue.status(job_id) if persistence_queue is not None else None
+
+    if status is None or status.get('owner') != request.user_id:
+        return jsonify({"error": "Unknown persistence job", "status": "unknown"}), 404
+
+    status.pop('owner', None)
+    status['saved_to_database'] = status['status'] == 'done'
+    return jsonify(status)
+
 @app.route('/history', methods=['GET'])
 @require_auth
 def get_prediction_history():
-    """Get user's disease prediction history"""
+    """Get user's disease prediction history, newest first, one cursor page at a time"""
     try:
-        endpoint = f"disease_predictions?user_id=eq.{request.user_id}&order=created_at.desc&limit=20"
+        cursor = request.args.get('cursor') or None
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+            endpoint = keyset_query('disease_predictions', request.user_id, HISTORY_COLUMNS, limit, cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Read the generation before fetching, so a save that lands meanwhile is not hidden by this page
+        generation = history_cache.generation(request.user_id) if history_cache is not None else None
+        page = history_cache.get(request.user_id, generation, cursor, limit) if generation is not None else None
+        if page is not None:
+            return jsonify(dict(page, cached=True))
+
         history = supabase_request(endpoint)
         
         if history is None:
+            if not supabase.available('rest'):
+                return supabase_unavailable()
             return jsonify({"error": "Failed to fetch history"}), 500
+
+        history, next_cursor = split_page(history, limit)
         
         # Format the response
         formatted_history = []
@@ -391,16 +964,66 @@ def get_prediction_history():
                 "prevention": item.get('prevention_tips')
             })
         
-        return jsonify({
+        page = {
             "success": True,
             "history": formatted_history,
-            "count": len(history)
-        })
+            "count": len(history),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }
+        if generation is not None:
+            history_cache.set(request.user_id, generation, cursor, limit, page)
+        return jsonify(dict(page, cached=False))
         
     except Exception as e:
         logger.error(f"Error fetching disease history: {e}")
         return jsonify({"error": "Failed to fetch prediction history"}), 500
 
+@app.route('/metrics/persistence', methods=['GET'])
+def persistence_metrics():
+    """Write-behind queue and bulk insert buffer counters for this worker"""
+    return jsonify({
+        "write_behind": persistence_queue.stats() if persistence_queue is not None else None,
+        "bulk_insert": bulk_buffer.stats() if bulk_buffer is not None else None
+    })
+
+@app.route('/metrics/result-cache', methods=['GET'])
+def result_cache_metrics():
+    """Prediction result cache counters for this worker"""
+    if result_cache is None:
+        return jsonify({"enabled": False})
+
+    stats = result_cache.stats()
+    stats["enabled"] = True
+    return jsonify(stats)
+
+@app.route('/metrics/history', methods=['GET'])
+def history_metrics():
+    """History page cache counters for this worker"""
+    if history_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(history_cache.stats(), enabled=True))
+
+@app.route('/metrics/ratelimit', methods=['GET'])
+def ratelimit_metrics():
+    """Rate limit decisions in this worker and buckets held by the shared store"""
+    return jsonify(limiter.stats())
+
+@app.route('/metrics/logging', methods=['GET'])
+def logging_metrics():
+    """Log records waiting for the writer thread and records dropped because the queue was full"""
+    return jsonify(structured_logging.stats())
+
+@app.route('/metrics/auth', methods=['GET'])
+def auth_metrics():
+    """Verified-token cache hit ratio and signature verification time"""
+    return jsonify(token_verifier.stats())
+
+@app.route('/metrics/supabase', methods=['GET'])
+def supabase_metrics():
+    """Supabase connection reuse metrics for this worker"""
+    return jsonify(supabase.connection_stats())
+
 @app.route('/test-supabase', methods=['GET'])
 def test_supabase():
     """Test Supabase connection"""
@@ -0,0 +1,20 @@
+"""ASGI entry point for the Plant Disease API.
+
+    SERVE_MODE=asgi gunicorn --config gunicorn.conf.py
+
+runs this module under uvicorn workers; see flora_common.asgi_bridge. Routes and
+responses are those of app.py.
+"""
+import os
+
+os.environ.setdefault('SERVE_MODE', 'asgi')
+
+from app import app  # noqa: E402
+from flora_common.asgi_bridge import asgi_app  # noqa: E402
+
+# Handler threads per worker; each runs one Flask request (decode + batched inference)
+application = asgi_app(
+    app,
+    threads=int(os.environ.get('ASGI_THREADS', 32)),
+    max_body=app.config.get('MAX_CONTENT_LENGTH')
+)
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """Collect concurrent inference requests into micro-batches.
+
+    Callers submit one item at a time; a single background thread drains the
+    queue until either ``max_batch_size`` items are waiting or ``max_wait_ms``
+    has passed since the first item arrived, runs ``batch_fn`` once over the
+    whole batch and hands each caller its own result.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10, max_queue_size=256,
+                 metrics_window=1024):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._batch_latencies = deque(maxlen=metrics_window)
+        self._queue_waits = deque(maxlen=metrics_window)
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_errors = 0
+
+    def start(self):
+        """Start the background batching thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+            self._thread.start()
+            logger.info(f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+                        f"max_wait_ms={self.max_wait * 1000:.1f})")
+
+    def stop(self, timeout=5.0):
+        """Stop the background thread after the current batch"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Submit one item and block until its batch has been processed"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the window closes"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            items = [entry[0] for entry in batch]
+            futures = [entry[1] for entry in batch]
+            started = time.perf_counter()
+
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error running batch of {len(items)}: {str(e)}")
+                self.total_errors += 1
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+            finished = time.perf_counter()
+            with self._lock:
+                self.total_batches += 1
+                self.total_items += len(items)
+                self._batch_sizes.append(len(items))
+                self._batch_latencies.append(finished - started)
+                self._queue_waits.extend(started - entry[2] for entry in batch)
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def stats(self):
+        """Per-batch latency and occupancy over the recent window"""
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            latencies = list(self._batch_latencies)
+            waits = list(self._queue_waits)
+            total_batches = self.total_batches
+            total_items = self.total_items
+
+        avg_size = sum(sizes) / len(sizes) if sizes else 0.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "queue_depth": self._queue.qsize(),
+            "total_batches": total_batches,
+            "total_items": total_items,
+            "total_errors": self.total_errors,
+            "avg_batch_size": round(avg_size, 3),
+            "avg_occupancy": round(avg_size / self.max_batch_size, 4),
+            "batch_latency_ms": {
+                "p50": round(self._percentile(latencies, 50) * 1000, 3),
+                "p95": round(self._percentile(latencies, 95) * 1000, 3),
+                "p99": round(self._percentile(latencies, 99) * 1000, 3)
+            },
+            "queue_wait_ms": {
+                "p50": round(self._percentile(waits, 50) * 1000, 3),
+                "p95": round(self._percentile(waits, 95) * 1000, 3)
+            }
+        }
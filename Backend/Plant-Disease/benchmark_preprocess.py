@@ -0,0 +1,124 @@
+"""Benchmark ImagePreprocessor against the torchvision transforms.Compose pipeline.
+
+Usage: python benchmark_preprocess.py [--repeats 20] [--image path/to/leaf.jpg ...]
+                                     [--checkpoint best_efficientnet_b0.pth]
+
+Without --image, synthetic phone-sized JPEGs and a PNG are generated in memory.
+With --checkpoint, also count the images whose top-1 class is the same under
+both pipelines; run it over real leaf photos before setting FAST_PREPROCESS=true.
+"""
+import argparse
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from inference_backends import build_efficientnet
+from preprocessing import ImagePreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+
+def reference_preprocess(transform, image_data):
+    """The original PlantDiseaseModel.preprocess_image path"""
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return transform(image).unsqueeze(0)
+
+
+def synthetic_image(width, height, fmt):
+    """A smooth gradient with noise so the encoder does real work"""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape).astype(np.float32)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+    buffer = io.BytesIO()
+    options = {'quality': 90} if fmt == 'JPEG' else {}
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def decoded_size(image_data, use_draft):
+    image = Image.open(io.BytesIO(image_data))
+    if use_draft:
+        image.draft('RGB', (128, 128))
+    image.load()
+    return image.size
+
+
+def load_model(checkpoint):
+    with open('categories.json', 'r') as f:
+        model = build_efficientnet(len(json.load(f)))
+    model.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    return model.eval()
+
+
+def time_it(fn, repeats):
+    fn()    # warm up
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--image', action='append', default=[])
+    parser.add_argument('--checkpoint', default=None, help='report top-1 agreement under this model')
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    transform = transforms.Compose([
+        transforms.Resize((128, 128)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD))
+    ])
+    preprocessor = ImagePreprocessor(size=(128, 128))
+
+    cases = []
+    for path in args.image:
+        with open(path, 'rb') as f:
+            cases.append((path, f.read()))
+    if not cases:
+        cases = [
+            ('12MP JPEG 4032x3024', synthetic_image(4032, 3024, 'JPEG')),
+            ('3MP JPEG 2048x1536', synthetic_image(2048, 1536, 'JPEG')),
+            ('1MP PNG 1024x1024', synthetic_image(1024, 1024, 'PNG')),
+        ]
+
+    print(f"{'image':<24} {'pipeline':<18} {'median ms':>10} {'max ms':>8} {'decoded':>11} {'decoded MB':>10}")
+    for name, image_data in cases:
+        for label, fn, use_draft in (
+            ('transforms.Compose', lambda: reference_preprocess(transform, image_data), False),
+            ('ImagePreprocessor', lambda: preprocessor.preprocess(image_data), True),
+        ):
+            median_ms, max_ms = time_it(fn, args.repeats)
+            width, height = decoded_size(image_data, use_draft)
+            print(f"{name:<24} {label:<18} {median_ms:>10.2f} {max_ms:>8.2f} "
+                  f"{f'{width}x{height}':>11} {width * height * 3 / 1e6:>10.1f}")
+
+        diff = (reference_preprocess(transform, image_data) - preprocessor.preprocess(image_data)).abs()
+        print(f"{name:<24} {'max |diff|':<18} {diff.max().item():>10.4f}   mean |diff| {diff.mean().item():.4f}")
+
+    if args.checkpoint:
+        model = load_model(args.checkpoint)
+        agree = 0
+        with torch.no_grad():
+            for _, image_data in cases:
+                reference = model(reference_preprocess(transform, image_data)).argmax(dim=1).item()
+                fast = model(preprocessor.preprocess(image_data)).argmax(dim=1).item()
+                agree += reference == fast
+        print(f"top-1 agreement: {agree}/{len(cases)} images")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Export the disease model to CPU inference backends and compare them.
+
+Export (artifacts land in --out, which INFERENCE_BACKEND reads from EXPORT_DIR):
+    python export_model.py export --backends torchscript dynamic_int8 static_int8 onnx \\
+        --calibration-dir samples/calibration
+
+Accuracy-vs-latency report on a held-out sample laid out as <category>/<image>:
+    python export_model.py report --sample-dir samples/heldout --tolerance 0.01 --json report.json
+
+The report always runs eager and recommends the fastest backend whose top-1
+accuracy (or agreement with eager, for unlabelled samples) stays within
+--tolerance of it. Images go through the serving transforms; pass
+--fast-preprocess (before the subcommand) when serving with FAST_PREPROCESS=true.
+The onnx backend needs the onnx and onnxruntime packages.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from inference_backends import (BACKENDS, EXPORT_FILES, build_efficientnet, example_input, load_backend,
+                                quantize_dynamic, quantize_static, to_torchscript)
+from preprocessing import IMAGENET_MEAN, IMAGENET_STD, ImagePreprocessor
+from shared_weights import load_safetensors
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def load_eager_model(checkpoint, categories_path):
+    with open(categories_path, 'r') as f:
+        categories = json.load(f)
+    model = build_efficientnet(len(categories))
+    if checkpoint.endswith('.safetensors'):
+        model.load_state_dict(load_safetensors(checkpoint))
+    else:
+        model.load_state_dict(torch.load(checkpoint, map_location='cpu'))
+    return model.eval(), categories
+
+
+def load_samples(sample_dir, categories, max_images, fast_preprocess=False):
+    """Preprocess images under sample_dir; labels come from the parent folder name when it is a category.
+
+    Uses the same pipeline as PlantDiseaseModel: its torchvision transforms, or
+    ImagePreprocessor when fast_preprocess mirrors FAST_PREPROCESS=true.
+    """
+    preprocessor = ImagePreprocessor(size=(128, 128))
+    transform = transforms.Compose([
+        transforms.Resize((128, 128)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD))
+    ])
+    paths = []
+    for root, _, files in os.walk(sample_dir):
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths = sorted(paths)[:max_images]
+    if not paths:
+        raise SystemExit(f"No images found under {sample_dir}")
+
+    batch = preprocessor.allocate(len(paths))
+    labels = []
+    for index, path in enumerate(paths):
+        if fast_preprocess:
+            with open(path, 'rb') as f:
+                preprocessor.preprocess_into(f.read(), batch[index])
+        else:
+            with Image.open(path) as image:
+                batch[index] = transform(image.convert('RGB'))
+        folder = os.path.basename(os.path.dirname(path))
+        labels.append(categories.index(folder) if folder in categories else -1)
+    return batch, torch.tensor(labels)
+
+
+def export(args):
+    model, _ = load_eager_model(args.checkpoint, args.categories)
+    os.makedirs(args.out, exist_ok=True)
+
+    for name in args.backends:
+        path = os.path.join(args.out, EXPORT_FILES[name])
+        started = time.perf_counter()
+
+        if name == 'torchscript':
+            torch.jit.save(to_torchscript(model), path)
+        elif name == 'dynamic_int8':
+            with torch.no_grad():
+                torch.jit.save(torch.jit.trace(quantize_dynamic(model), example_input()), path)
+        elif name == 'static_int8':
+            if not args.calibration_dir:
+                raise SystemExit("static_int8 needs --calibration-dir with representative leaf images")
+            samples, _ = load_samples(args.calibration_dir, [], args.calibration_images, args.fast_preprocess)
+            batches = torch.split(samples, args.batch_size)
+            with torch.no_grad():
+                torch.jit.save(torch.jit.trace(quantize_static(model, batches), example_input()), path)
+        elif name == 'onnx':
+            torch.onnx.export(
+                model, example_input(), path,
+                input_names=['input'], output_names=['logits'],
+                dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+                opset_version=17
+            )
+
+        print(f"{name:<13} -> {path} ({os.path.getsize(path) / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s)")
+
+
+def time_backend(backend, batch, repeats):
+    backend(batch)      # warm up
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend(batch)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def report(args):
+    torch.set_num_threads(args.threads)
+    model, categories = load_eager_model(args.checkpoint, args.categories)
+    samples, labels = load_samples(args.sample_dir, categories, args.max_images, args.fast_preprocess)
+    labelled = labels >= 0
+
+    # Eager is the baseline for the tolerance, so it always runs first
+    rows = []
+    reference = None
+    for name in ['eager'] + [name for name in args.backends if name != 'eager']:
+        try:
+            backend = load_backend(name, model, export_dir=args.out)
+        except Exception as e:
+            if name == 'eager':
+                raise SystemExit(f"eager baseline could not be loaded: {e}")
+            print(f"{name:<13} skipped: {e}")
+            continue
+
+        predictions = torch.cat([backend(chunk).argmax(dim=1) for chunk in torch.split(samples, args.batch_size)])
+        if reference is None:
+            reference = predictions
+        row = {
+            'backend': name,
+            'top1': float((predictions[labelled] == labels[labelled]).float().mean()) if labelled.any() else None,
+            'agreement_with_eager': float((predictions == reference).float().mean()),
+            'latency_ms_batch1': time_backend(backend, samples[:1], args.repeats),
+            f'latency_ms_batch{args.batch_size}': time_backend(backend, samples[:args.batch_size], args.repeats),
+        }
+        row['ms_per_image'] = row[f'latency_ms_batch{args.batch_size}'] / min(args.batch_size, len(samples))
+        rows.append(row)
+
+    baseline = rows[0]
+    metric = 'top1' if baseline['top1'] is not None else 'agreement_with_eager'
+    eligible = [row for row in rows if row[metric] >= baseline[metric] - args.tolerance]
+    best = min(eligible, key=lambda row: row['ms_per_image'])
+
+    print(f"\n{len(samples)} images, {int(labelled.sum())} labelled, {args.threads} threads, "
+          f"{'fast' if args.fast_preprocess else 'torchvision'} preprocessing, tolerance = {args.tolerance:.3f} on {metric}\n")
+    print(f"{'backend':<13} {'top1':>7} {'agree':>7} {'b=1 ms':>8} {f'b={args.batch_size} ms':>9} {'ms/img':>7}")
+    for row in rows:
+        top1 = f"{row['top1']:.4f}" if row['top1'] is not None else '   n/a'
+        marker = '  <- recommended' if row is best else ('' if row in eligible else '  (outside tolerance)')
+        print(f"{row['backend']:<13} {top1:>7} {row['agreement_with_eager']:>7.4f} {row['latency_ms_batch1']:>8.2f} "
+              f"{row[f'latency_ms_batch{args.batch_size}']:>9.2f} {row['ms_per_image']:>7.2f}{marker}")
+    print(f"\nINFERENCE_BACKEND={best['backend']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': rows, 'recommended': best['backend'], 'metric': metric,
+                       'tolerance': args.tolerance, 'images': len(samples),
+                       'preprocess': 'fast' if args.fast_preprocess else 'torchvision'}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default='best_efficientnet_b0.pth')
+    parser.add_argument('--categories', default='categories.json')
+    parser.add_argument('--out', default=os.environ.get('EXPORT_DIR', 'exported'))
+    parser.add_argument('--fast-preprocess', action='store_true',
+                        help='preprocess with ImagePreprocessor, as serving does with FAST_PREPROCESS=true')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='write backend artifacts')
+    export_parser.add_argument('--backends', nargs='+', choices=BACKENDS[1:], default=list(BACKENDS[1:]))
+    export_parser.add_argument('--calibration-dir')
+    export_parser.add_argument('--calibration-images', type=int, default=256)
+    export_parser.add_argument('--batch-size', type=int, default=16, help='calibration batch size')
+    export_parser.set_defaults(func=export)
+
+    report_parser = subparsers.add_parser('report', help='accuracy vs latency on a held-out sample')
+    report_parser.add_argument('--sample-dir', required=True)
+    report_parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    report_parser.add_argument('--max-images', type=int, default=1000)
+    report_parser.add_argument('--tolerance', type=float, default=0.01)
+    report_parser.add_argument('--batch-size', type=int, default=16)
+    report_parser.add_argument('--repeats', type=int, default=20)
+    report_parser.add_argument('--threads', type=int, default=torch.get_num_threads())
+    report_parser.add_argument('--json')
+    report_parser.set_defaults(func=report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""gunicorn settings for the Plant Disease API.
+
+By default (PRELOAD_MODELS=false) gunicorn binds at once and every worker
+loads the model on a background thread: /health/live answers immediately and
+/health/ready (and the inference routes) return 503 until the load finishes.
+The weights live in an mmap'd file (shared_weights.py), so workers still
+share their pages through the page cache.
+
+PRELOAD_MODELS=true loads the model once in the master, before gunicorn
+binds, and workers share everything copy-on-write after fork. That saves the
+per-worker Python objects at the cost of a cold start during which nothing
+answers, so it suits hosts that start once and scale by workers rather than
+by containers.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:7860')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Threads let concurrent /predict requests share one micro-batched forward pass
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true'
+
+# SERVE_MODE=asgi serves asgi.py from uvicorn workers: bodies are received on an event
+# loop and ASGI_THREADS handler threads run the Flask app (GUNICORN_THREADS is unused)
+SERVE_MODE = os.environ.get('SERVE_MODE', 'wsgi').lower()
+if SERVE_MODE == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'asgi:application'
+else:
+    wsgi_app = 'app:app'
+
+# Torch intra-op threads per worker; by default the cores are split between workers
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or max(1, multiprocessing.cpu_count() // workers)
+
+if preload_app:
+    # libgomp deadlocks in a child forked after a multi-threaded OpenMP region,
+    # so the master stays single-threaded and each worker raises it after fork
+    os.environ['OMP_NUM_THREADS'] = '1'
+    # A loader thread would not survive fork, so the master loads inline
+    os.environ['MODEL_LOAD_MODE'] = 'sync'
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def on_starting(server):
+    from flora_common import metrics
+
+    # Drop per-worker metric files left by a previous run of the service
+    metrics.clear_directory('plant-disease')
+
+
+def when_ready(server):
+    from flora_common import process_stats
+
+    os.environ['GUNICORN_MASTER_PID'] = str(os.getpid())
+    if preload_app:
+        # Objects created during preload are never collected; freezing them stops
+        # the collector from writing to (and un-sharing) their pages in every worker
+        gc.freeze()
+    logger.info(f"Master ready in {time.time() - process_stats.process_start_time():.2f}s "
+                f"(preload={preload_app}, memory={process_stats.memory_usage()})")
+
+
+def post_worker_init(worker):
+    from flora_common import process_stats
+    from app import model_loader
+
+    # Runs now when preloaded, otherwise once the background load finishes
+    model_loader.when_ready(lambda loaded: loaded.set_num_threads(INFERENCE_THREADS))
+    logger.info(f"Worker {worker.pid} ready in {time.time() - process_stats.process_start_time():.2f}s "
+                f"(threads={INFERENCE_THREADS}, memory={process_stats.memory_usage()})")
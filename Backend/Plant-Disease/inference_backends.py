@@ -0,0 +1,155 @@
+import logging
+import os
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'torchscript', 'dynamic_int8', 'static_int8', 'onnx')
+INPUT_SHAPE = (3, 128, 128)
+
+EXPORT_FILES = {
+    'torchscript': 'efficientnet_b0.torchscript.pt',
+    'dynamic_int8': 'efficientnet_b0.dynamic_int8.pt',
+    'static_int8': 'efficientnet_b0.static_int8.pt',
+    'onnx': 'efficientnet_b0.onnx',
+}
+
+
+def build_efficientnet(num_classes):
+    """EfficientNet-B0 with the classifier head used in training"""
+    model = models.efficientnet_b0(weights=None)
+    num_features = model.classifier[1].in_features
+    model.classifier = nn.Sequential(
+        nn.Dropout(p=0.6),
+        nn.Linear(num_features, num_classes)
+    )
+    return model
+
+
+def example_input(batch_size=1):
+    return torch.zeros((batch_size,) + INPUT_SHAPE, dtype=torch.float32)
+
+
+def to_torchscript(model):
+    """Trace and freeze an eager model; this is the form written to disk"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_input())
+        return torch.jit.freeze(traced)
+
+
+def optimize_torchscript(module):
+    # The fused CPU graph is not serializable, so this runs after every load
+    return torch.jit.optimize_for_inference(module)
+
+
+def quantize_dynamic(model):
+    """int8 weights for Linear layers, activations quantized on the fly"""
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration_batches):
+    """FX graph-mode post-training int8 quantization, calibrated on sample batches"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(model.eval(), qconfig_mapping, (example_input(),))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+class TorchBackend:
+    """Callable wrapper returning logits for an [N, 3, H, W] float batch"""
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.module(batch)
+
+    def eval(self):
+        return self
+
+
+class OnnxBackend:
+    """ONNX Runtime session, created per process because its thread pool does not survive fork"""
+
+    def __init__(self, path, threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("The onnx backend needs onnxruntime (pip install onnxruntime)") from e
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run export_model.py export --backends onnx")
+
+        self.name = 'onnx'
+        self.path = path
+        self.threads = threads
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        if self._session is None or self._pid != os.getpid():
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            self._session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+            self._pid = os.getpid()
+        return self._session
+
+    def __call__(self, batch):
+        session = self.session
+        logits = session.run(None, {session.get_inputs()[0].name: batch.detach().cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    def set_num_threads(self, threads):
+        self.threads = threads
+        self._session = None
+
+    def eval(self):
+        return self
+
+
+def load_backend(name, eager_model, export_dir='exported'):
+    """Wrap a loaded eager model in the requested inference backend.
+
+    ``static_int8`` and ``onnx`` need artifacts produced by export_model.py;
+    ``torchscript`` and ``dynamic_int8`` are loaded from export_dir when present
+    and otherwise built from the eager model at startup.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+
+    if name == 'eager':
+        return TorchBackend(name, eager_model.eval())
+
+    path = os.path.join(export_dir, EXPORT_FILES[name])
+    if name == 'onnx':
+        threads = torch.get_num_threads()
+        return OnnxBackend(path, threads=threads)
+
+    if os.path.exists(path):
+        logger.info(f"Loading {name} backend from {path}")
+        module = torch.jit.load(path, map_location='cpu').eval()
+        if name == 'torchscript':
+            module = optimize_torchscript(module)
+        return TorchBackend(name, module)
+
+    if name == 'torchscript':
+        return TorchBackend(name, optimize_torchscript(to_torchscript(eager_model)))
+    if name == 'dynamic_int8':
+        return TorchBackend(name, quantize_dynamic(eager_model))
+
+    raise FileNotFoundError(f"{path} not found; run export_model.py export --backends {name}")
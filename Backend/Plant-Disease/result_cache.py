@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Content-addressed cache of prediction results.
+
+    Keys are a BLAKE2b digest of the raw upload bytes, namespaced by the model
+    version so a new checkpoint never serves stale predictions. The first tier
+    is an in-process LRU; the optional second tier is a SQLite file (WAL mode)
+    shared by every gunicorn worker on the host. Every ``prune_every`` stores,
+    expired rows are deleted and the least recently used rows beyond
+    ``max_disk_entries`` are evicted, so the file stays bounded.
+    """
+
+    def __init__(self, model_version, max_entries=2048, db_path=None, ttl=None,
+                 max_disk_entries=100000, prune_every=256):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+        self._memory = OrderedDict()        # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._since_prune = 0
+
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                         'disk_evictions': 0}
+
+        if self.db_path:
+            self._connection()
+
+    @staticmethod
+    def digest(data):
+        """Fast content hash of the raw upload bytes"""
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def _connection(self):
+        """One SQLite connection per thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS results '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)')
+            # used_at orders LRU eviction; files written before it existed gain the column
+            if 'used_at' not in [row[1] for row in conn.execute('PRAGMA table_info(results)')]:
+                conn.execute('ALTER TABLE results ADD COLUMN used_at REAL NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _key(self, namespace, key):
+        return f"{self.model_version}:{namespace}:{key}"
+
+    def _fresh(self, stored_at):
+        return self.ttl is None or time.time() - stored_at < self.ttl
+
+    def _count(self, name, namespace='result'):
+        # Counters describe prediction results only
+        if namespace != 'result':
+            return
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key, stored_at, value):
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get(self, namespace, key):
+        full_key = self._key(namespace, key)
+        with self._lock:
+            entry = self._memory.get(full_key)
+            if entry is not None and self._fresh(entry[0]):
+                self._memory.move_to_end(full_key)
+                hit = True
+            else:
+                hit = False
+        if hit:
+            self._count('memory_hits', namespace)
+            return dict(entry[1])
+
+        if self.db_path:
+            try:
+                conn = self._connection()
+                row = conn.execute('SELECT value, stored_at FROM results WHERE key = ?', (full_key,)).fetchone()
+                if row is not None and self._fresh(row[1]):
+                    # Only disk hits touch the row; memory hits are served before reaching here
+                    conn.execute('UPDATE results SET used_at = ? WHERE key = ?', (time.time(), full_key))
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Result cache read failed: {e}")
+                row = None
+            if row is not None and self._fresh(row[1]):
+                value = json.loads(row[0])
+                self._remember(full_key, row[1], value)
+                self._count('disk_hits', namespace)
+                return dict(value)
+
+        self._count('misses', namespace)
+        return None
+
+    def put(self, namespace, key, value):
+        full_key = self._key(namespace, key)
+        stored_at = time.time()
+        value = dict(value)
+        self._remember(full_key, stored_at, value)
+        self._count('stores', namespace)
+
+        if self.db_path:
+            try:
+                self._connection().execute(
+                    'INSERT OR REPLACE INTO results (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)',
+                    (full_key, json.dumps(value), stored_at, stored_at)
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Result cache write failed: {e}")
+                return
+            with self._lock:
+                self._since_prune += 1
+                prune = self._since_prune >= self.prune_every
+                if prune:
+                    self._since_prune = 0
+            if prune:
+                self.prune()
+
+    def prune(self):
+        """Delete expired rows, then the least recently used ones beyond max_disk_entries"""
+        if not self.db_path:
+            return
+        try:
+            conn = self._connection()
+            evicted = 0
+            if self.ttl is not None:
+                evicted += conn.execute('DELETE FROM results WHERE stored_at < ?', (time.time() - self.ttl,)).rowcount
+            excess = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                evicted += conn.execute(
+                    'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used_at LIMIT ?)', (excess,)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Result cache prune failed: {e}")
+            return
+        with self._lock:
+            self.counters['disk_evictions'] += evicted
+
+    def get_result(self, digest):
+        return self.get('result', digest)
+
+    def put_result(self, digest, result):
+        self.put('result', digest, result)
+
+    def get_upload(self, user_id, digest):
+        """Storage location of an image this user already uploaded"""
+        return self.get('upload', f"{user_id}:{digest}")
+
+    def put_upload(self, user_id, digest, path, url):
+        self.put('upload', f"{user_id}:{digest}", {'path': path, 'url': url})
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, size=len(self._memory), max_entries=self.max_entries)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['disk_tier'] = bool(self.db_path)
+        stats['max_disk_entries'] = self.max_disk_entries if self.db_path else None
+        stats['model_version'] = self.model_version
+        return stats
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import os
@@ -5,19 +6,59 @@ import numpy as np
 from PIL import Image
 import torch
 import torch.nn.functional as F
-from torchvision import transforms, models
-import torch.nn as nn
+from torchvision import transforms
 import io
+from concurrent.futures import ThreadPoolExecutor
+from preprocessing import ImagePreprocessor
+from inference_backends import build_efficientnet, load_backend
+from shared_weights import assign_weights, load_safetensors, mmap_state_dict
+from flora_common import metrics
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# legacy (default): the original status + confidence; status: also the top-1 class, crop and disease;
+# top_k: also the k best classes; full: also every class probability
+OUTPUT_MODES = ('legacy', 'status', 'top_k', 'full')
+
+HEALTHY_ADVICE = {
+    'treatment': 'No treatment needed. Your plant is healthy!',
+    'prevention': 'Continue with current care routine. Monitor regularly.',
+    'advice': 'Maintain proper watering, sunlight, and nutrient levels.'
+}
+DISEASED_ADVICE = {
+    'treatment': 'Apply appropriate fungicide or pesticide. Isolate plant if contagious. Remove affected leaves.',
+    'prevention': 'Improve air circulation. Avoid overwatering. Ensure proper spacing between plants.',
+    'advice': 'Consult with agricultural expert for specific treatment.'
+}
+
+def describe_category(category):
+    """Split a 'Crop___Disease' label into display fields"""
+    crop, _, disease = category.partition('___')
+    is_healthy = 'healthy' in disease.lower()
+    return {
+        'class': category,
+        'crop': crop.replace('_', ' ').strip(),
+        'disease': 'No Disease' if is_healthy else disease.replace('_', ' ').strip(),
+        'is_healthy': is_healthy
+    }
+
 class PlantDiseaseModel:
     def __init__(self):
         self.model = None
         self.device = None
         self.categories = None
         self.transform = None
+        self.preprocessor = None
+        self.model_version = None
+        self.backend_name = None
+        self.weights_storage = None
+        self.model_path = os.environ.get('MODEL_CHECKPOINT', 'best_efficientnet_b0.pth')
+        self.output_mode = os.environ.get('PREDICTION_OUTPUT', 'legacy').lower()
+        self.top_k = int(os.environ.get('PREDICTION_TOP_K', 3))
+        self.class_info = None
+        self.class_advice = None
+        self.warm = False
 
     def init(self):
         try:
@@ -31,6 +72,17 @@ class PlantDiseaseModel:
             logger.info("🔍 Categories order in score.py:")
             for i, cat in enumerate(self.categories):
                 logger.info(f"   {i}: {cat}")
+
+            # Per-class lookup built once instead of parsing the label per request
+            self.class_info = [describe_category(cat) for cat in self.categories]
+            self.class_advice = {
+                info['class']: HEALTHY_ADVICE if info['is_healthy'] else DISEASED_ADVICE
+                for info in self.class_info
+            }
+            if self.output_mode not in OUTPUT_MODES:
+                logger.warning(f"⚠️ Unknown PREDICTION_OUTPUT {self.output_mode}, using legacy")
+                self.output_mode = 'legacy'
+            self.top_k = max(1, min(self.top_k, len(self.categories)))
             
             # Define transforms
             self.transform = transforms.Compose([
@@ -39,9 +91,18 @@ class PlantDiseaseModel:
                 transforms.Normalize(mean=[0.485, 0.456, 0.406], 
                                      std=[0.229, 0.224, 0.225])
             ])
+
+            # Reduced-size decode + fused normalize. Off by default: draft decoding shifts pixels away from
+            # self.transform, so check top-1 agreement (benchmark_preprocess.py --checkpoint) before enabling
+            if os.environ.get('FAST_PREPROCESS', 'false').lower() == 'true':
+                self.preprocessor = ImagePreprocessor(
+                    size=(128, 128),
+                    max_bytes=int(os.environ.get('MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+                )
             
             # Load model
             self.model = self._load_model()
+            self.model_version = f"{self._model_version(self.model_path)}-{self.backend_name}"
             
             logger.info("Model initialized successfully")
             return True
@@ -52,20 +113,42 @@ class PlantDiseaseModel:
 
     def _load_model(self):
         try:
-            model_path = "best_efficientnet_b0.pth"
+            model_path = self.model_path
             logger.info(f"Loading model from: {model_path}")
             
-            model = models.efficientnet_b0(weights=None)
-            num_features = model.classifier[1].in_features
-            model.classifier = nn.Sequential(
-                nn.Dropout(p=0.6),
-                nn.Linear(num_features, len(self.categories))
-            )
-
-            state_dict = torch.load(model_path, map_location=self.device)
-            model.load_state_dict(state_dict)
+            model = build_efficientnet(len(self.categories))
+
+            # On CPU the weights are views into an mmap'd file, so workers share the pages
+            self.weights_storage = 'heap'
+            if self.device.type == 'cpu' and os.environ.get('MMAP_WEIGHTS', 'true').lower() == 'true':
+                try:
+                    assign_weights(model, mmap_state_dict(model_path, os.environ.get('WEIGHTS_CACHE_DIR', 'exported')))
+                    self.weights_storage = 'mmap'
+                except Exception as e:
+                    logger.warning(f"⚠️ mmap weights unavailable, loading into memory: {str(e)}")
+
+            if self.weights_storage == 'heap':
+                if model_path.endswith('.safetensors'):
+                    state_dict = load_safetensors(model_path)
+                else:
+                    state_dict = torch.load(model_path, map_location=self.device)
+                model.load_state_dict(state_dict)
             model.to(self.device)
             model.eval()
+
+            # Optional CPU inference backend: eager, torchscript, dynamic_int8, static_int8, onnx
+            backend_name = os.environ.get('INFERENCE_BACKEND', 'eager').lower()
+            if self.device.type != 'cpu' and backend_name != 'eager':
+                logger.warning(f"⚠️ {backend_name} backend is CPU-only; using eager on {self.device}")
+                backend_name = 'eager'
+            try:
+                backend = load_backend(backend_name, model, export_dir=os.environ.get('EXPORT_DIR', 'exported'))
+            except Exception as e:
+                logger.error(f"Error loading {backend_name} backend, falling back to eager: {str(e)}")
+                backend = load_backend('eager', model)
+            self.backend_name = backend.name
+            model = backend
+            logger.info(f"Inference backend: {self.backend_name} (weights: {self.weights_storage})")
             
             logger.info("EfficientNet-B0 model loaded successfully")
             return model
@@ -74,53 +157,156 @@ class PlantDiseaseModel:
             logger.error(f"Error loading model: {str(e)}")
             raise
 
+    def set_num_threads(self, threads):
+        """Intra-op threads for this process; call after fork when the model was preloaded"""
+        torch.set_num_threads(threads)
+        if hasattr(self.model, 'set_num_threads'):
+            self.model.set_num_threads(threads)
+
+    def _model_version(self, model_path):
+        """Short digest of the checkpoint and label order, used to namespace cached results"""
+        digest = hashlib.blake2b(digest_size=8)
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(json.dumps(self.categories).encode('utf-8'))
+        return digest.hexdigest()
+
     def preprocess_image(self, image_data):
         try:
-            if isinstance(image_data, bytes):
-                image = Image.open(io.BytesIO(image_data))
-            else:
-                image = Image.open(image_data)
-            
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            if self.preprocessor is not None:
+                return self.preprocessor.preprocess(image_data).to(self.device)
+
+            with metrics.stage('decode'):
+                if isinstance(image_data, bytes):
+                    image = Image.open(io.BytesIO(image_data))
+                else:
+                    image = Image.open(image_data)
+                
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
             
-            image_tensor = self.transform(image).unsqueeze(0)
+            with metrics.stage('preprocess'):
+                image_tensor = self.transform(image).unsqueeze(0)
             return image_tensor.to(self.device)
             
         except Exception as e:
             logger.error(f"Error in image preprocessing: {str(e)}")
             raise
 
-    def run(self, image_data):
+    def preprocess_many(self, images, max_workers=4):
+        """Decode and preprocess several images in parallel.
+
+        Returns one entry per input: a tensor, or the exception raised while
+        decoding that image so callers can report it per item. With the fast
+        preprocessor every image is written into one preallocated batch buffer.
+        """
+        buffer = self.preprocessor.allocate(len(images)) if self.preprocessor is not None else None
+
+        def _safe_preprocess(indexed_image):
+            index, image_data = indexed_image
+            try:
+                if buffer is not None:
+                    self.preprocessor.preprocess_into(image_data, buffer[index])
+                    return buffer[index:index + 1]
+                return self.preprocess_image(image_data)
+            except Exception as e:
+                return e
+
+        if len(images) <= 1 or max_workers <= 1:
+            return [_safe_preprocess(item) for item in enumerate(images)]
+
+        # PIL releases the GIL while decoding, so threads scale here
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_safe_preprocess, enumerate(images)))
+
+    def run_batch(self, images, chunk_size=32, max_workers=4):
+        """Predict many images, returning one result (or error) dict per input"""
+        tensors = self.preprocess_many(images, max_workers=max_workers)
+        results = [None] * len(images)
+
+        valid = []
+        for index, tensor in enumerate(tensors):
+            if isinstance(tensor, Exception):
+                results[index] = {"error": f"Could not decode image: {str(tensor)}"}
+            else:
+                valid.append((index, tensor))
+
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                chunk_results = self.predict_batch([tensor for _, tensor in chunk])
+            except Exception as e:
+                logger.error(f"Error during batch inference: {str(e)}")
+                chunk_results = [{"error": str(e)} for _ in chunk]
+            for (index, _), result in zip(chunk, chunk_results):
+                results[index] = result
+
+        return results
+
+    def predict_batch(self, image_tensors):
+        """Run one forward pass over a list of preprocessed image tensors"""
+        batch = torch.cat([t if t.dim() == 4 else t.unsqueeze(0) for t in image_tensors], dim=0)
+        batch = batch.to(self.device)
+
+        k = self.top_k if self.output_mode in ('top_k', 'full') else 1
+        with torch.no_grad():
+            with metrics.stage('forward'):
+                output = self.model(batch)              # logits
+            with metrics.stage('softmax'):
+                probs = F.softmax(output, dim=1)        # softmax → probabilities
+                top_probs, top_indices = probs.topk(k, dim=1)
+
+                # One device-to-host copy per tensor for the whole batch
+                top_probs, top_indices = top_probs.tolist(), top_indices.tolist()
+                distributions = probs.tolist() if self.output_mode == 'full' else [None] * len(top_probs)
+
+        if not self.warm:
+            # The first forward pass pays for lazy allocations and kernel selection
+            self.warm = True
+            metrics.MODEL_WARM.set(1, model='plant-disease-model')
+
+        return [self._format_result(indices, probabilities, distribution)
+                for indices, probabilities, distribution in zip(top_indices, top_probs, distributions)]
+
+    def _format_result(self, top_indices, top_probs, distribution=None):
+        info = self.class_info[top_indices[0]]
+        confidence = top_probs[0]
+
+        logger.debug(f"Prediction class: {info['class']} ({confidence:.4f})")
+
+        result = {
+            "status": "healthy" if info['is_healthy'] else "diseased",
+            "confidence": round(float(confidence), 4)
+        }
+        if self.output_mode == 'legacy':
+            return result
+
+        result.update({"class": info['class'], "crop": info['crop'], "disease": info['disease']})
+        if self.output_mode != 'status':
+            result["top_k"] = [dict(self.class_info[index], probability=round(float(probability), 4))
+                               for index, probability in zip(top_indices, top_probs)]
+        if distribution is not None:
+            result["probabilities"] = {category: round(float(probability), 4)
+                                       for category, probability in zip(self.categories, distribution)}
+        return result
+
+    def advice_for(self, result):
+        """Treatment, prevention and advice text for a prediction result"""
+        advice = self.class_advice.get(result.get('class')) if self.class_advice else None
+        if advice is None:
+            advice = HEALTHY_ADVICE if result.get('status', '').lower() == 'healthy' else DISEASED_ADVICE
+        return advice
+
+    def run(self, image_data, scheduler=None):
+        """Predict a single image, optionally through a BatchScheduler"""
         try:
             input_tensor = self.preprocess_image(image_data)
-            
-            self.model.eval()
-            with torch.no_grad():
-                output = self.model(input_tensor)           # logits
-                probs = F.softmax(output, dim=1)            # softmax → probabilities
-                
-                prediction_idx = probs.argmax(dim=1).item()
-                prediction_class = self.categories[prediction_idx]
-                confidence = float(probs[0][prediction_idx].item())
-
-                if "healthy" in prediction_class.lower():
-                    status = "healthy"
-                else:
-                    status = "diseased"
 
-                logger.info(f"Status: {status}")
-                logger.info(f"Prediction class: {prediction_class}")
-                logger.info(f"Confidence: {confidence:.4f}")
+            if scheduler is not None:
+                return scheduler.predict(input_tensor)
+            return self.predict_batch([input_tensor])[0]
 
-                # Final output
-                result = {
-                    "status": status,
-                    "confidence": round(confidence, 4)
-                }
-                
-                return result
-                
         except Exception as e:
             logger.error(f"Error during inference: {str(e)}")
             return {"error": str(e)}
@@ -0,0 +1,133 @@
+"""mmap'd model weights in the safetensors layout.
+
+A .pth checkpoint is converted once into a .safetensors file (cached under
+WEIGHTS_CACHE_DIR, keyed by the checkpoint digest) and then mapped with
+torch.from_file, so loading is a page-table operation and every process on
+the host shares the same page-cache pages. A .safetensors checkpoint is
+mapped directly. Convert at image build time to skip the first-start cost:
+
+    python shared_weights.py best_efficientnet_b0.pth exported
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Header is padded so tensor data starts on a cache-line boundary
+ALIGNMENT = 64
+
+DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+    'U8': torch.uint8, 'BOOL': torch.bool,
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+
+
+def checkpoint_digest(path):
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_safetensors(state_dict, path):
+    """Write a state dict as a .safetensors file.
+
+    Tensors are laid out widest dtype first so each one is aligned to its
+    element size. The file is written under a temporary name and renamed into
+    place, so workers racing to build the same cache never see a partial file.
+    """
+    tensors = sorted(state_dict.items(), key=lambda item: (-item[1].element_size(), item[0]))
+    header = {'__metadata__': {'format': 'pt'}}
+    offset = 0
+    for name, tensor in tensors:
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': DTYPE_NAMES[tensor.dtype], 'shape': list(tensor.shape),
+                        'data_offsets': [offset, offset + nbytes]}
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % ALIGNMENT)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for _, tensor in tensors:
+            f.write(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_safetensors(path):
+    """Map a .safetensors file and return tensors that are views into it.
+
+    The mapping is private and file-backed: pages come from the page cache,
+    so every process mapping the same file shares them until one writes.
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    data_start = 8 + header_size
+
+    flat = torch.from_file(path, shared=False, size=os.path.getsize(path), dtype=torch.uint8)
+    state_dict = OrderedDict()
+    for name, entry in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = DTYPES[entry['dtype']]
+        begin, end = (data_start + offset for offset in entry['data_offsets'])
+        chunk = flat[begin:end]
+        if begin % torch.empty(0, dtype=dtype).element_size():
+            # Files written by other tools may not align every tensor
+            chunk = chunk.clone()
+        state_dict[name] = chunk.view(dtype).view(entry['shape'])
+    return state_dict
+
+
+def mmap_state_dict(checkpoint_path, cache_dir):
+    """State dict backed by an mmap'd safetensors file, converted on first use"""
+    if checkpoint_path.endswith('.safetensors'):
+        return load_safetensors(checkpoint_path)
+
+    stem = os.path.splitext(os.path.basename(checkpoint_path))[0]
+    path = os.path.join(cache_dir, f"{stem}.{checkpoint_digest(checkpoint_path)}.safetensors")
+    if not os.path.exists(path):
+        logger.info(f"Converting {checkpoint_path} to {path}")
+        os.makedirs(cache_dir, exist_ok=True)
+        write_safetensors(torch.load(checkpoint_path, map_location='cpu'), path)
+
+    return load_safetensors(path)
+
+
+def assign_weights(model, state_dict):
+    """Point every parameter and buffer at the given tensors without copying"""
+    targets = model.state_dict(keep_vars=True)
+    missing = set(targets) - set(state_dict)
+    unexpected = set(state_dict) - set(targets)
+    if missing or unexpected:
+        raise RuntimeError(f"Weights do not match model: missing={sorted(missing)}, unexpected={sorted(unexpected)}")
+
+    with torch.no_grad():
+        for name, target in targets.items():
+            value = state_dict[name]
+            if value.shape != target.shape:
+                raise RuntimeError(f"Shape mismatch for {name}: {tuple(value.shape)} vs {tuple(target.shape)}")
+            target.data = value
+    return model
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python shared_weights.py CHECKPOINT [CACHE_DIR]")
+    logging.basicConfig(level=logging.INFO)
+    weights = mmap_state_dict(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'exported')
+    print(f"{len(weights)} tensors, {sum(t.numel() * t.element_size() for t in weights.values()) / 1e6:.1f} MB")
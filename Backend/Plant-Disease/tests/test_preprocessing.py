@@ -0,0 +1,36 @@
+import io
+import warnings
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from preprocessing import ImagePreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+
+def encoded(fmt, size=(400, 300)):
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_preprocess_into_a_batch_buffer_raises_no_warning():
+    preprocessor = ImagePreprocessor()
+    buffer = preprocessor.allocate(2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        preprocessor.preprocess_into(encoded('JPEG'), buffer[1])
+    assert torch.isfinite(buffer[1]).all()
+
+
+def test_png_matches_the_torchvision_pipeline():
+    transform = transforms.Compose([
+        transforms.Resize((128, 128)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD))
+    ])
+    image_data = encoded('PNG')
+    expected = transform(Image.open(io.BytesIO(image_data)).convert('RGB')).unsqueeze(0)
+    torch.testing.assert_close(ImagePreprocessor().preprocess(image_data), expected, atol=1e-5, rtol=0)
@@ -0,0 +1,31 @@
+import sqlite3
+import time
+
+from result_cache import ResultCache
+
+
+def rows(path):
+    with sqlite3.connect(path) as conn:
+        return [key.split(':')[-1] for key, in conn.execute('SELECT key FROM results ORDER BY key')]
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResultCache('v1', max_entries=1, db_path=path, max_disk_entries=3, prune_every=1)
+    for key in 'abc':
+        cache.put_result(key, {'label': key})
+        time.sleep(0.01)
+    assert cache.get_result('a') == {'label': 'a'}     # from disk (memory holds only 'c'), so 'a' is now recent
+    cache.put_result('d', {'label': 'd'})
+    assert rows(path) == ['a', 'c', 'd']
+    assert cache.stats()['disk_evictions'] == 1
+
+
+def test_expired_rows_are_deleted(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResultCache('v1', db_path=path, ttl=60, prune_every=1)
+    cache.put_result('old', {'label': 'old'})
+    with sqlite3.connect(path) as conn:
+        conn.execute('UPDATE results SET stored_at = stored_at - 120')
+    cache.put_result('new', {'label': 'new'})
+    assert rows(path) == ['new']
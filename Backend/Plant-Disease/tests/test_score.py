@@ -0,0 +1,28 @@
+from score import PlantDiseaseModel, describe_category
+
+CATEGORIES = ['Tomato___Late_blight', 'Tomato___healthy', 'Potato___Early_blight']
+
+
+def model_with_output(monkeypatch, mode=None):
+    if mode is None:
+        monkeypatch.delenv('PREDICTION_OUTPUT', raising=False)
+    else:
+        monkeypatch.setenv('PREDICTION_OUTPUT', mode)
+    model = PlantDiseaseModel()
+    model.categories = CATEGORIES
+    model.class_info = [describe_category(category) for category in CATEGORIES]
+    return model
+
+
+def test_legacy_shape_is_the_default(monkeypatch):
+    model = model_with_output(monkeypatch)
+    assert model.output_mode == 'legacy'
+    assert model._format_result([0], [0.91234]) == {'status': 'diseased', 'confidence': 0.9123}
+
+
+def test_top_k_is_opt_in(monkeypatch):
+    model = model_with_output(monkeypatch, 'top_k')
+    result = model._format_result([1, 0], [0.7, 0.2])
+    assert result['status'] == 'healthy'
+    assert result['disease'] == 'No Disease'
+    assert [entry['class'] for entry in result['top_k']] == ['Tomato___healthy', 'Tomato___Late_blight']
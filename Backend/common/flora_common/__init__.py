@@ -0,0 +1,5 @@
+"""Infrastructure shared by the Flora backend services.
+
+Installed into every service image (see the service Dockerfiles); for local
+development run ``pip install -e Backend/common``.
+"""
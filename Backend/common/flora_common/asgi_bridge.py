@@ -0,0 +1,185 @@
+"""ASGI serving mode for the Flask inference services.
+
+asgi_app() runs the existing Flask app behind an ASGI server (uvicorn workers
+under gunicorn, SERVE_MODE=asgi) through a2wsgi's WSGIMiddleware, so routes
+and response shapes are exactly those of the sync deployment. BufferedBody
+receives each request body on the event loop first, so a Flask handler
+thread (ASGI_THREADS) is only taken once a complete request has arrived and
+a slow client upload never occupies one.
+
+AsyncSupabaseClient and BackgroundLoop move Supabase I/O off threads: uploads
+and inserts run as coroutines on one event loop per worker, so any number of
+them can be in flight without a thread each.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from . import metrics
+from .supabase_client import body_size
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = metrics.REGISTRY.gauge('asgi_requests_in_flight', 'Requests received but not yet answered',
+                                   (), mode='sum')
+
+# Bodies larger than this are spooled to disk while they are received, as werkzeug does
+SPOOL_BYTES = 512 * 1024
+# Size of the chunks a buffered body is replayed to the WSGI app in
+REPLAY_CHUNK = 64 * 1024
+
+
+class BackgroundLoop:
+    """One asyncio event loop on a daemon thread per worker process"""
+
+    def __init__(self, name='supabase-io'):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """This process's loop, started on first use (and again in a forked worker)"""
+        pid = os.getpid()
+        if self._loop is None or self._pid != pid:
+            with self._lock:
+                if self._loop is None or self._pid != pid:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                    self._loop, self._pid = loop, pid
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule ``coro`` and return a concurrent.futures.Future of its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run ``coro`` on the loop and wait for its result from a handler thread"""
+        if threading.current_thread().name == self.name:
+            coro.close()
+            raise RuntimeError(f"{self.name}: run() would block its own event loop")
+        return self.submit(coro).result(timeout)
+
+
+class AsyncSupabaseClient:
+    """httpx.AsyncClient twin of a SupabaseClient.
+
+    Same base URL, key and pool size, and the same circuit breakers, adaptive
+    timeouts and metrics, so sync and async calls share one view of Supabase.
+    Use it from a single event loop (e.g. a BackgroundLoop).
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._http = None
+        self._pid = None
+
+    @property
+    def http(self):
+        if self._http is None or self._pid != os.getpid():
+            import httpx
+
+            # Like the requests pool, connections past pool_size are opened (not kept) rather than waited for
+            self._http = httpx.AsyncClient(
+                headers={'apikey': self.client.key, 'Authorization': f'Bearer {self.client.key}'},
+                timeout=self.client.timeout,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.client.pool_size)
+            )
+            self._pid = os.getpid()
+        return self._http
+
+    async def request(self, method, path, timeout=None, **kwargs):
+        """Send a request to ``{SUPABASE_URL}/{path}``; bodies go in ``content=`` or ``json=``"""
+        url, api = self.client.resolve(path)
+        breaker, timeout = self.client.admit(api, timeout, body_size(kwargs))
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, timeout=timeout, **kwargs)
+            outcome = f"{response.status_code // 100}xx"
+            return response
+        finally:
+            self.client.finish(breaker, method, api, outcome, time.perf_counter() - started)
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def patch(self, path, **kwargs):
+        return await self.request('PATCH', path, **kwargs)
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class BufferedBody:
+    """ASGI middleware that receives the whole request body before calling ``app``.
+
+    a2wsgi streams the body to the WSGI thread as it arrives, so a slow upload
+    would hold a handler thread for its whole transfer. Bodies are spooled to
+    disk past SPOOL_BYTES and rejected with 413 past ``max_body``.
+    """
+
+    def __init__(self, app, max_body=None):
+        self.app = app
+        self.max_body = max_body
+        self._in_flight = 0                 # only touched from the event loop
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        self._in_flight += 1
+        IN_FLIGHT.set(self._in_flight)
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        try:
+            size = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if self.max_body is not None and size > self.max_body:
+                    await send({'type': 'http.response.start', 'status': 413,
+                                'headers': [(b'content-type', b'application/json')]})
+                    await send({'type': 'http.response.body', 'body': b'{"error": "Upload too large"}'})
+                    return
+                body.write(chunk)
+                more_body = message.get('more_body', False)
+            body.seek(0)
+
+            remaining = size
+
+            async def replay():
+                nonlocal remaining
+                if remaining < 0:
+                    return await receive()      # body already replayed; wait for the disconnect
+                chunk = body.read(REPLAY_CHUNK)
+                remaining -= len(chunk)
+                more_body = remaining > 0
+                if not more_body:
+                    remaining = -1
+                return {'type': 'http.request', 'body': chunk, 'more_body': more_body}
+
+            await self.app(scope, replay, send)
+        finally:
+            body.close()
+            self._in_flight -= 1
+            IN_FLIGHT.set(self._in_flight)
+
+
+def asgi_app(wsgi_app, threads=32, max_body=None):
+    """ASGI application serving ``wsgi_app`` from ``threads`` handler threads"""
+    from a2wsgi import WSGIMiddleware
+
+    return BufferedBody(WSGIMiddleware(wsgi_app, workers=threads), max_body=max_body)
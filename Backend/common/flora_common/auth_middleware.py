@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import jwt
+from flask import jsonify, request
+
+
+class TokenVerifier:
+    """HS256 JWT verification with a bounded cache of verified tokens.
+
+    Entries are keyed by a digest of the token and expire at the token's own
+    ``exp`` (capped at ``max_ttl``), so each token's signature is checked once
+    per worker instead of once per request. Tokens that fail verification are
+    never cached. The key bytes are prepared once instead of per decode.
+    """
+
+    def __init__(self, secret, algorithms=('HS256',), max_entries=10000, max_ttl=300.0, enabled=True):
+        self.key = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.algorithms = list(algorithms)
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()       # token digest -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.verify_seconds = 0.0
+        self.max_verify_seconds = 0.0
+
+    @staticmethod
+    def digest(token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def _decode(self, token):
+        started = time.perf_counter()
+        try:
+            return jwt.decode(token, self.key, algorithms=self.algorithms)
+        except jwt.PyJWTError:
+            return None
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.verify_seconds += elapsed
+                self.max_verify_seconds = max(self.max_verify_seconds, elapsed)
+
+    def verify(self, token):
+        """Return the token's payload, or None if it is invalid or expired"""
+        if not self.enabled:
+            payload = self._decode(token)
+            with self._lock:
+                self.misses += 1
+                if payload is None:
+                    self.failures += 1
+            return payload
+
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        payload = self._decode(token)
+        if payload is None:
+            with self._lock:
+                self.failures += 1
+            return None
+
+        expires_at = now + self.max_ttl
+        if isinstance(payload.get('exp'), (int, float)):
+            expires_at = min(expires_at, payload['exp'])
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return payload
+
+    def require_auth(self, f):
+        """Decorator to protect routes with JWT authentication"""
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            auth_header = request.headers.get('Authorization')
+
+            if not auth_header:
+                return jsonify({'error': 'No authorization token provided'}), 401
+
+            try:
+                token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
+                payload = self.verify(token)
+
+                if not payload:
+                    return jsonify({'error': 'Invalid or expired token'}), 401
+
+                request.user_id = payload['user_id']
+                request.user_email = payload['email']
+
+            except Exception:
+                return jsonify({'error': 'Invalid authorization header'}), 401
+
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_ttl_seconds': self.max_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'failures': self.failures,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'verifications': self.misses,
+                'verify_ms_total': round(self.verify_seconds * 1000, 3),
+                'verify_ms_avg': round(self.verify_seconds * 1000 / self.misses, 4) if self.misses else 0.0,
+                'verify_ms_max': round(self.max_verify_seconds * 1000, 4)
+            }
@@ -0,0 +1,192 @@
+"""Coalesce single-row PostgREST inserts into JSON-array bulk inserts.
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class RowInsertError(Exception):
+    """Raised on a row's Future when that row (not its batch) was rejected"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BulkInsertBuffer:
+    """Accumulate rows per table and flush each table as one POST.
+
+    A table is flushed when it holds ``max_rows`` rows or its oldest row has
+    waited ``max_delay`` seconds. PostgREST inserts a JSON array in a single
+    transaction, so when a batch is rejected with a 4xx the batch is bisected
+    to find the offending rows; every caller's Future gets its own row's
+    outcome. Network errors and 5xx responses fail the whole batch.
+    """
+
+    def __init__(self, client, max_rows=100, max_delay=1.0, name='bulk-writer'):
+        self.client = client
+        self.max_rows = max(1, int(max_rows))
+        self.max_delay = max(0.0, float(max_delay))
+        self.name = name
+
+        self._pending = {}                  # table -> list of (row, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self.counters = {'rows': 0, 'flushes': 0, 'posts': 0, 'failed_rows': 0, 'bisections': 0}
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closed = False
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, table, row):
+        """Queue one row for ``table`` and return a Future resolving to the inserted row"""
+        future = Future()
+        self.start()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            rows = self._pending.setdefault(table, [])
+            rows.append((row, future, time.monotonic()))
+            if len(rows) >= self.max_rows:
+                self._cond.notify()
+        return future
+
+    def insert(self, table, row, timeout=None):
+        """Blocking helper: queue a row and return True if it was inserted"""
+        try:
+            self.add(table, row).result(timeout=timeout)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Insert into {table} failed: {e}")
+            return False
+
+    def flush(self):
+        """Flush every table now"""
+        with self._cond:
+            batches = self._pending
+            self._pending = {}
+        for table, entries in batches.items():
+            self._flush_table(table, entries)
+
+    def close(self):
+        """Flush remaining rows and stop the background thread (registered with atexit)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            pending = sum(len(entries) for entries in self._pending.values())
+            counters = dict(self.counters)
+        counters['pending_rows'] = pending
+        counters['avg_rows_per_flush'] = round(counters['rows'] / counters['flushes'], 2) if counters['flushes'] else 0.0
+        return counters
+
+    def _due(self, now):
+        """Tables ready to flush, and seconds until the next one becomes due"""
+        due = []
+        wait = self.max_delay
+        for table, entries in self._pending.items():
+            age = now - entries[0][2]
+            if len(entries) >= self.max_rows or age >= self.max_delay:
+                due.append(table)
+            else:
+                wait = min(wait, self.max_delay - age)
+        return due, wait
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                due, wait = self._due(time.monotonic())
+                if not due:
+                    self._cond.wait(timeout=max(wait, 0.005))
+                    continue
+                batches = [(table, self._pending.pop(table)) for table in due]
+
+            for table, entries in batches:
+                self._flush_table(table, entries)
+
+    def _flush_table(self, table, entries):
+        for start in range(0, len(entries), self.max_rows):
+            chunk = entries[start:start + self.max_rows]
+            with self._cond:
+                self.counters['flushes'] += 1
+                self.counters['rows'] += len(chunk)
+            self._insert_chunk(table, chunk)
+
+    def _post(self, table, rows):
+        # PostgREST requires every object in an array insert to share the same keys
+        columns = []
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+        payload = [{column: row.get(column) for column in columns} for row in rows]
+
+        with self._cond:
+            self.counters['posts'] += 1
+        return self.client.post(
+            f"rest/v1/{table}",
+            json=payload,
+            headers={'Content-Type': 'application/json', 'Prefer': 'return=representation'}
+        )
+
+    def _fail(self, entries, error):
+        with self._cond:
+            self.counters['failed_rows'] += len(entries)
+        for _, future, _ in entries:
+            if not future.done():
+                future.set_exception(error)
+
+    def _insert_chunk(self, table, entries):
+        rows = [entry[0] for entry in entries]
+        try:
+            response = self._post(table, rows)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Bulk insert into {table} failed ({len(rows)} rows): {e}")
+            return self._fail(entries, e)
+
+        if response.status_code < 400:
+            try:
+                inserted = response.json() if response.text.strip() else []
+            except ValueError:
+                inserted = []
+            for index, (row, future, _) in enumerate(entries):
+                future.set_result(inserted[index] if index < len(inserted) else row)
+            logger.info(f"Bulk inserted {len(rows)} rows into {table}")
+            return
+
+        error = RowInsertError(f"API Error {response.status_code}: {response.text}", response.status_code)
+        if response.status_code >= 500 or response.status_code in (401, 403, 429):
+            # Not caused by the rows themselves; let callers retry the whole batch
+            logger.error(f"❌ Bulk insert into {table} failed ({len(rows)} rows): {error}")
+            return self._fail(entries, error)
+
+        if len(entries) == 1:
+            logger.error(f"❌ Row rejected by {table}: {error}")
+            return self._fail(entries, error)
+
+        # Some row in the batch is bad; bisect so only the offending rows fail
+        with self._cond:
+            self.counters['bisections'] += 1
+        middle = len(entries) // 2
+        self._insert_chunk(table, entries[:middle])
+        self._insert_chunk(table, entries[middle:])
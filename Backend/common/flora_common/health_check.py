@@ -0,0 +1,180 @@
+"""Dependency health refreshed in the background, so probes never wait on it.
+
+A HealthChecker runs one check (e.g. a tiny Supabase query) on a thread per
+worker every HEALTH_CHECK_INTERVAL seconds and caches the outcome. After
+HEALTH_FAILURE_THRESHOLD consecutive failures its breaker opens: the
+dependency is reported as degraded and re-probed only every
+HEALTH_OPEN_INTERVAL seconds until a check succeeds again. Probe endpoints
+read the cached snapshot and never make a network call.
+
+init_app() adds:
+    GET /health/live    200 while the process can serve requests
+    GET /health/ready   200 once the service can take traffic, 503 before;
+                        a degraded dependency only fails readiness when
+                        HEALTH_REQUIRE_DEPENDENCY=true
+"""
+import logging
+import os
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEPENDENCY_UP = metrics.REGISTRY.gauge('dependency_up', '1 if the last background check of a dependency passed',
+                                       ('dependency',), mode='min')
+
+
+class HealthChecker:
+    """Cached status of one dependency, with a breaker that backs off while it is down"""
+
+    def __init__(self, name, check, interval=15.0, timeout=3.0, failure_threshold=3, open_interval=60.0):
+        self.name = name
+        self.check = check                  # check(timeout) -> truthy on success; may raise
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.open_interval = open_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread_pid = None
+        self._reset()
+
+    @classmethod
+    def from_env(cls, name, check):
+        return cls(
+            name, check,
+            interval=float(os.environ.get('HEALTH_CHECK_INTERVAL', 15)),
+            timeout=float(os.environ.get('HEALTH_CHECK_TIMEOUT', 3)),
+            failure_threshold=int(os.environ.get('HEALTH_FAILURE_THRESHOLD', 3)),
+            open_interval=float(os.environ.get('HEALTH_OPEN_INTERVAL', 60))
+        )
+
+    def _reset(self):
+        self.ok = None                      # None until the first check finishes
+        self.circuit = 'closed'
+        self.consecutive_failures = 0
+        self.last_checked = None
+        self.last_success = None
+        self.last_error = None
+        self.last_latency = None
+        self.checks = 0
+        self.failures = 0
+
+    def ensure_running(self):
+        """Start this worker's checker thread; cheap to call on every request.
+
+        Started lazily rather than at import so a gunicorn master that preloads
+        the app does not run a checker of its own; a forked worker starts afresh.
+        """
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            if self._thread_pid is not None:
+                self._reset()
+            self._thread_pid = pid
+        threading.Thread(target=self._run, name=f"health-{self.name}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.run_check()
+            self._wake.wait(self.open_interval if self.circuit == 'open' else self.interval)
+            self._wake.clear()
+
+    def run_check(self):
+        started = time.perf_counter()
+        try:
+            ok, error = bool(self.check(self.timeout)), None
+        except Exception as e:
+            ok, error = False, e
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            was_open = self.circuit == 'open'
+            self.checks += 1
+            self.last_checked = time.time()
+            self.last_latency = elapsed
+            self.ok = ok
+            if ok:
+                self.consecutive_failures = 0
+                self.last_success = self.last_checked
+                self.last_error = None
+                self.circuit = 'closed'
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = str(error) if error is not None else 'check failed'
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.circuit = 'open'
+            circuit = self.circuit
+
+        DEPENDENCY_UP.set(1 if ok else 0, dependency=self.name)
+        if circuit == 'open' and not was_open:
+            logger.warning(f"{self.name} degraded after {self.consecutive_failures} failed checks: {self.last_error}")
+        elif was_open and circuit == 'closed':
+            logger.info(f"{self.name} recovered")
+        return ok
+
+    @property
+    def status(self):
+        """'unknown' before the first check, then 'ok', 'failing' or 'degraded' (breaker open)"""
+        if self.ok is None:
+            return 'unknown'
+        if self.circuit == 'open':
+            return 'degraded'
+        return 'ok' if self.ok else 'failing'
+
+    def snapshot(self):
+        self.ensure_running()
+        with self._lock:
+            now = time.time()
+            return {
+                'status': self.status,
+                'circuit': self.circuit,
+                'consecutive_failures': self.consecutive_failures,
+                'last_checked_seconds_ago': round(now - self.last_checked, 1) if self.last_checked else None,
+                'last_success_seconds_ago': round(now - self.last_success, 1) if self.last_success else None,
+                'last_latency_ms': round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+                'last_error': self.last_error,
+                'checks': self.checks,
+                'failures': self.failures
+            }
+
+
+def init_app(app, checker, is_ready=None, details=None):
+    """Liveness and readiness endpoints for a Flask app, served from ``checker``'s cached state.
+
+    ``is_ready()`` reports whether the service itself can take traffic (e.g.
+    its model is loaded); ``details()`` adds service fields to the response.
+    """
+    from flask import jsonify
+
+    require_dependency = os.environ.get('HEALTH_REQUIRE_DEPENDENCY', 'false').lower() == 'true'
+
+    @app.before_request
+    def _start_health_checker():
+        checker.ensure_running()
+
+    @app.route('/health/live', methods=['GET'])
+    def health_live():
+        return jsonify({"status": "alive"})
+
+    @app.route('/health/ready', methods=['GET'])
+    def health_ready():
+        dependency = checker.snapshot()
+        service_ready = is_ready() if is_ready is not None else True
+        dependency_ok = dependency['status'] != 'degraded'
+        ready = service_ready and (dependency_ok or not require_dependency)
+
+        body = {
+            "status": ("ready" if dependency_ok else "degraded") if ready else "not_ready",
+            checker.name: dependency
+        }
+        if details is not None:
+            body.update(details())
+        return jsonify(body), 200 if ready else 503
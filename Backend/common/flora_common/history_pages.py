@@ -0,0 +1,223 @@
+import base64
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Cursor values end up inside a PostgREST filter, so only these shapes are accepted
+_TIMESTAMP = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}[T ][0-9:.]+(Z|[+-][0-9:]+)?$')
+_ROW_ID = re.compile(r'^[0-9A-Fa-f-]{1,36}$')
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past ``row`` in (created_at DESC, id DESC) order"""
+    raw = json.dumps([row['created_at'], str(row['id'])], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not (isinstance(created_at, str) and _TIMESTAMP.match(created_at)
+            and isinstance(row_id, str) and _ROW_ID.match(row_id)):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+
+def keyset_query(table, user_id, columns, limit, cursor=None):
+    """PostgREST path for one page of a user's rows, newest first.
+
+    Fetches ``limit + 1`` rows so the caller can tell whether another page
+    exists without a count query. The (user_id, created_at DESC, id DESC)
+    index locates the page, so the cost does not grow with how deep the client
+    pages; the selected columns are still read from the table for those rows.
+    """
+    params = [f"select={','.join(columns)}", f"user_id=eq.{user_id}"]
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # Quoted and percent-encoded: timestamps carry ':', '.' and '+'
+        timestamp = quote(f'"{created_at}"', safe='')
+        params.append(f"or=(created_at.lt.{timestamp},and(created_at.eq.{timestamp},id.lt.{row_id}))")
+    params.append("order=created_at.desc,id.desc")
+    params.append(f"limit={limit + 1}")
+    return f"{table}?{'&'.join(params)}"
+
+
+def split_page(rows, limit):
+    """Return (rows, next_cursor) from a ``limit + 1`` row fetch"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
+
+
+class MemoryGenerations:
+    """Per-user history generations in this process only"""
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def bump(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+class SQLiteGenerations:
+    """Per-user history generations in a SQLite file (WAL mode) shared by every worker on the host.
+
+    A failing store is logged and ``get`` returns None, which callers treat as
+    "do not use the cache".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        """One SQLite connection per thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS history_generations '
+                         '(user_id TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, user_id):
+        try:
+            row = self._connection().execute('SELECT generation FROM history_generations WHERE user_id = ?',
+                                             (str(user_id),)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ History generation read failed: {e}")
+            return None
+        return row[0] if row else 0
+
+    def bump(self, user_id):
+        try:
+            self._connection().execute(
+                'INSERT INTO history_generations (user_id, generation) VALUES (?, 1) '
+                'ON CONFLICT(user_id) DO UPDATE SET generation = generation + 1', (str(user_id),))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ History generation bump failed: {e}")
+
+
+class HistoryCache:
+    """Short-lived per-user cache of history pages.
+
+    Keys are (user_id, generation, cursor, limit). ``invalidate`` bumps the
+    user's generation once their new prediction is persisted, so pages cached
+    under the old one are never served again. With SQLiteGenerations every
+    worker on the host sees the bump; with the default MemoryGenerations only
+    this worker does, and others serve stale pages for up to ``ttl``.
+    """
+
+    def __init__(self, max_entries=5000, ttl=30.0, generations=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generations = generations if generations is not None else MemoryGenerations()
+        self._entries = OrderedDict()       # (user_id, generation, cursor, limit) -> (expires_at, page)
+        self._by_user = {}                  # user_id -> set of keys
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def generation(self, user_id):
+        """The user's current generation, read before fetching a page; None means bypass the cache"""
+        return self.generations.get(user_id)
+
+    def get(self, user_id, generation, cursor, limit):
+        key = (user_id, generation, cursor or '', limit)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, page = entry
+            if expires_at <= now:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def set(self, user_id, generation, cursor, limit, page):
+        key = (user_id, generation, cursor or '', limit)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, page)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate(self, user_id):
+        self.generations.bump(user_id)
+        with self._lock:
+            keys = self._by_user.pop(user_id, None)
+            for key in keys or ():
+                self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def invalidate_when_saved(self, user_id, outcome):
+        """Invalidate once a save succeeds; ``outcome`` is a bool or a Future of the insert"""
+        if isinstance(outcome, Future):
+            outcome.add_done_callback(
+                lambda future: not future.cancelled() and future.exception() is None and self.invalidate(user_id)
+            )
+        elif outcome:
+            self.invalidate(user_id)
+        return outcome
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'users': len(self._by_user),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'shared': isinstance(self.generations, SQLiteGenerations),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,422 @@
+"""Prometheus text-format metrics, aggregated across gunicorn workers.
+
+Each process keeps counters, gauges and histograms in memory and writes them
+to ``{METRICS_DIR}/{pid}.json`` every METRICS_FLUSH_INTERVAL seconds, at
+scrape time and at exit. GET /metrics in any worker merges every file, so a
+scrape sees the whole service no matter which worker answers it. At scrape
+time the counters and histograms of exited workers are folded into one
+``exited.json`` and their files deleted, so totals never go backwards while
+the directory does not grow with every restarted worker; gauges are only
+reported for live processes.
+"""
+import atexit
+import contextlib
+import fcntl
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Gauge merge modes across live processes: sum, max, min, or all (one series per pid)
+GAUGE_MODES = ('sum', 'max', 'min', 'all')
+# Totals of exited processes, next to the per-pid files
+EXITED_FILE = 'exited.json'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def describe(self):
+        return {'kind': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames)}
+
+    def samples(self):
+        return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames=(), mode='max'):
+        if mode not in GAUGE_MODES:
+            raise ValueError(f"Unknown gauge mode {mode}")
+        super().__init__(registry, name, documentation, labelnames)
+        self.mode = mode
+
+    def describe(self):
+        return dict(super().describe(), mode=self.mode)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = entry[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.directory = None
+        self.flush_interval = 5.0
+        self._flusher = None
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), mode='max'):
+        return self._get(Gauge, name, documentation, labelnames, mode=mode)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    # Multiprocess state
+
+    def configure(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self.directory is None or self.flush_interval <= 0:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def after_fork(self):
+        """Counts recorded by the parent are reported by the parent; gauges describe inherited state"""
+        # Another parent thread (the flusher, a request) may have held the lock at fork
+        # time and does not exist here to release it, so the child takes a fresh one
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            if metric.kind != 'gauge':
+                metric._values = {}
+        self._start_flusher()
+
+    def state(self):
+        with self.lock:
+            return {name: dict(metric.describe(), samples=json.loads(json.dumps(metric.samples())))
+                    for name, metric in self.metrics.items()}
+
+    def flush(self):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp_path, path)
+
+    def _process_states(self):
+        """[(pid, alive, state)] for every process that has written metrics, including this one"""
+        own_pid = os.getpid()
+        states = [(own_pid, True, self.state())]
+        if self.directory is None:
+            return states
+        self.flush()
+        self.fold_exited()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                if os.path.basename(path) == EXITED_FILE:
+                    pid, alive = None, False
+                else:
+                    pid = int(os.path.basename(path).split('.')[0])
+                    if pid == own_pid:
+                        continue
+                    alive = _alive(pid)
+                with open(path, 'r') as f:
+                    states.append((pid, alive, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return states
+
+    def fold_exited(self):
+        """Add the counters and histograms of exited processes to EXITED_FILE and delete their files"""
+        if self.directory is None:
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            # Scrapes in other workers fold the same files; only one may do so at a time
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                exited = []
+                for path in glob.glob(os.path.join(self.directory, '*.json')):
+                    try:
+                        pid = int(os.path.basename(path).split('.')[0])
+                    except ValueError:
+                        continue
+                    if not _alive(pid):
+                        exited.append(path)
+                if not exited:
+                    return
+                exited_path = os.path.join(self.directory, EXITED_FILE)
+                totals = _read_state(exited_path)
+                for path in exited:
+                    _add_totals(totals, _read_state(path))
+                tmp_path = f"{exited_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(totals, f)
+                os.replace(tmp_path, exited_path)
+                for path in exited:
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def collect(self):
+        """Merged Prometheus text exposition for every process of the service"""
+        merged = {}
+        for pid, alive, state in self._process_states():
+            for name, metric in state.items():
+                target = merged.setdefault(name, dict(metric, samples={}))
+                if metric['kind'] == 'gauge':
+                    if not alive:
+                        continue
+                    for labels, value in metric['samples']:
+                        if metric.get('mode') == 'all':
+                            target['samples'][tuple(labels) + (str(pid),)] = value
+                            continue
+                        key = tuple(labels)
+                        if key not in target['samples']:
+                            target['samples'][key] = value
+                        elif metric.get('mode') == 'sum':
+                            target['samples'][key] += value
+                        elif metric.get('mode') == 'min':
+                            target['samples'][key] = min(target['samples'][key], value)
+                        else:
+                            target['samples'][key] = max(target['samples'][key], value)
+                elif metric['kind'] == 'counter':
+                    for labels, value in metric['samples']:
+                        key = tuple(labels)
+                        target['samples'][key] = target['samples'].get(key, 0.0) + value
+                else:
+                    for labels, (counts, total, count) in metric['samples']:
+                        key = tuple(labels)
+                        entry = target['samples'].setdefault(key, [[0] * len(counts), 0.0, 0])
+                        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                        entry[1] += total
+                        entry[2] += count
+        return render(merged)
+
+
+def render(merged):
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        labelnames = list(metric['labelnames'])
+        if metric['kind'] == 'gauge' and metric.get('mode') == 'all':
+            labelnames.append('pid')
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            labels = dict(zip(labelnames, key))
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric['buckets']) + [math.inf], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _read_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _add_totals(totals, state):
+    """Add the counters and histograms of one process state to ``totals`` (same layout); gauges are dropped"""
+    for name, metric in state.items():
+        if metric['kind'] == 'gauge':
+            continue
+        target = totals.setdefault(name, dict(metric, samples=[]))
+        samples = {tuple(labels): value for labels, value in target['samples']}
+        for labels, value in metric['samples']:
+            key = tuple(labels)
+            if metric['kind'] == 'counter':
+                samples[key] = samples.get(key, 0.0) + value
+                continue
+            counts, total, count = value
+            entry = samples.get(key, [[0] * len(counts), 0.0, 0])
+            samples[key] = [[a + b for a, b in zip(entry[0], counts)], entry[1] + total, entry[2] + count]
+        target['samples'] = [[list(key), value] for key, value in samples.items()]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+REGISTRY = Registry()
+
+# Shared series; services add their own with REGISTRY.counter/gauge/histogram
+STAGE_SECONDS = REGISTRY.histogram('stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+SUPABASE_SECONDS = REGISTRY.histogram('supabase_request_duration_seconds', 'Supabase API call latency',
+                                      ('method', 'api', 'outcome'))
+MODEL_READY = REGISTRY.gauge('model_ready', '1 once the model is loaded in this worker', ('model',), mode='all')
+MODEL_WARM = REGISTRY.gauge('model_warm', '1 once the model has served its first inference', ('model',), mode='all')
+MODEL_LOAD_SECONDS = REGISTRY.gauge('model_load_seconds', 'Time taken to load the model', ('model',), mode='max')
+
+
+def stage(name):
+    """``with stage('decode'):`` records the block's duration under stage_duration_seconds"""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def default_directory(service):
+    return os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), f"{service}-metrics")
+
+
+def clear_directory(service):
+    """Drop files left by an earlier run; call once before any worker starts (gunicorn on_starting)"""
+    for path in glob.glob(os.path.join(default_directory(service), '*.json*')):
+        if not os.path.basename(path).startswith(f"{os.getpid()}."):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def setup(service):
+    """Share this process's metrics through the service's metrics directory"""
+    if REGISTRY.directory is not None:
+        return REGISTRY
+    REGISTRY.configure(default_directory(service), float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)))
+    atexit.register(REGISTRY.flush)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=REGISTRY.after_fork)
+    return REGISTRY
+
+
+def init_app(app, service):
+    """Request counts and latency by endpoint and status, and GET /metrics, for a Flask app"""
+    from flask import Response, g, request
+
+    setup(service)
+    requests_total = REGISTRY.counter('http_requests_total', 'HTTP requests by endpoint and status',
+                                      ('method', 'endpoint', 'status'))
+    request_seconds = REGISTRY.histogram('http_request_duration_seconds', 'HTTP request latency',
+                                         ('method', 'endpoint'))
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        requests_total.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+        if started is not None:
+            request_seconds.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(REGISTRY.collect(), mimetype='text/plain; version=0.0.4')
+
+    return REGISTRY
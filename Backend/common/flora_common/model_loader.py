@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoader:
+    """Load a model once, inline or on a background thread, and track readiness.
+
+    ``load_fn`` imports and initializes the model and returns it; raising or
+    returning None marks the load as failed. Callbacks registered with
+    ``when_ready`` run once the model is available (immediately if it already is).
+
+    Background loading must not be used in a gunicorn master that preloads the
+    app: the loader thread does not survive fork.
+    """
+
+    def __init__(self, load_fn, name='model'):
+        self.load_fn = load_fn
+        self.name = name
+        self.model = None
+        self.state = 'pending'          # pending -> loading -> ready | failed
+        self.error = None
+        self.started_at = None
+        self.seconds = None
+        self._callbacks = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def start(self, background=True):
+        with self._lock:
+            if self.state != 'pending':
+                return self
+            self.state = 'loading'
+            self.started_at = time.time()
+        metrics.MODEL_READY.set(0, model=self.name)
+
+        if background:
+            threading.Thread(target=self._load, name=f"{self.name}-loader", daemon=True).start()
+        else:
+            self._load()
+        return self
+
+    def _load(self):
+        try:
+            model = self.load_fn()
+            if model is None:
+                raise RuntimeError(f"{self.name} failed to initialize")
+        except Exception as e:
+            logger.error(f"❌ Loading {self.name} failed: {str(e)}")
+            with self._lock:
+                self.state = 'failed'
+                self.error = str(e)
+                self.seconds = round(time.time() - self.started_at, 3)
+                self._callbacks = []
+            metrics.MODEL_READY.set(0, model=self.name)
+            self._done.set()
+            return
+
+        with self._lock:
+            self.model = model
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+        # Ready only once every callback has wired the model in
+        with self._lock:
+            self.state = 'ready'
+            self.seconds = round(time.time() - self.started_at, 3)
+        metrics.MODEL_READY.set(1, model=self.name)
+        metrics.MODEL_LOAD_SECONDS.set(self.seconds, model=self.name)
+        logger.info(f"✅ {self.name} ready in {self.seconds:.2f}s")
+        self._done.set()
+
+    def _run_callback(self, callback):
+        try:
+            callback(self.model)
+        except Exception as e:
+            logger.error(f"❌ {self.name} ready callback failed: {str(e)}")
+
+    def when_ready(self, callback):
+        with self._lock:
+            if self.model is None:
+                if self.state != 'failed':
+                    self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; returns True if the model is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        with self._lock:
+            status = {'state': self.state, 'seconds': self.seconds}
+            if self.state == 'loading':
+                status['seconds'] = round(time.time() - self.started_at, 3)
+            if self.error:
+                status['error'] = self.error
+        return status
@@ -0,0 +1,77 @@
+import os
+import resource
+import time
+
+_MEMORY_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+# Start-up phases recorded by the process that ran them: name -> (pid, seconds)
+_phases = {}
+
+
+def process_start_time(pid=None):
+    """Wall-clock time the process started, from /proc; falls back to now"""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/stat", 'r') as f:
+            # Field 22 (starttime) counts clock ticks since boot; comm may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat', 'r') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+def record_phase(name, started_at):
+    """Remember how long a start-up phase took (e.g. model load)"""
+    _phases[name] = (os.getpid(), round(time.time() - started_at, 3))
+
+
+def memory_usage(pid=None):
+    """RSS/PSS breakdown in MB. PSS splits shared pages between the processes mapping them."""
+    pid = pid or os.getpid()
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in _MEMORY_FIELDS:
+                    usage[key.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        if pid == os.getpid():
+            # ru_maxrss is the peak in KB on Linux
+            usage['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return usage
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", 'r') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def snapshot():
+    """Start-up timings and memory for this process and, under gunicorn, every worker"""
+    pid = os.getpid()
+    started_at = process_start_time()
+    stats = {
+        'pid': pid,
+        'uptime_seconds': round(time.time() - started_at, 1),
+        'phases': {
+            name: {'seconds': seconds, 'pid': phase_pid, 'preloaded': phase_pid != pid}
+            for name, (phase_pid, seconds) in _phases.items()
+        },
+        'memory': memory_usage(pid)
+    }
+
+    # gunicorn.conf.py exports the master pid before forking; report every worker it owns
+    master_pid = int(os.environ.get('GUNICORN_MASTER_PID', 0))
+    if master_pid:
+        workers = {worker: memory_usage(worker) for worker in child_pids(master_pid)}
+        stats['master'] = {'pid': master_pid, 'memory': memory_usage(master_pid)}
+        stats['workers'] = workers
+        stats['workers_total'] = {
+            key: round(sum(usage.get(key, 0) for usage in workers.values()), 1) for key in ('rss_mb', 'pss_mb')
+        }
+    return stats
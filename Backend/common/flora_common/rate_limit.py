@@ -0,0 +1,335 @@
+"""Token-bucket rate limiting with storage shared across workers and hosts.
+
+``limiter.limit("20 per hour")`` gives each caller a bucket of 20 tokens that
+refills at 20/hour; a request spends one token or is answered 429 with
+Retry-After. Each decision reads and writes one small record, so the cost
+does not grow with traffic, and full buckets are dropped from the store.
+
+Callers are identified by ``request.user_id`` when the route is behind
+require_auth (apply ``limit`` below it) and by remote address otherwise.
+
+RATELIMIT_STORAGE_URI selects where buckets live:
+    sqlite:///path/file.db      every worker on the host (default: a file in the temp dir)
+    redis://[:password@]host:port/db  (rediss:// for TLS)
+                                every pod, through redis-py; any server speaking the Redis
+                                protocol with EVALSHA (see Backend/stub_redis.py for local testing)
+    memory://                   this process only
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DECISIONS = metrics.REGISTRY.counter('ratelimit_decisions_total', 'Rate limit checks by endpoint and outcome',
+                                     ('endpoint', 'outcome'))
+
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT = re.compile(r'^\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+
+
+class StoreError(Exception):
+    """The limiter storage could not be reached or answered garbage"""
+
+
+def parse_limit(spec):
+    """'20 per hour' -> (capacity 20, refill rate in tokens per second)"""
+    match = _LIMIT.match(spec.lower())
+    if match is None:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    amount, multiple, unit = match.groups()
+    return int(amount), int(amount) / (int(multiple or 1) * UNITS[unit])
+
+
+def refill(tokens, updated_at, now, capacity, rate, cost):
+    """One token-bucket step: return (allowed, tokens left, seconds until the bucket is full)"""
+    if tokens is None:
+        tokens = float(capacity)
+    else:
+        tokens = min(float(capacity), tokens + max(0.0, now - updated_at) * rate)
+    allowed = tokens >= cost
+    if allowed:
+        tokens -= cost
+    return allowed, tokens, (capacity - tokens) / rate
+
+
+class MemoryStore:
+    """Buckets in this process only"""
+
+    def __init__(self, sweep_every=1000):
+        self._buckets = {}                  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._since_sweep = 0
+
+    def consume(self, key, capacity, rate, cost=1):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (None, now, now))
+            allowed, tokens, refill_seconds = refill(tokens, updated_at, now, capacity, rate, cost)
+            self._buckets[key] = (tokens, now, now + refill_seconds)
+            self._since_sweep += 1
+            if self._since_sweep >= self._sweep_every:
+                self._since_sweep = 0
+                for stale in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                    del self._buckets[stale]
+        return allowed, tokens
+
+    def size(self, prefix):
+        with self._lock:
+            return sum(1 for key in self._buckets if key.startswith(f"{prefix}:"))
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file (WAL mode) shared by every worker on the host"""
+
+    def __init__(self, path, sweep_every=1000):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._since_sweep = 0
+
+    def _sweep_due(self):
+        """True on every ``sweep_every``-th call in this process (the counter is shared by threads)"""
+        with self._lock:
+            self._since_sweep += 1
+            if self._since_sweep < self._sweep_every:
+                return False
+            self._since_sweep = 0
+            return True
+
+    def _connection(self):
+        """One SQLite connection per thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated_at REAL NOT NULL, full_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, capacity, rate, cost=1):
+        try:
+            conn = self._connection()
+            # IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens, updated_at = row if row else (None, now)
+                allowed, tokens, refill_seconds = refill(tokens, updated_at, now, capacity, rate, cost)
+                conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                             (key, tokens, now, now + refill_seconds))
+                if self._sweep_due():
+                    conn.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            raise StoreError(str(e))
+        return allowed, tokens
+
+    def size(self, prefix):
+        try:
+            return self._connection().execute('SELECT COUNT(*) FROM buckets WHERE substr(key, 1, ?) = ?',
+                                              (len(prefix) + 1, f"{prefix}:")).fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+
+# The bucket is updated atomically on the server using the server's clock.
+# Replies are strings because Redis truncates Lua numbers to integers.
+TOKEN_BUCKET_SCRIPT = """-- token_bucket v1
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+if tokens == nil then
+  tokens = capacity
+else
+  tokens = math.min(capacity, tokens + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    """Buckets in Redis (or anything speaking its protocol), shared by every pod.
+
+    Uses a redis-py client, whose connection pool is rebuilt in forked
+    workers. The script is sent once with SCRIPT LOAD and then run by
+    EVALSHA, reloaded if the server answers NOSCRIPT. The database may be
+    shared with other applications, so ``size`` counts this limiter's keys
+    with SCAN, and gives up (None) after ``SIZE_SCAN_CALLS`` batches.
+    """
+
+    SIZE_SCAN_CALLS = 100                   # of 1000 keys each
+
+    def __init__(self, client):
+        from redis import RedisError
+
+        self.client = client
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._error = RedisError
+
+    @classmethod
+    def from_uri(cls, uri, timeout=0.5):
+        import redis
+        from redis.backoff import NoBackoff
+        from redis.retry import Retry
+
+        # A lost connection is retried once, immediately: an outage should fail open fast, not back off.
+        # RESP2 (AUTH + SELECT rather than HELLO 3) works with every server version and stub_redis.
+        return cls(redis.Redis.from_url(uri, socket_timeout=timeout, socket_connect_timeout=timeout,
+                                        retry=Retry(NoBackoff(), 1), protocol=2))
+
+    def consume(self, key, capacity, rate, cost=1):
+        try:
+            reply = self.script(keys=[key], args=[capacity, repr(rate), cost])
+        except self._error as e:
+            raise StoreError(str(e))
+        try:
+            return int(reply[0]) == 1, float(reply[1])
+        except (TypeError, ValueError, IndexError):
+            raise StoreError(f"Unexpected token bucket reply {reply!r}")
+
+    def size(self, prefix):
+        pattern = re.sub(r'([*?\[\]\\])', r'\\\1', prefix) + ':*'
+        cursor, count = 0, 0
+        try:
+            for _ in range(self.SIZE_SCAN_CALLS):
+                cursor, keys = self.client.scan(cursor, match=pattern, count=1000)
+                count += len(keys)
+                if int(cursor) == 0:
+                    return count
+        except self._error:
+            return None
+        return None
+
+
+def store_from_uri(uri):
+    if uri.startswith('memory://'):
+        return MemoryStore()
+    if uri.startswith('sqlite:///'):
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteStore(uri[len('sqlite:///'):])
+    if uri.startswith(('redis://', 'rediss://')):
+        return RedisStore.from_uri(uri, timeout=float(os.environ.get('RATELIMIT_STORAGE_TIMEOUT', 0.5)))
+    raise ValueError(f"Unsupported rate limit storage: {uri}")
+
+
+def client_key():
+    """The authenticated user when require_auth ran first, else the remote address"""
+    from flask import request
+
+    user_id = getattr(request, 'user_id', None)
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+class RateLimiter:
+    """``@limiter.limit("10 per minute")`` decorators backed by a shared token-bucket store.
+
+    When the store fails, requests are let through (``fail_open``) and
+    counted, so a storage outage does not take the API down with it.
+    """
+
+    def __init__(self, store, prefix, enabled=True, fail_open=True, key_func=client_key):
+        self.store = store
+        self.prefix = prefix
+        self.enabled = enabled
+        self.fail_open = fail_open
+        self.key_func = key_func
+        self._lock = threading.Lock()
+        self.counters = {'allowed': 0, 'limited': 0, 'errors': 0}
+
+    @classmethod
+    def from_env(cls, service):
+        default_uri = f"sqlite:///{os.path.join(tempfile.gettempdir(), f'{service}-ratelimit.db')}"
+        return cls(
+            store_from_uri(os.environ.get('RATELIMIT_STORAGE_URI', default_uri)),
+            prefix=os.environ.get('RATELIMIT_KEY_PREFIX', service),
+            enabled=os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true',
+            fail_open=os.environ.get('RATELIMIT_FAIL_OPEN', 'true').lower() == 'true'
+        )
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            self.counters[outcome] += 1
+        DECISIONS.inc(endpoint=endpoint, outcome=outcome)
+
+    def check(self, endpoint, spec, capacity, rate):
+        """Return None to proceed, or the 429/503 response"""
+        from flask import jsonify
+
+        try:
+            allowed, tokens = self.store.consume(f"{self.prefix}:{endpoint}:{self.key_func()}", capacity, rate)
+        except StoreError as e:
+            self._count(endpoint, 'errors')
+            logger.warning(f"Rate limit storage error on {endpoint}: {e}")
+            if self.fail_open:
+                return None
+            response = jsonify({'error': 'Rate limiting unavailable, retry shortly'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+
+        if allowed:
+            self._count(endpoint, 'allowed')
+            return None
+
+        self._count(endpoint, 'limited')
+        retry_after = max(1, math.ceil((1 - tokens) / rate))
+        response = jsonify({'error': f"Rate limit exceeded: {spec}", 'retry_after': retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        response.headers['X-RateLimit-Limit'] = str(capacity)
+        response.headers['X-RateLimit-Remaining'] = '0'
+        return response, 429
+
+    def limit(self, spec):
+        """Decorator limiting a view to ``spec`` (e.g. '20 per hour') per caller"""
+        capacity, rate = parse_limit(spec)
+
+        def decorator(f):
+            endpoint = f.__name__
+
+            @wraps(f)
+            def limited(*args, **kwargs):
+                if self.enabled:
+                    rejected = self.check(endpoint, spec, capacity, rate)
+                    if rejected is not None:
+                        return rejected
+                return f(*args, **kwargs)
+
+            return limited
+
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, enabled=self.enabled, storage=type(self.store).__name__, buckets=self.store.size(self.prefix))
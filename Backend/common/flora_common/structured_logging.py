@@ -0,0 +1,243 @@
+"""Structured, sampled logging written off the request thread.
+
+setup_logging() routes the root logger through a bounded queue; a listener
+thread formats records (one JSON object per line by default) and writes them,
+so request threads never block on log I/O. init_app() gives every request a
+correlation id (X-Request-ID, generated when absent) and decides once per
+request whether its INFO/DEBUG records are kept, from per-path sample rates.
+WARNING and above are always kept.
+
+Environment:
+    LOG_LEVEL                 INFO
+    LOG_FORMAT                json | text
+    LOG_SAMPLE_RATES          "/predict=0.1,/health=0"  (longest path prefix wins)
+    LOG_DEFAULT_SAMPLE_RATE   1.0
+    LOG_MAX_MESSAGE           2000 characters per message
+    LOG_QUEUE_SIZE            10000 records; further records are dropped and counted
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from functools import wraps
+
+REDACTED = '[redacted]'
+SENSITIVE_KEYS = {'password', 'password_hash', 'token', 'access_token', 'refresh_token', 'authorization',
+                  'apikey', 'api_key', 'jwt', 'secret', 'image'}
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_sampled = contextvars.ContextVar('log_sampled', default=True)
+
+_state = {'handler': None, 'listener': None, 'service': None, 'max_message': 2000}
+_lock = threading.Lock()
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+@contextlib.contextmanager
+def log_context(request_id=None, sampled=True):
+    """Tag records logged inside the block, e.g. by a background job, with ``request_id``"""
+    id_token = _request_id.set(request_id)
+    sampled_token = _sampled.set(sampled)
+    try:
+        yield
+    finally:
+        _request_id.reset(id_token)
+        _sampled.reset(sampled_token)
+
+
+def carry_request_id(handler):
+    """Wrap a write-behind handler so it logs under the request id stored in its payload"""
+    @wraps(handler)
+    def wrapper(payload):
+        with log_context(payload.get('request_id')):
+            return handler(payload)
+    return wrapper
+
+
+def truncate(text, max_length=None):
+    max_length = max_length or _state['max_message']
+    text = str(text)
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}...[{len(text) - max_length} more chars]"
+
+
+def redact(value, max_length=200, _depth=0):
+    """Copy of ``value`` safe to log: sensitive keys masked, long strings and lists cut"""
+    if _depth > 4:
+        return '...'
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in SENSITIVE_KEYS else redact(item, max_length, _depth + 1)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, max_length, _depth + 1) for item in value[:10]]
+        if len(value) > 10:
+            items.append(f"...[{len(value) - 10} more items]")
+        return items
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        return truncate(value, max_length)
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Attach the request id and drop unsampled INFO/DEBUG records"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'service': _state['service'],
+            'request_id': getattr(record, 'request_id', None),
+            'message': truncate(record.getMessage()),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def formatMessage(self, record):
+        record.message = truncate(record.message)
+        return super().formatMessage(record)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never block the caller: records that do not fit in the queue are counted and dropped"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener():
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if os.environ.get('LOG_FORMAT', 'json').lower() == 'json'
+                        else TextFormatter())
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    listener.start()
+    _state['handler'].queue = log_queue
+    _state['listener'] = listener
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (gunicorn preload), so each child starts its own
+    if _state['handler'] is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    listener = _state['listener']
+    if listener is not None:
+        listener.stop()
+
+
+def setup_logging(service, level=None):
+    """Route the root logger through the queue handler; safe to call more than once"""
+    with _lock:
+        if _state['handler'] is not None:
+            return logging.getLogger(service)
+
+        _state['service'] = service
+        _state['max_message'] = int(os.environ.get('LOG_MAX_MESSAGE', 2000))
+        handler = DroppingQueueHandler(None)
+        handler.addFilter(ContextFilter())
+        _state['handler'] = handler
+        _start_listener()
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+    return logging.getLogger(service)
+
+
+def parse_sample_rates(spec):
+    """'/predict=0.1,/health=0' -> {'/predict': 0.1, '/health': 0.0}"""
+    rates = {}
+    for item in (spec or '').split(','):
+        path, _, rate = item.strip().partition('=')
+        if path and rate:
+            rates[path] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def init_app(app, sample_rates=None, default_rate=None):
+    """Per-request correlation id and log sampling for a Flask app"""
+    from flask import g, request
+
+    rates = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES')) if sample_rates is None else sample_rates
+    default_rate = float(os.environ.get('LOG_DEFAULT_SAMPLE_RATE', 1.0)) if default_rate is None else default_rate
+    prefixes = sorted(rates, key=len, reverse=True)
+
+    def rate_for(path):
+        for prefix in prefixes:
+            if path.startswith(prefix):
+                return rates[prefix]
+        return default_rate
+
+    @app.before_request
+    def _begin_request_logging():
+        request_id = request.headers.get('X-Request-ID', '')
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        rate = rate_for(request.path)
+        g.log_tokens = (_request_id.set(request_id), _sampled.set(rate >= 1.0 or random.random() < rate))
+
+    @app.after_request
+    def _tag_response(response):
+        request_id = _request_id.get()
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+    @app.teardown_request
+    def _end_request_logging(exc):
+        tokens = g.pop('log_tokens', None)
+        if tokens is not None:
+            _request_id.reset(tokens[0])
+            _sampled.reset(tokens[1])
+
+
+def stats():
+    handler = _state['handler']
+    return {
+        'service': _state['service'],
+        'queued': handler.queue.qsize() if handler is not None else 0,
+        'dropped': handler.dropped if handler is not None else 0
+    }
@@ -0,0 +1,392 @@
+"""Pooled, keep-alive HTTP client for the Supabase REST and Storage APIs.
+
+Calls to each API pass through a CircuitBreaker: once Supabase starts failing
+or timing out, further calls fail immediately with CircuitOpenError instead
+of tying up request threads, and read timeouts follow observed latency
+rather than a fixed 10-30 s. REST and Storage keep separate latency windows,
+and calls with a body get extra time for its size on top, so a stream of
+fast small calls cannot shrink the timeout of a large upload.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_OPEN = metrics.REGISTRY.gauge('supabase_circuit_open', '1 while calls to a Supabase API are short-circuited',
+                                      ('api',), mode='max')
+CIRCUIT_REJECTED = metrics.REGISTRY.counter('supabase_circuit_rejected_total',
+                                            'Supabase calls failed fast by an open circuit', ('api',))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling Supabase while its circuit is open"""
+
+    def __init__(self, api, retry_after):
+        super().__init__(f"Supabase {api} API unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.api = api
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Rolling error-rate breaker with half-open probing and a p99-based timeout.
+
+    Outcomes of the last ``window`` seconds are kept; once at least
+    ``min_calls`` of them exist and ``error_rate`` of them failed (exception or
+    5xx), or the last ``min_calls`` calls all failed, the circuit opens and
+    calls are rejected for ``open_seconds``. It
+    then lets ``half_open_calls`` probes through: a success closes it, a
+    failure opens it again. ``timeout_for`` turns the p99 of recent successful
+    calls into a read timeout, ``timeout_multiplier`` x p99 kept within
+    [``min_timeout``, the caller's timeout].
+    """
+
+    def __init__(self, api, window=30.0, min_calls=5, error_rate=0.5, open_seconds=15.0,
+                 half_open_calls=1, timeout_multiplier=3.0, min_timeout=2.0, latency_samples=200):
+        self.api = api
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+
+        self._lock = threading.Lock()
+        self._outcomes = deque()            # (monotonic time, ok)
+        self._failures = 0
+        self._consecutive_failures = 0
+        self._latencies = deque(maxlen=latency_samples)
+        self._p99 = None
+        self._since_p99 = 0
+        self.state = 'closed'
+        self._opened_at = 0.0
+        self._probes = 0
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            if not self._outcomes.popleft()[1]:
+                self._failures -= 1
+
+    def _open(self, now):
+        self.state = 'open'
+        self._opened_at = now
+        self._probes = 0
+        self.opened += 1
+        CIRCUIT_OPEN.set(1, api=self.api)
+        logger.warning(f"Supabase {self.api} circuit opened "
+                       f"({self._failures}/{len(self._outcomes)} failed in {self.window:.0f}s)")
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError; every admitted call must be passed to ``record``"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'open':
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self.rejected += 1
+                    CIRCUIT_REJECTED.inc(api=self.api)
+                    raise CircuitOpenError(self.api, remaining)
+                self.state = 'half_open'
+                self._probes = 0
+            if self.state == 'half_open':
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    CIRCUIT_REJECTED.inc(api=self.api)
+                    raise CircuitOpenError(self.api, 1.0)
+                self._probes += 1
+
+    def record(self, ok, elapsed):
+        now = time.monotonic()
+        with self._lock:
+            if ok:
+                self._latencies.append(elapsed)
+                self._since_p99 += 1
+            if self.state == 'half_open':
+                self._probes = max(0, self._probes - 1)
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._consecutive_failures = 0
+                    CIRCUIT_OPEN.set(0, api=self.api)
+                    logger.info(f"Supabase {self.api} circuit closed")
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok))
+            if ok:
+                self._consecutive_failures = 0
+            else:
+                self._failures += 1
+                self._consecutive_failures += 1
+            self._prune(now)
+            if self.state == 'closed' and (
+                    self._consecutive_failures >= self.min_calls
+                    or (len(self._outcomes) >= self.min_calls
+                        and self._failures >= self.error_rate * len(self._outcomes))):
+                self._open(now)
+
+    def available(self):
+        """False while calls would be rejected outright"""
+        with self._lock:
+            return self.state != 'open' or time.monotonic() >= self._opened_at + self.open_seconds
+
+    def p99(self):
+        with self._lock:
+            if self._p99 is None or self._since_p99 >= 10:
+                if len(self._latencies) < 20:
+                    return None
+                ordered = sorted(self._latencies)
+                self._p99 = ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)]
+                self._since_p99 = 0
+            return self._p99
+
+    def timeout_for(self, ceiling):
+        """Read timeout for the next call; ``ceiling`` until enough latencies are observed"""
+        p99 = self.p99()
+        if p99 is None or self.timeout_multiplier <= 0:
+            return ceiling
+        return min(ceiling, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def stats(self):
+        p99 = self.p99()
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'window_calls': calls,
+                'window_failures': self._failures,
+                'window_error_rate': round(self._failures / calls, 4) if calls else 0.0,
+                'p99_ms': round(p99 * 1000, 1) if p99 is not None else None,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+
+
+def body_size(kwargs):
+    """Bytes in a raw request body (``data=`` for requests, ``content=`` for httpx); 0 for JSON and streams"""
+    body = kwargs.get('data', kwargs.get('content'))
+    return len(body) if isinstance(body, (bytes, bytearray, memoryview, str)) else 0
+
+
+class _ConnectionStats:
+    """Counters shared by every pool of one client"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+
+    def incr(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def _counting_pool(base, stats):
+    """Connection pool subclass that counts freshly opened TCP(+TLS) connections"""
+
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.incr('new_connections')
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self._stats),
+            'https': _counting_pool(HTTPSConnectionPool, self._stats),
+        }
+
+
+class SupabaseClient:
+    """One pooled ``requests.Session`` per worker process.
+
+    Connections stay open between calls (HTTP keep-alive), so a login's
+    lookup + update pair or a prediction's upload + insert reuse one TLS
+    session instead of handshaking each time. Idempotent requests (GET/HEAD)
+    are retried on connection errors and 502/503/504. ``breaker`` holds the
+    CircuitBreaker settings of the REST and Storage circuits (each with its own
+    latency window); None disables them. A raw body adds ``body_bytes /
+    min_upload_rate`` seconds to the read timeout.
+    """
+
+    def __init__(self, url, key, pool_size=10, timeout=10, retries=2, backoff_factor=0.3, breaker=None,
+                 min_upload_rate=256 * 1024):
+        self.url = url.strip().rstrip('/')
+        self.key = key.strip()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.breaker_settings = breaker
+        self.min_upload_rate = min_upload_rate
+
+        self.stats = _ConnectionStats()
+        self.breakers = self._build_breakers()
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, url, key):
+        return cls(
+            url, key,
+            pool_size=int(os.environ.get('SUPABASE_POOL_SIZE', 10)),
+            timeout=float(os.environ.get('SUPABASE_TIMEOUT', 10)),
+            retries=int(os.environ.get('SUPABASE_RETRIES', 2)),
+            backoff_factor=float(os.environ.get('SUPABASE_RETRY_BACKOFF', 0.3)),
+            min_upload_rate=float(os.environ.get('SUPABASE_MIN_UPLOAD_RATE', 256 * 1024)),
+            breaker=None if os.environ.get('SUPABASE_BREAKER_ENABLED', 'true').lower() != 'true' else {
+                'window': float(os.environ.get('SUPABASE_BREAKER_WINDOW', 30)),
+                'min_calls': int(os.environ.get('SUPABASE_BREAKER_MIN_CALLS', 5)),
+                'error_rate': float(os.environ.get('SUPABASE_BREAKER_ERROR_RATE', 0.5)),
+                'open_seconds': float(os.environ.get('SUPABASE_BREAKER_OPEN_SECONDS', 15)),
+                'timeout_multiplier': float(os.environ.get('SUPABASE_TIMEOUT_MULTIPLIER', 3)),
+                'min_timeout': float(os.environ.get('SUPABASE_MIN_TIMEOUT', 2))
+            }
+        )
+
+    def _build_breakers(self):
+        if self.breaker_settings is None:
+            return {}
+        return {api: CircuitBreaker(api, **self.breaker_settings) for api in ('rest', 'storage')}
+
+    def available(self, api='rest'):
+        """False while the circuit for ``api`` ('rest' or 'storage') is open"""
+        breaker = self.breakers.get(api)
+        return breaker is None or breaker.available()
+
+    @property
+    def session(self):
+        """The pooled session for this process (rebuilt after a fork)"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    if self._session_pid is not None:
+                        # Forked worker: counters, circuits and sockets inherited from the parent are not ours
+                        self.stats = _ConnectionStats()
+                        self.breakers = self._build_breakers()
+                    self._session = self._build_session()
+                    self._session_pid = pid
+        return self._session
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+            raise_on_status=False
+        )
+        adapter = _CountingAdapter(
+            self.stats,
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+            pool_block=False
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'apikey': self.key,
+            'Authorization': f'Bearer {self.key}',
+            'Connection': 'keep-alive'
+        })
+        return session
+
+    def resolve(self, path):
+        """Return (url, api) for a path relative to SUPABASE_URL or an absolute URL"""
+        url = path if path.startswith('http') else f"{self.url}/{path.lstrip('/')}"
+        return url, 'storage' if '/storage/v1/' in url else 'rest'
+
+    def admit(self, api, timeout=None, body_bytes=0):
+        """Pass the ``api`` circuit (raising CircuitOpenError) and return (breaker, read timeout)"""
+        timeout = timeout or self.timeout
+        breaker = self.breakers.get(api)
+        if breaker is not None:
+            breaker.before_call()
+            timeout = breaker.timeout_for(timeout)
+        if body_bytes and self.min_upload_rate > 0:
+            timeout += body_bytes / self.min_upload_rate
+        self.stats.incr('requests')
+        return breaker, timeout
+
+    def finish(self, breaker, method, api, outcome, elapsed):
+        """Record one admitted call's outcome ('2xx'..'5xx' or 'error') and latency"""
+        if outcome == 'error':
+            self.stats.incr('errors')
+        if breaker is not None:
+            breaker.record(outcome in ('2xx', '3xx', '4xx'), elapsed)
+        metrics.SUPABASE_SECONDS.observe(elapsed, method=method, api=api, outcome=outcome)
+        if method == 'POST':
+            metrics.observe_stage('storage_upload' if api == 'storage' else 'db_insert', elapsed)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """Send a request to ``{SUPABASE_URL}/{path}`` over the pooled session"""
+        url, api = self.resolve(path)
+        session = self.session
+        breaker, timeout = self.admit(api, timeout, body_size(kwargs))
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            outcome = f"{response.status_code // 100}xx"
+            return response
+        finally:
+            self.finish(breaker, method, api, outcome, time.perf_counter() - started)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request('PATCH', path, **kwargs)
+
+    def connection_stats(self):
+        """Connection reuse metrics for this worker"""
+        with self.stats.lock:
+            total = self.stats.requests
+            opened = self.stats.new_connections
+            errors = self.stats.errors
+        return {
+            'pid': os.getpid(),
+            'pool_size': self.pool_size,
+            'requests': total,
+            'new_connections': opened,
+            'reused_connections': max(0, total - opened),
+            'reuse_ratio': round(1 - opened / total, 4) if total else 0.0,
+            'errors': errors,
+            'circuits': {api: breaker.stats() for api, breaker in self.breakers.items()}
+        }
@@ -0,0 +1,344 @@
+"""Background write-behind queue for Supabase persistence.
+
+Job statuses (for GET /persistence/<job_id>) are kept in a status store. A
+SQLiteStatusStore file is shared by every worker on the host, so a poll
+answered by another worker than the one that queued the job still finds it;
+MemoryStatusStore only knows this process's jobs.
+"""
+import atexit
+import base64
+import fcntl
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    """Make a payload JSON-safe for the spill file (bytes become base64)"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'__bytes__': base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class MemoryStatusStore:
+    """Job statuses in this process only, most recent ``max_entries`` kept"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, entry):
+        with self._lock:
+            self._entries[entry['job_id']] = dict(entry)
+            self._entries.move_to_end(entry['job_id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, job_id):
+        with self._lock:
+            entry = self._entries.get(job_id)
+            return dict(entry) if entry else None
+
+
+class SQLiteStatusStore:
+    """Job statuses in a SQLite file (WAL mode) shared by every worker on the host.
+
+    Entries older than ``ttl`` seconds are deleted every ``prune_every`` writes.
+    Status tracking is best effort: a failing store is logged, never raised.
+    """
+
+    def __init__(self, path, ttl=86400.0, prune_every=500):
+        self.path = path
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._since_prune = 0
+
+    def _connection(self):
+        """One SQLite connection per thread and process"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS job_statuses '
+                         '(job_id TEXT PRIMARY KEY, entry TEXT NOT NULL, updated_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS job_statuses_updated_at ON job_statuses (updated_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, entry):
+        with self._lock:
+            self._since_prune += 1
+            prune = self._since_prune >= self.prune_every
+            if prune:
+                self._since_prune = 0
+        try:
+            conn = self._connection()
+            conn.execute('INSERT OR REPLACE INTO job_statuses (job_id, entry, updated_at) VALUES (?, ?, ?)',
+                         (entry['job_id'], json.dumps(entry), entry['updated_at']))
+            if prune:
+                conn.execute('DELETE FROM job_statuses WHERE updated_at < ?', (time.time() - self.ttl,))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Job status write failed: {e}")
+
+    def get(self, job_id):
+        try:
+            row = self._connection().execute('SELECT entry FROM job_statuses WHERE job_id = ?',
+                                             (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Job status read failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+
+class WriteBehindQueue:
+    """Run persistence jobs off the request path.
+
+    Jobs are handed to ``handlers[kind](payload)``, which returns truthy on
+    success or a Future that resolves when the write lands. Failures are retried with jittered exponential backoff; jobs that
+    exhaust their attempts, or arrive while the bounded buffer is full, are
+    appended to a spill file and replayed later once writes succeed again.
+    Statuses go to ``status_store`` (a MemoryStatusStore by default).
+    """
+
+    def __init__(self, handlers, name='write-behind', max_size=1000, max_attempts=5,
+                 backoff_base=0.5, backoff_max=30.0, spill_path=None, replay_interval=60.0,
+                 max_replays=10, status_store=None):
+        self.handlers = handlers
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spill_path = spill_path
+        self.replay_interval = replay_interval
+        self.max_replays = max_replays
+        self.status_store = status_store if status_store is not None else MemoryStatusStore()
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._retries = []                      # heap of (due_time, seq, job)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_replay = 0.0
+
+        self.counters = {'submitted': 0, 'succeeded': 0, 'retried': 0, 'spilled': 0,
+                         'replayed': 0, 'failed': 0}
+
+    def start(self):
+        """Start the background writer thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10.0):
+        """Stop the writer, draining what it can and spilling the rest"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        pending = [job for _, _, job in self._retries]
+        self._retries = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in pending:
+            self._spill(job, 'worker shutdown')
+
+    def submit(self, kind, payload, owner=None):
+        """Queue a job and return its id; never blocks the caller"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job = {'id': uuid.uuid4().hex, 'kind': kind, 'payload': payload, 'owner': owner, 'attempts': 0}
+        self._set_status(job, 'queued')
+        self._count('submitted')
+        self.start()
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            logger.warning(f"⚠️ {self.name} buffer full, spilling job {job['id']}")
+            self._spill(job, 'queue full')
+        return job['id']
+
+    def status(self, job_id):
+        """Return the last known status of a job, or None if the status store does not know it"""
+        return self.status_store.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, queue_depth=self._queue.qsize(), retry_depth=len(self._retries))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _set_status(self, job, status, error=None):
+        self.status_store.put({'job_id': job['id'], 'kind': job['kind'], 'owner': job.get('owner'),
+                               'status': status, 'attempts': job['attempts'], 'error': error,
+                               'updated_at': time.time()})
+
+    def _next_job(self):
+        """Return a due retry, else the next queued job, else None after a short wait"""
+        with self._lock:
+            now = time.monotonic()
+            if self._retries and self._retries[0][0] <= now:
+                return heapq.heappop(self._retries)[2]
+            wait = self._retries[0][0] - now if self._retries else 1.0
+        try:
+            return self._queue.get(timeout=max(0.01, min(wait, 1.0)))
+        except queue.Empty:
+            return None
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            job = self._next_job()
+            if job is None:
+                self._maybe_replay()
+                continue
+            self._process(job)
+
+    def _process(self, job):
+        job['attempts'] += 1
+        try:
+            outcome = self.handlers[job['kind']](job['payload'])
+        except Exception as e:
+            return self._complete(job, False, str(e))
+
+        if isinstance(outcome, Future):
+            # Handler deferred the write (e.g. to a bulk insert buffer); finish when it resolves
+            outcome.add_done_callback(lambda future: self._complete_future(job, future))
+        else:
+            self._complete(job, bool(outcome), None if outcome else 'write returned failure')
+
+    def _complete_future(self, job, future):
+        error = future.exception()
+        self._complete(job, error is None, str(error) if error else None)
+
+    def _complete(self, job, ok, error):
+        if ok:
+            self._set_status(job, 'done')
+            self._count('succeeded')
+            self._maybe_replay()
+            return
+
+        if job['attempts'] >= self.max_attempts:
+            logger.error(f"❌ {self.name} job {job['id']} failed after {job['attempts']} attempts: {error}")
+            self._spill(job, error)
+            return
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (job['attempts'] - 1))
+        delay *= random.uniform(0.5, 1.0)
+        self._set_status(job, 'retrying', error)
+        self._count('retried')
+        with self._lock:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), job))
+
+    def _open_spill_locked(self):
+        """Open the spill file for append under an exclusive lock, surviving a concurrent replay rename"""
+        while True:
+            f = open(self.spill_path, 'a')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.spill_path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def _spill(self, job, error):
+        if not self.spill_path:
+            self._set_status(job, 'failed', error)
+            self._count('failed')
+            return
+
+        try:
+            record = {'id': job['id'], 'kind': job['kind'], 'owner': job.get('owner'),
+                      'replays': job.get('replays', 0), 'payload': _encode(job['payload']),
+                      'error': error, 'spilled_at': time.time()}
+            with self._open_spill_locked() as f:
+                f.write(json.dumps(record) + '\n')
+            self._set_status(job, 'spilled', error)
+            self._count('spilled')
+        except Exception as e:
+            logger.error(f"❌ {self.name} could not spill job {job['id']}: {e}")
+            self._set_status(job, 'failed', error)
+            self._count('failed')
+
+    def _maybe_replay(self):
+        """Re-queue spilled jobs, at most once per replay_interval"""
+        if not self.spill_path or self._stopped.is_set():
+            return
+        now = time.monotonic()
+        if now - self._last_replay < self.replay_interval:
+            return
+        self._last_replay = now
+
+        # Claim the whole file by renaming it so only one worker replays each record
+        claimed = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            os.rename(self.spill_path, claimed)
+        except FileNotFoundError:
+            return
+
+        with open(claimed) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)      # wait for writers that opened before the rename
+            records = [json.loads(line) for line in f if line.strip()]
+            os.remove(claimed)
+
+        if records:
+            logger.info(f"{self.name} replaying {len(records)} spilled jobs")
+        for record in records:
+            job = {'id': record['id'], 'kind': record['kind'], 'owner': record.get('owner'),
+                   'replays': record.get('replays', 0) + 1, 'payload': _decode(record['payload']),
+                   'attempts': 0}
+            if job['replays'] > self.max_replays:
+                logger.error(f"❌ {self.name} dropping job {job['id']} after {self.max_replays} replays")
+                self._set_status(job, 'failed', record.get('error'))
+                self._count('failed')
+                continue
+            self._set_status(job, 'queued')
+            self._count('replayed')
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._spill(job, 'queue full')
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+from flask import Flask, request
+
+from flora_common.asgi_bridge import BackgroundLoop, asgi_app
+
+
+def echo_app():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'size': len(request.get_data()), 'head': request.get_data()[:4].decode('ascii')}
+
+    return app
+
+
+def post(application, body):
+    async def send():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/echo', content=body)
+
+    return asyncio.run(send())
+
+
+def test_buffered_body_reaches_the_wsgi_app_whole():
+    body = b'leaf' + b'x' * (1024 * 1024)       # past SPOOL_BYTES and many replay chunks
+    response = post(asgi_app(echo_app(), threads=2), body)
+    assert response.status_code == 200
+    assert response.json() == {'size': len(body), 'head': 'leaf'}
+
+
+def test_body_over_the_limit_is_rejected_before_the_app_runs():
+    response = post(asgi_app(echo_app(), threads=2, max_body=1024), b'x' * 2048)
+    assert response.status_code == 413
+
+
+def test_background_loop_runs_coroutines_for_handler_threads():
+    io_loop = BackgroundLoop('test-io')
+
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+
+    assert io_loop.run(double(21)) == 42
+
+    async def nested():
+        return io_loop.run(double(1))
+
+    with pytest.raises(RuntimeError):
+        io_loop.run(nested())
@@ -0,0 +1,30 @@
+from flora_common.history_pages import HistoryCache, SQLiteGenerations
+
+PAGE = {'history': [], 'count': 0}
+
+
+def test_save_through_one_worker_invalidates_every_workers_pages(tmp_path):
+    path = str(tmp_path / 'history.db')
+    first = HistoryCache(generations=SQLiteGenerations(path))
+    second = HistoryCache(generations=SQLiteGenerations(path))
+
+    generation = second.generation('user-1')
+    second.set('user-1', generation, None, 20, PAGE)
+    assert second.get('user-1', second.generation('user-1'), None, 20) == PAGE
+
+    first.invalidate('user-1')
+    assert second.get('user-1', second.generation('user-1'), None, 20) is None
+    assert second.generation('user-2') == 0
+
+
+def test_page_fetched_before_a_save_is_not_served_after_it(tmp_path):
+    cache = HistoryCache(generations=SQLiteGenerations(str(tmp_path / 'history.db')))
+    generation = cache.generation('user-1')
+    cache.invalidate('user-1')                  # the save lands while the page is being fetched
+    cache.set('user-1', generation, None, 20, PAGE)
+    assert cache.get('user-1', cache.generation('user-1'), None, 20) is None
+
+
+def test_unreadable_store_bypasses_the_cache(tmp_path):
+    cache = HistoryCache(generations=SQLiteGenerations(str(tmp_path / 'missing' / 'history.db')))
+    assert cache.generation('user-1') is None
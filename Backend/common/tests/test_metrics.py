@@ -0,0 +1,52 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+
+from flora_common import metrics
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_child_does_not_wait_for_a_lock_held_at_fork():
+    registry = metrics.Registry()
+    requests = registry.counter('requests_total', 'Requests')
+    requests.inc()
+
+    registry.lock.acquire()             # e.g. the flusher was mid-flush when the worker forked
+    pid = os.fork()
+    if pid == 0:
+        signal.alarm(5)                 # a deadlocked child is killed instead of hanging the test
+        registry.after_fork()
+        requests.inc(2)
+        os._exit(0 if registry.state()['requests_total']['samples'] == [[[], 2.0]] else 1)
+    registry.lock.release()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def test_exited_processes_are_folded_into_one_file(tmp_path):
+    registry = metrics.Registry()
+    registry.configure(str(tmp_path), flush_interval=0)
+    registry.counter('requests_total', 'Requests', ('status',)).inc(status=200)
+    registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)).observe(0.5)
+    registry.gauge('in_flight', 'In flight', mode='sum').set(3)
+
+    for _ in range(2):
+        pid = dead_pid()
+        with open(tmp_path / f"{pid}.json", 'w') as f:
+            json.dump(registry.state(), f)
+
+    text = registry.collect()
+    assert 'requests_total{status="200"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'in_flight 3' in text         # only this (live) process
+    assert sorted(os.listdir(tmp_path)) == sorted(['.lock', metrics.EXITED_FILE, f"{os.getpid()}.json"])
+
+    # Folded totals are kept, not counted twice
+    assert 'requests_total{status="200"} 3' in registry.collect()
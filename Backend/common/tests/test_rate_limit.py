@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+import stub_redis
+from flora_common.rate_limit import RedisStore, SQLiteStore, StoreError, store_from_uri
+
+
+@pytest.fixture
+def redis_server():
+    server = stub_redis.serve(port=0, password='secret')
+    yield server
+    server.shutdown()
+
+
+def test_redis_bucket_is_shared_and_survives_a_script_flush(redis_server):
+    uri = f"redis://:secret@127.0.0.1:{redis_server.server_address[1]}/2"
+    first, second = store_from_uri(uri), store_from_uri(uri)
+    assert isinstance(first, RedisStore)
+
+    assert [first.consume('auth:login:user:1', 3, 1 / 3600)[0] for _ in range(2)] == [True, True]
+    redis_server.store.scripts.clear()             # e.g. a server restart; EVALSHA answers NOSCRIPT
+    assert second.consume('auth:login:user:1', 3, 1 / 3600)[0] is True
+    allowed, tokens = first.consume('auth:login:user:1', 3, 1 / 3600)
+    assert allowed is False
+    assert tokens < 1
+
+
+def test_redis_size_counts_only_this_limiters_buckets(redis_server):
+    store = store_from_uri(f"redis://:secret@127.0.0.1:{redis_server.server_address[1]}/0")
+    for index in range(25):
+        store.consume(f"auth:login:ip:{index}", 3, 1.0)
+    store.consume('crop:recommend:ip:1', 3, 1.0)
+    redis_server.store.db(0)['sessions:abc'] = (None, {'user': '1'})      # another application's key
+
+    assert store.size('auth') == 25
+    assert store.size('crop') == 1
+    assert store.size('disease') == 0
+
+
+def test_tls_redis_uri_is_accepted():
+    store = store_from_uri('rediss://:secret@redis.example.com:6380/0')
+    assert isinstance(store, RedisStore)
+    assert store.client.connection_pool.connection_class.__name__ == 'SSLConnection'
+
+
+def test_redis_errors_become_store_errors(redis_server):
+    port = redis_server.server_address[1]
+    with pytest.raises(StoreError):
+        store_from_uri(f"redis://:wrong@127.0.0.1:{port}/0").consume('user:1', 3, 1.0)
+
+    redis_server.shutdown()
+    redis_server.server_close()
+    started = time.monotonic()
+    with pytest.raises(StoreError):
+        store_from_uri(f"redis://:secret@127.0.0.1:{port}/0").consume('user:1', 3, 1.0)
+    assert time.monotonic() - started < 2
+
+
+def test_sqlite_sweep_counter_is_not_lost_between_threads(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'buckets.db'), sweep_every=10 ** 9)
+    calls = 500
+
+    def worker():
+        for _ in range(calls):
+            store._sweep_due()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store._since_sweep == 8 * calls
@@ -0,0 +1,23 @@
+from flora_common.supabase_client import SupabaseClient
+
+BREAKER = {'timeout_multiplier': 3.0, 'min_timeout': 0.5}
+
+
+def test_fast_rest_calls_do_not_shrink_upload_timeouts():
+    client = SupabaseClient('http://supabase.test', 'key', breaker=BREAKER)
+    for _ in range(50):
+        breaker, _ = client.admit('rest')
+        client.finish(breaker, 'GET', 'rest', '2xx', 0.01)
+
+    assert client.admit('rest', timeout=30)[1] == 0.5
+    assert client.admit('storage', timeout=30)[1] == 30
+
+
+def test_upload_timeout_grows_with_body_size():
+    client = SupabaseClient('http://supabase.test', 'key', breaker=BREAKER, min_upload_rate=1024 * 1024)
+    for _ in range(50):
+        breaker, _ = client.admit('storage')
+        client.finish(breaker, 'POST', 'storage', '2xx', 0.1)
+
+    assert client.admit('storage', timeout=30)[1] == 0.5
+    assert client.admit('storage', timeout=30, body_bytes=20 * 1024 * 1024)[1] == 20.5
@@ -0,0 +1,44 @@
+import multiprocessing
+import time
+
+from flora_common.write_behind import SQLiteStatusStore, WriteBehindQueue
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _status_in_other_process(path, job_id, results):
+    # A different worker: its own queue, connection and memory, the same file
+    other = WriteBehindQueue({'row': lambda payload: True}, status_store=SQLiteStatusStore(path))
+    results.put(other.status(job_id))
+
+
+def test_status_is_visible_to_other_workers(tmp_path):
+    path = str(tmp_path / 'status.db')
+    queue = WriteBehindQueue({'row': lambda payload: True}, status_store=SQLiteStatusStore(path))
+    job_id = queue.submit('row', {'n': 1}, owner='user-1')
+    assert wait_for(lambda: queue.status(job_id)['status'] == 'done')
+
+    results = multiprocessing.get_context('fork').Queue()
+    process = multiprocessing.get_context('fork').Process(target=_status_in_other_process,
+                                                          args=(path, job_id, results))
+    process.start()
+    process.join(10)
+    status = results.get(timeout=5)
+    assert status['status'] == 'done'
+    assert status['owner'] == 'user-1'
+    queue.stop()
+
+
+def test_expired_statuses_are_pruned(tmp_path):
+    store = SQLiteStatusStore(str(tmp_path / 'status.db'), ttl=60, prune_every=2)
+    store.put({'job_id': 'old', 'status': 'done', 'updated_at': time.time() - 120})
+    store.put({'job_id': 'new', 'status': 'queued', 'updated_at': time.time()})
+    assert store.get('old') is None
+    assert store.get('new')['status'] == 'queued'
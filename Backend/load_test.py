@@ -0,0 +1,169 @@
+"""Closed-loop load test comparing deployments of the same API (e.g. sync vs ASGI).
+
+Each of ``--concurrency`` client threads sends requests back to back over its
+own keep-alive connection for ``--duration`` seconds; every target is run at
+every concurrency level and the results are printed side by side.
+
+Usage:
+    # Slow Supabase makes the difference visible
+    python Backend/stub_postgrest.py --port 54321 --latency-ms 1500
+
+    # Same service twice, rate limits off
+    SUPABASE_URL=http://127.0.0.1:54321 RATELIMIT_ENABLED=false GUNICORN_BIND=0.0.0.0:7860 \\
+        gunicorn --config gunicorn.conf.py
+    SUPABASE_URL=http://127.0.0.1:54321 RATELIMIT_ENABLED=false GUNICORN_BIND=0.0.0.0:7861 SERVE_MODE=asgi \\
+        gunicorn --config gunicorn.conf.py
+
+    python Backend/load_test.py --target sync=http://127.0.0.1:7860 --target asgi=http://127.0.0.1:7861 \\
+        --path /predict --image leaf.jpg --token $JWT --concurrency 1,8,32,64 --duration 20
+
+    # Plant Disease batch uploads: a zip of leaf images
+    python Backend/load_test.py --target sync=... --target asgi=... --path /predict/batch --token $JWT \\
+        --image leaves.zip --field archive --concurrency 1,4,16
+
+    # Crop service
+    python Backend/load_test.py --target sync=... --target asgi=... --path /recommend --token $JWT \\
+        --json '{"nitrogen": 90, "phosphorus": 42, "potassium": 43, "temperature": 20.8,
+                 "humidity": 82, "ph": 6.5, "rainfall": 202.9}'
+"""
+import argparse
+import http.client
+import json
+import mimetypes
+import os
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+
+def build_body(args):
+    """Return (body bytes, content type) for the request"""
+    if args.image:
+        boundary = uuid.uuid4().hex
+        with open(args.image, 'rb') as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(args.image)[0] or 'application/octet-stream'
+        filename = os.path.basename(args.image)
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{args.field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        return body, f'multipart/form-data; boundary={boundary}'
+    if args.json:
+        return json.dumps(json.loads(args.json)).encode('utf-8'), 'application/json'
+    return None, None
+
+
+def run_client(base_url, args, body, content_type, deadline, samples, errors, statuses, lock):
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(url.netloc, timeout=args.timeout)
+    headers = {}
+    if content_type:
+        headers['Content-Type'] = content_type
+    if args.token:
+        headers['Authorization'] = f'Bearer {args.token}'
+
+    method = args.method or ('POST' if body is not None else 'GET')
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request(method, url.path.rstrip('/') + args.path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            status = 'error'
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 'error' or status >= 400:
+                errors.append(elapsed)
+            else:
+                samples.append(elapsed)
+    connection.close()
+
+
+def run_level(base_url, concurrency, args, body, content_type):
+    samples, errors, statuses = [], [], {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_client,
+                         args=(base_url, args, body, content_type, deadline, samples, errors, statuses, lock))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    def percentile(p):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+    return {
+        'concurrency': concurrency,
+        'ok': len(samples),
+        'errors': len(errors),
+        'rps': round(len(samples) / wall, 1),
+        'mean_ms': round(statistics.mean(samples) * 1000, 1) if samples else None,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'statuses': {str(status): count for status, count in statuses.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='deployment to test; repeat to compare')
+    parser.add_argument('--path', default='/health/live')
+    parser.add_argument('--method', default=None)
+    parser.add_argument('--image', default=None, help="send this file as multipart field --field")
+    parser.add_argument('--field', default='file', help="e.g. 'archive' to send a zip to /predict/batch")
+    parser.add_argument('--json', default=None, help='send this JSON body')
+    parser.add_argument('--token', default=os.environ.get('LOAD_TEST_TOKEN'))
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', default=None, help='also write the results as JSON')
+    args = parser.parse_args()
+
+    targets = [target.split('=', 1) for target in args.target]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    body, content_type = build_body(args)
+
+    results = {}
+    for name, base_url in targets:
+        results[name] = []
+        for concurrency in levels:
+            result = run_level(base_url, concurrency, args, body, content_type)
+            results[name].append(result)
+            print(f"{name:>8}  c={concurrency:<4} {result['rps']:>8} req/s  "
+                  f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  p99={result['p99_ms']}ms  "
+                  f"errors={result['errors']}  statuses={result['statuses']}", flush=True)
+
+    if len(targets) > 1:
+        baseline = targets[0][0]
+        print(f"\nThroughput relative to {baseline}:")
+        for name, _ in targets[1:]:
+            for base, other in zip(results[baseline], results[name]):
+                ratio = other['rps'] / base['rps'] if base['rps'] else float('inf')
+                print(f"  c={base['concurrency']:<4} {name}: {ratio:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'path': args.path, 'duration_s': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Profile service cold start: import cost per package and time to ready.
+
+Runs the app module in a fresh interpreter with ``python -X importtime`` and
+background model loading, then reports:
+
+  * app_import_s  - interpreter start until the WSGI module is importable
+                    (the point gunicorn can bind and /health answers)
+  * model_ready_s - interpreter start until the model finished loading
+  * the slowest imports by cumulative time and self time grouped by package
+
+Usage:
+    python profile_startup.py Plant-Disease app
+    python profile_startup.py Crop-Recommendation app_crop --top 15 --json startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+PROBE = '''
+import json, sys, time
+started = time.time()
+import {module} as service
+imported = time.time()
+ready = service.model_loader.wait(timeout={timeout})
+print("STARTUP " + json.dumps({{
+    "app_import_s": imported - started,
+    "model_ready_s": time.time() - started,
+    "model": service.model_loader.status(),
+}}), flush=True)
+'''
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|', 2)
+        # Nested imports are indented by two spaces per level after the leading one
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('service_dir', help='service directory, e.g. Plant-Disease')
+    parser.add_argument('module', help='WSGI module, e.g. app')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--json', help='write the report here for tracking over time')
+    args = parser.parse_args()
+
+    env = dict(os.environ, MODEL_LOAD_MODE='background', PYTHONWARNINGS='ignore')
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=args.module, timeout=args.timeout)],
+        cwd=os.path.abspath(args.service_dir), env=env, capture_output=True, text=True, timeout=args.timeout + 60
+    )
+    marker = next((line for line in process.stdout.splitlines() if line.startswith('STARTUP ')), None)
+    if marker is None:
+        sys.stderr.write(process.stderr[-4000:])
+        raise SystemExit(f"{args.module} did not start (exit code {process.returncode})")
+
+    startup = json.loads(marker[len('STARTUP '):])
+    imports = parse_importtime(process.stderr)
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in imports:
+        by_package[name.split('.')[0]] += self_us
+    top_level = sorted((row for row in imports if row[3] == 0), key=lambda row: -row[2])[:args.top]
+    packages = sorted(by_package.items(), key=lambda item: -item[1])[:args.top]
+
+    print(f"{args.service_dir}/{args.module}: importable in {startup['app_import_s']:.2f}s, "
+          f"model {startup['model']['state']} at {startup['model_ready_s']:.2f}s\n")
+    print(f"{'top-level import':<40} {'cumulative ms':>14}")
+    for name, _, cumulative_us, _ in top_level:
+        print(f"{name:<40} {cumulative_us / 1000:>14.1f}")
+    print(f"\n{'package':<40} {'self ms':>14}")
+    for name, self_us in packages:
+        print(f"{name:<40} {self_us / 1000:>14.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                **startup,
+                'top_level_imports_ms': {name: round(cumulative / 1000, 1) for name, _, cumulative, _ in top_level},
+                'package_self_ms': {name: round(self_us / 1000, 1) for name, self_us in packages},
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
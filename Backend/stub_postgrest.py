@@ -0,0 +1,276 @@
+"""Minimal in-memory stand-in for Supabase PostgREST and Storage, for local testing.
+
+Usage:
+    python Backend/stub_postgrest.py --port 54321 [--latency-ms 0] [--fail-rate 0.0]
+
+Then start a service with SUPABASE_URL=http://127.0.0.1:54321 and any SUPABASE_ANON_KEY.
+
+Supported:
+    GET    /rest/v1/                     -> 200 (health)
+    GET    /rest/v1/<table>?col=eq.v&order=col.desc&limit=n&select=a,b
+           ...&or=(col.lt.v,and(col.eq.v,id.lt.v))   (keyset pagination filters)
+    POST   /rest/v1/<table>              -> insert an object or a JSON array of objects
+    PATCH  /rest/v1/<table>?col=eq.v     -> update matching rows
+    POST   /storage/v1/object/<bucket>/<path>
+    GET    /stub/stats                   -> request / TCP connection counters
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a is not None and a > b,
+    'gte': lambda a, b: a is not None and a >= b,
+    'lt': lambda a, b: a is not None and a < b,
+    'lte': lambda a, b: a is not None and a <= b,
+}
+RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'or'}
+
+
+def _coerce(value, sample):
+    """Compare query-string values against stored values of the same type"""
+    if isinstance(sample, bool):
+        return value.lower() == 'true'
+    if isinstance(sample, (int, float)):
+        try:
+            return type(sample)(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _split_top_level(text):
+    """Split on commas outside parentheses and double quotes"""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _logic_filter(operator, text):
+    """Parse a PostgREST or=(...)/and(...) tree into (operator, [column filter | subtree, ...])"""
+    terms = []
+    for term in _split_top_level(text[1:-1]):
+        if term.startswith(('and(', 'or(')):
+            name, _, rest = term.partition('(')
+            terms.append(_logic_filter(name, '(' + rest))
+        else:
+            column, _, expression = term.partition('.')
+            operator_name, _, value = expression.partition('.')
+            terms.append((column, operator_name + '.' + value.strip('"')))
+    return operator, terms
+
+
+class StubState:
+    def __init__(self, latency_ms=0.0, fail_rate=0.0):
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.objects = {}
+        self.latency = latency_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.connections = 0
+
+    def match_logic(self, row, tree):
+        operator, terms = tree
+        results = (self.match_logic(row, term) if isinstance(term[1], list) else self.match(row, [term])
+                   for term in terms)
+        return any(results) if operator == 'or' else all(results)
+
+    def match(self, row, filters):
+        for column, expression in filters:
+            operator, _, value = expression.partition('.')
+            if operator not in OPERATORS:
+                continue
+            stored = row.get(column)
+            if not OPERATORS[operator](stored, _coerce(value, stored)):
+                return False
+        return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'      # keep-alive, so clients can reuse connections
+    state = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None):
+        payload = b'' if body is None else json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _begin(self):
+        """Count the request, apply injected latency/failures; returns False if the request was failed"""
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.fail_rate and random.random() < self.state.fail_rate:
+            self._read_body()
+            self._send(503, {'message': 'injected failure'})
+            return False
+        return True
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        return unquote(parts.path), parse_qsl(parts.query, keep_blank_values=True)
+
+    def _table(self, path):
+        prefix = '/rest/v1/'
+        name = path[len(prefix):].strip('/') if path.startswith(prefix) else ''
+        return name
+
+    def do_GET(self):
+        path, params = self._parse()
+        if path == '/stub/stats':
+            with self.state.lock:
+                return self._send(200, {'requests': self.state.requests, 'connections': self.state.connections,
+                                        'tables': {k: len(v) for k, v in self.state.tables.items()}})
+        if not self._begin():
+            return
+        table = self._table(path)
+        if not table:
+            return self._send(200, {'swagger': '2.0'})
+
+        query = dict(params)
+        filters = [(key, value) for key, value in params if key not in RESERVED_PARAMS]
+        logic = _logic_filter('or', query['or']) if query.get('or') else None
+        with self.state.lock:
+            rows = [dict(row) for row in self.state.tables.get(table, [])
+                    if self.state.match(row, filters) and (logic is None or self.state.match_logic(row, logic))]
+
+        for clause in reversed(query.get('order', '').split(',') if query.get('order') else []):
+            column, _, direction = clause.partition('.')
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith('desc'))
+
+        offset = int(query.get('offset', 0))
+        rows = rows[offset:]
+        if 'limit' in query:
+            rows = rows[:int(query['limit'])]
+
+        select = query.get('select', '*')
+        if select == 'count':
+            return self._send(200, [{'count': len(rows)}])
+        if select != '*':
+            columns = [column.strip() for column in select.split(',')]
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        self._send(200, rows)
+
+    def do_POST(self):
+        path, _ = self._parse()
+        if not self._begin():
+            return
+        body = self._read_body()
+
+        if path.startswith('/storage/v1/object/'):
+            key = path[len('/storage/v1/object/'):]
+            with self.state.lock:
+                self.state.objects[key] = body
+            return self._send(200, {'Key': key})
+
+        table = self._table(path)
+        if not table:
+            return self._send(404, {'message': 'not found'})
+
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            return self._send(400, {'message': 'invalid JSON'})
+        rows = data if isinstance(data, list) else [data]
+        if not all(isinstance(row, dict) for row in rows):
+            return self._send(400, {'message': 'expected an object or array of objects'})
+
+        created = []
+        now = datetime.now(timezone.utc).isoformat()
+        with self.state.lock:
+            for row in rows:
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', now)
+                self.state.tables.setdefault(table, []).append(row)
+                created.append(row)
+
+        if 'return=representation' in (self.headers.get('Prefer') or ''):
+            return self._send(201, created)
+        self._send(201)
+
+    def do_PATCH(self):
+        path, params = self._parse()
+        if not self._begin():
+            return
+        table = self._table(path)
+        try:
+            changes = json.loads(self._read_body() or b'{}')
+        except ValueError:
+            return self._send(400, {'message': 'invalid JSON'})
+
+        filters = [(key, value) for key, value in params if key not in RESERVED_PARAMS]
+        updated = []
+        with self.state.lock:
+            for row in self.state.tables.get(table, []):
+                if self.state.match(row, filters):
+                    row.update(changes)
+                    updated.append(dict(row))
+        self._send(200, updated)
+
+
+def serve(host='127.0.0.1', port=54321, latency_ms=0.0, fail_rate=0.0):
+    """Start the stub in a background thread and return the server (call .shutdown() to stop)"""
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(latency_ms, fail_rate)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency_ms, args.fail_rate)
+    print(f"Stub PostgREST listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Minimal Redis-protocol stand-in for the rate limiter, for local testing.
+
+Usage:
+    python Backend/stub_redis.py --port 6379 [--password secret]
+
+Then start services with RATELIMIT_STORAGE_URI=redis://127.0.0.1:6379/0 (or
+redis://:secret@127.0.0.1:6379/0).
+
+It serves the limiter's redis-py client, which speaks RESP2 (AUTH and SELECT,
+not HELLO 3). There is no Lua interpreter: scripts whose first line is ``-- token_bucket``
+(rate_limit.TOKEN_BUCKET_SCRIPT) are executed natively with the same
+semantics. Supported commands:
+    PING, ECHO, AUTH, SELECT, TIME, DBSIZE, SCAN, FLUSHALL, FLUSHDB, DEL, HGETALL,
+    SCRIPT LOAD|EXISTS|FLUSH, EVAL, EVALSHA
+"""
+import argparse
+import hashlib
+import math
+import re
+import socketserver
+import threading
+import time
+
+
+class Error(Exception):
+    """Sent as an error reply"""
+
+
+class OK:
+    """Sent as +OK"""
+
+
+def glob_pattern(pattern):
+    """Compile a Redis MATCH glob (*, ?, [...] and backslash escapes)"""
+    regex, index = '', 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        elif char == '*':
+            regex += '.*'
+        elif char == '?':
+            regex += '.'
+        elif char == '[' and ']' in pattern[index + 1:]:
+            end = pattern.index(']', index + 1)
+            regex += '[' + pattern[index + 1:end].replace('\\', '\\\\') + ']'
+            index = end
+        else:
+            regex += re.escape(char)
+        index += 1
+    return re.compile(regex + r'\Z', re.DOTALL)
+
+
+class Store:
+    def __init__(self, password=None):
+        self.password = password
+        self.lock = threading.Lock()
+        self.databases = {}                 # db -> {key: (expires_at or None, dict)}
+        self.scripts = {}                   # sha1 -> script
+
+    def db(self, index):
+        return self.databases.setdefault(index, {})
+
+    def get(self, db, key):
+        entry = self.db(db).get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.db(db)[key]
+            return None
+        return value
+
+    def load(self, script):
+        sha = hashlib.sha1(script.encode('utf-8')).hexdigest()
+        self.scripts[sha] = script
+        return sha
+
+    def run_script(self, db, script, keys, argv):
+        if not script.startswith('-- token_bucket'):
+            raise Error("ERR stub_redis only runs the token_bucket script")
+        capacity, rate, cost = float(argv[0]), float(argv[1]), float(argv[2])
+        now = time.time()
+        bucket = self.get(db, keys[0])
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, float(bucket['tokens']) + max(0.0, now - float(bucket['ts'])) * rate)
+        allowed = 0
+        if tokens >= cost:
+            tokens -= cost
+            allowed = 1
+        ttl = (math.ceil((capacity - tokens) / rate * 1000) + 1000) / 1000
+        self.db(db)[keys[0]] = (now + ttl, {'tokens': repr(tokens), 'ts': repr(now)})
+        return [allowed, repr(tokens)]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.db_index = 0
+        self.authenticated = self.server.store.password is None
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.decode('utf-8').split()      # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    def encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, Error):
+            return f"-{value}\r\n".encode('utf-8')
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return f":{value}\r\n".encode('ascii')
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode('ascii') + b''.join(self.encode(item) for item in value)
+        if isinstance(value, OK):
+            return b'+OK\r\n'
+        data = str(value).encode('utf-8')
+        return f"${len(data)}\r\n".encode('ascii') + data + b'\r\n'
+
+    def handle(self):
+        while True:
+            try:
+                args = self.read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            try:
+                reply = self.dispatch(args[0].upper(), args[1:])
+            except Error as e:
+                reply = e
+            except (IndexError, ValueError):
+                reply = Error(f"ERR wrong arguments for '{args[0].lower()}' command")
+            self.wfile.write(self.encode(reply))
+            self.wfile.flush()
+
+    def dispatch(self, command, args):
+        store = self.server.store
+        if command == 'AUTH':
+            if args[-1] != store.password:
+                raise Error("WRONGPASS invalid password")
+            self.authenticated = True
+            return OK()
+        if not self.authenticated:
+            raise Error("NOAUTH Authentication required.")
+        if command == 'PING':
+            return args[0] if args else 'PONG'
+        if command == 'ECHO':
+            return args[0]
+        if command == 'SELECT':
+            self.db_index = int(args[0])
+            return OK()
+        if command == 'TIME':
+            now = time.time()
+            return [str(int(now)), str(int((now % 1) * 1000000))]
+
+        with store.lock:
+            if command == 'DBSIZE':
+                return sum(1 for key in list(store.db(self.db_index)) if store.get(self.db_index, key) is not None)
+            if command == 'SCAN':
+                # Cursor is an offset into the sorted keys; MATCH filters each batch, as Redis does
+                options = {args[i].upper(): args[i + 1] for i in range(1, len(args) - 1, 2)}
+                start, count = int(args[0]), int(options.get('COUNT', 10))
+                keys = sorted(key for key in list(store.db(self.db_index))
+                              if store.get(self.db_index, key) is not None)
+                batch = keys[start:start + count]
+                if 'MATCH' in options:
+                    batch = [key for key in batch if glob_pattern(options['MATCH']).match(key)]
+                following = start + count if start + count < len(keys) else 0
+                return [str(following), batch]
+            if command in ('FLUSHALL', 'FLUSHDB'):
+                if command == 'FLUSHALL':
+                    store.databases.clear()
+                else:
+                    store.db(self.db_index).clear()
+                return OK()
+            if command == 'DEL':
+                return sum(1 for key in args if store.db(self.db_index).pop(key, None) is not None)
+            if command == 'HGETALL':
+                value = store.get(self.db_index, args[0]) or {}
+                return [item for pair in value.items() for item in pair]
+            if command == 'SCRIPT':
+                sub = args[0].upper()
+                if sub == 'LOAD':
+                    return store.load(args[1])
+                if sub == 'EXISTS':
+                    return [int(sha in store.scripts) for sha in args[1:]]
+                if sub == 'FLUSH':
+                    store.scripts.clear()
+                    return OK()
+            if command in ('EVAL', 'EVALSHA'):
+                if command == 'EVAL':
+                    script = args[0]
+                    store.load(script)
+                else:
+                    script = store.scripts.get(args[0].lower())
+                    if script is None:
+                        raise Error("NOSCRIPT No matching script. Please use EVAL.")
+                count = int(args[1])
+                return store.run_script(self.db_index, script, args[2:2 + count], args[2 + count:])
+        raise Error(f"ERR unknown command '{command.lower()}'")
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(host='127.0.0.1', port=6379, password=None):
+    """Start the stub in a background thread and return the server (call .shutdown() to stop)"""
+    server = Server((host, port), Handler)
+    server.store = Store(password)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--password', default=None)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.password)
+    print(f"stub_redis listening on {args.host}:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -46,8 +46,13 @@ CREATE TABLE disease_predictions (
 );
 
 -- Create indexes for performance
-CREATE INDEX idx_disease_user ON disease_predictions(user_id);
-CREATE INDEX idx_crop_user ON crop_recommendations(user_id);
+-- History pages are keyset-paginated on (created_at, id) per user, newest first;
+-- these also serve plain user_id lookups, so no separate user_id index is needed.
+-- The index finds a page's limit+1 rows; their columns are then read from the table (not an
+-- index-only scan). They are not INCLUDEd: the advice text would bloat the index and can
+-- exceed the btree entry size limit
+CREATE INDEX idx_disease_user_created ON disease_predictions(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_crop_user_created ON crop_recommendations(user_id, created_at DESC, id DESC);
 CREATE INDEX idx_users_email ON users(email);
 
 -- Enable Row Level Security